@@ -0,0 +1,279 @@
+import random
+import threading
+import time
+from datetime import date, datetime, timedelta
+from config import (
+    ARCHIVE_MODE, ARCHIVE_TERM_STARTS, ARCHIVE_KEEP_DAYS, ARCHIVE_HOUR, ARCHIVE_SPREADSHEET_ID,
+    ARCHIVE_SHEET_PREFIX, TEMPLATE_SHEET_NAME, DATE_FORMAT
+)
+from google_sheets import all_sessions, load_layouts, session, teacher_sheets
+from metrics import metrics
+from sheet_layout import FIRST_STUDENT_ROW, get_layout
+from write_queue import write_queue
+
+# Ограничение Google на длину названия листа
+MAX_TITLE_LENGTH = 100
+
+
+def term_cutoff(today=None, term_starts=ARCHIVE_TERM_STARTS, keep_days=ARCHIVE_KEEP_DAYS):
+    """
+    Первый день, который остаётся на живом листе: начало текущей четверти.
+
+    Четверть считается текущей, только когда с её начала прошло keep_days дней —
+    до этого на листе остаётся и прошлая, чтобы успели дойти поздние отметки.
+    """
+    limit = (today or date.today()) - timedelta(days=keep_days)
+    starts = []
+    for item in term_starts.split(","):
+        day, month = map(int, item.strip().split("."))
+        starts.extend(date(year, month, day) for year in (limit.year - 1, limit.year))
+    return max(start for start in starts if start <= limit)
+
+
+def _column_runs(cols):
+    """Соседние колонки одним отрезком: [3, 4, 5, 9] → [(3, 5), (9, 9)]"""
+    runs = []
+    for col in sorted(cols):
+        if runs and runs[-1][1] == col - 1:
+            runs[-1] = (runs[-1][0], col)
+        else:
+            runs.append((col, col))
+    return runs
+
+
+def _delete_columns_requests(sheet_id, cols):
+    """Запросы deleteDimension для колонок; справа налево, чтобы номера не сдвигались"""
+    return [
+        {
+            "deleteDimension": {
+                "range": {"sheetId": sheet_id, "dimension": "COLUMNS", "startIndex": first - 1, "endIndex": last}
+            }
+        }
+        for first, last in reversed(_column_runs(cols))
+    ]
+
+
+def _count_marks(sheet, cols):
+    """Сколько заполненных ячеек учеников в колонках cols (одно чтение)"""
+    from gspread.utils import rowcol_to_a1
+
+    last_letters = rowcol_to_a1(1, cols[-1])[:-1]
+    values = sheet.batch_get([f"{rowcol_to_a1(FIRST_STUDENT_ROW, cols[0])}:{last_letters}"])[0]
+    wanted = set(cols)
+    return sum(
+        1 for row in values for offset, value in enumerate(row) if value and cols[0] + offset in wanted
+    )
+
+
+def archive_title(title, first_day, last_day):
+    """Название архивного листа: "Архив 01.09.2025–31.12.2025 Иванов Иван Иванович" """
+    name = f"{ARCHIVE_SHEET_PREFIX}{first_day.strftime(DATE_FORMAT)}–{last_day.strftime(DATE_FORMAT)} {title}"
+    return name[:MAX_TITLE_LENGTH]
+
+
+def archive_sheet(target, sheet, cutoff, dry_run=True, keep_copy=True):
+    """
+    Переносит колонки дат до cutoff с листа sheet в архивный лист.
+
+    Архив — копия листа, где оставлены только прошедшие даты (ученики,
+    контакты и цвета отметок сохраняются). С живого листа эти колонки
+    удаляются, так что строка дат и чтения на горячем пути остаются
+    короткими. Без ARCHIVE_SPREADSHEET_ID копия и обрезка — один атомарный
+    batchUpdate в той же таблице; с ним лист копируется в архивную таблицу,
+    и только после этого обрезается живой. Колонки без отметок (и при
+    keep_copy=False — для шаблона) просто удаляются.
+
+    Отметки, уже поставленные в очередь записи по старым номерам колонок,
+    дописываются до удаления; новые ждут на блокировке разметки листа.
+    Возвращает строку отчёта (dict) или None, если переносить нечего.
+    """
+    layout = get_layout(sheet)
+    with layout.lock:
+        layout.ensure_loaded()
+        days = layout.calendar.days()
+        past = [(day, col) for day, col in days if day < cutoff.toordinal()]
+        if not past:
+            return None
+        past_cols = sorted(col for _, col in past)
+        kept_cols = sorted(col for day, col in days if day >= cutoff.toordinal())
+        first_day = date.fromordinal(past[0][0])
+        last_day = date.fromordinal(past[-1][0])
+        marks = _count_marks(sheet, past_cols) if keep_copy else 0
+        entry = {
+            "spreadsheet": target.spreadsheet_id,
+            "title": sheet.title,
+            "columns": len(past_cols),
+            "first": first_day.strftime(DATE_FORMAT),
+            "last": last_day.strftime(DATE_FORMAT),
+            "marks": marks,
+            "archive": archive_title(sheet.title, first_day, last_day) if marks else "",
+        }
+        if dry_run:
+            return entry
+
+        write_queue.flush()
+        trim = _delete_columns_requests(sheet.id, past_cols)
+        if not marks:
+            sheet.spreadsheet.batch_update({"requests": trim})
+        elif ARCHIVE_SPREADSHEET_ID:
+            archive = session.shard(ARCHIVE_SPREADSHEET_ID)
+            copied = sheet.copy_to(ARCHIVE_SPREADSHEET_ID)
+            archive.spreadsheet().batch_update({"requests": [
+                {"updateSheetProperties": {
+                    "properties": {"sheetId": copied["sheetId"], "title": entry["archive"]}, "fields": "title"
+                }}
+            ] + _delete_columns_requests(copied["sheetId"], kept_cols)})
+            archive.sheet_added()
+            sheet.spreadsheet.batch_update({"requests": trim})
+        else:
+            archive_id = random.randint(1, 2 ** 31 - 1)
+            try:
+                sheet.spreadsheet.batch_update({"requests": [
+                    {"duplicateSheet": {
+                        "sourceSheetId": sheet.id,
+                        "insertSheetIndex": target.sheet_count(),
+                        "newSheetId": archive_id,
+                        "newSheetName": entry["archive"],
+                    }}
+                ] + _delete_columns_requests(archive_id, kept_cols) + trim})
+            except Exception:
+                target.sheet_added(False)
+                raise
+            target.sheet_added()
+        # Колонки сдвинулись: следующая запись перечитает строку дат
+        layout.invalidate()
+        metrics.inc("sheets_archived_columns_total", len(past_cols))
+        return entry
+
+
+def archive_terms(cutoff=None, dry_run=True):
+    """
+    Архивирует прошедшие четверти на всех листах преподавателей и в шаблонах.
+
+    Разметка листов перечитывается пакетно (как при прогреве), чтобы решение
+    принималось по актуальной строке дат. Шаблон обрезается без архивной
+    копии — новые листы сразу создаются с короткой строкой дат. Ошибка на
+    одном листе не останавливает остальные и попадает в отчёт.
+    """
+    cutoff = cutoff or term_cutoff()
+    report = []
+    for target in all_sessions():
+        try:
+            spreadsheet = target.spreadsheet()
+            all_sheets = spreadsheet.worksheets()
+            target.remember_all(all_sheets)
+            sheets = teacher_sheets(all_sheets)
+            load_layouts(spreadsheet, sheets)
+        except Exception as e:
+            print(f"Ошибка архивации таблицы {target.spreadsheet_id}: {e}")
+            report.append({"spreadsheet": target.spreadsheet_id, "title": "", "error": str(e)})
+            continue
+
+        templates = [ws for ws in all_sheets if ws.title == TEMPLATE_SHEET_NAME]
+        for sheet, keep_copy in [(ws, True) for ws in sheets] + [(ws, False) for ws in templates]:
+            try:
+                entry = archive_sheet(target, sheet, cutoff, dry_run=dry_run, keep_copy=keep_copy)
+            except Exception as e:
+                print(f"Ошибка архивации листа {sheet.title}: {e}")
+                entry = {"spreadsheet": target.spreadsheet_id, "title": sheet.title, "error": str(e)}
+            if entry:
+                report.append(entry)
+    return report
+
+
+def format_report(report, dry_run, limit=40):
+    """Текст отчёта для администратора (не длиннее limit строк по листам)"""
+    header = "🗄 Архивация (пробный запуск, ничего не изменено)" if dry_run else "🗄 Архивация выполнена"
+    if not report:
+        return f"{header}: переносить нечего."
+    lines = [f"{header}:"]
+    for entry in report[:limit]:
+        if entry.get("error"):
+            lines.append(f"• {entry['title'] or entry['spreadsheet']}: ошибка — {entry['error']}")
+        elif entry["archive"]:
+            lines.append(
+                f"• {entry['title']}: {entry['columns']} дн. ({entry['first']}–{entry['last']}), "
+                f"отметок {entry['marks']} → «{entry['archive']}»"
+            )
+        else:
+            lines.append(f"• {entry['title']}: {entry['columns']} дн. ({entry['first']}–{entry['last']}) без отметок")
+    if len(report) > limit:
+        lines.append(f"… и ещё {len(report) - limit}")
+    columns = sum(entry.get("columns", 0) for entry in report)
+    marks = sum(entry.get("marks", 0) for entry in report)
+    lines.append(f"\nВсего: листов {len(report)}, колонок {columns}, отметок {marks}")
+    return "\n".join(lines)
+
+
+class ArchiveJob:
+    """
+    Ночная задача архивации в фоновом потоке.
+
+    Раз в сутки в hour часов запускает archive_terms: в режиме dry-run только
+    собирает отчёт, в режиме run переносит колонки. Текст отчёта печатается и
+    передаётся в on_report (бот отправляет его администраторам).
+    """
+
+    def __init__(self, mode=ARCHIVE_MODE, hour=ARCHIVE_HOUR, on_report=None):
+        self.mode = mode
+        self.hour = hour
+        self.on_report = on_report
+        self._stop = threading.Event()
+        self._thread = None
+        self.runs = 0
+        self.archived_sheets = 0
+        self.archived_columns = 0
+        self.last_run_seconds = 0.0
+
+    def start(self):
+        if self.mode == "off" or self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name="sheets-archive", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def seconds_until_next_run(self, now=None):
+        now = now or datetime.now()
+        run_at = now.replace(hour=self.hour, minute=0, second=0, microsecond=0)
+        if run_at <= now:
+            run_at += timedelta(days=1)
+        return (run_at - now).total_seconds()
+
+    def _run(self):
+        while not self._stop.wait(self.seconds_until_next_run()):
+            dry_run = self.mode != "run"
+            try:
+                text = format_report(self.run_once(dry_run=dry_run), dry_run)
+            except Exception as e:
+                text = f"🗄 Архивация не выполнена: {e}"
+            print(text)
+            if self.on_report:
+                self.on_report(text)
+
+    def run_once(self, dry_run=True, cutoff=None):
+        """Один проход архивации; возвращает отчёт archive_terms"""
+        started = time.perf_counter()
+        report = archive_terms(cutoff=cutoff, dry_run=dry_run)
+        self.runs += 1
+        self.last_run_seconds = time.perf_counter() - started
+        if not dry_run:
+            done = [entry for entry in report if not entry.get("error")]
+            self.archived_sheets += len(done)
+            self.archived_columns += sum(entry["columns"] for entry in done)
+        return report
+
+    def stats(self):
+        return {
+            "runs": self.runs,
+            "archived_sheets": self.archived_sheets,
+            "archived_columns": self.archived_columns,
+            "last_run_seconds": round(self.last_run_seconds, 2),
+        }
+
+
+archive_job = ArchiveJob()
+metrics.register_collector("sheets_archive", archive_job.stats)
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""
+Микробенчмарк разбора сообщений о занятиях (lesson_parser.py).
+
+Разбор не обращается ни к журналу, ни к таблице, поэтому меряется отдельно:
+время на строку для одиночных и групповых сообщений и сколько памяти
+занимает результат разбора одного сообщения (tracemalloc).
+
+Запуск:
+    python bench_parser.py --messages 20000 --lines 5
+"""
+
+import argparse
+import random
+import time
+import tracemalloc
+
+from lesson_parser import parse_message
+
+LAST_NAMES = ["Иванов", "Петров", "Сидоров", "Смирнов", "Кузнецов", "Попов", "Васильев", "Соколов"]
+FIRST_NAMES = ["Иван", "Пётр", "Анна", "Мария", "Олег", "Елена", "Дмитрий", "Ольга"]
+SUBJECTS = ["математика", "Физика", "химия", "русский язык", "англ", "Шахматы"]
+NOTES = ["", "", "", "опоздал", "хорошо подготовился / молодец"]
+
+
+def make_line(rng):
+    line = f"{rng.choice(LAST_NAMES)} {rng.choice(FIRST_NAMES)} {rng.randint(1, 12)} {rng.choice(SUBJECTS)}"
+    note = rng.choice(NOTES)
+    return f"{line} / {note}" if note else line
+
+
+def make_messages(count, lines, seed):
+    rng = random.Random(seed)
+    return ["\n".join(make_line(rng) for _ in range(lines)) for _ in range(count)]
+
+
+def bench(name, messages):
+    """Печатает время на сообщение и на строку и память результата на сообщение"""
+    lines = sum(message.count("\n") + 1 for message in messages)
+
+    started = time.perf_counter()
+    parsed = 0
+    for message in messages:
+        records, errors = parse_message(message, "01.09.2025")
+        parsed += len(records)
+    elapsed = time.perf_counter() - started
+
+    sample = messages[:1000]
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    results = [parse_message(message, "01.09.2025") for message in sample]
+    allocated = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    del results
+
+    print(
+        f"{name:<16} messages={len(messages):<6} lines={lines:<7} ok={parsed:<7} "
+        f"per_message={elapsed / len(messages) * 1e6:7.2f}µs per_line={elapsed / lines * 1e6:6.2f}µs "
+        f"throughput={lines / elapsed:10.0f} lines/s memory={allocated / len(sample):7.0f} B/message"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Микробенчмарк разбора сообщений о занятиях")
+    parser.add_argument("--messages", type=int, default=20000)
+    parser.add_argument("--lines", type=int, default=5, help="строк в групповом сообщении")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    bench("single", make_messages(args.messages, 1, args.seed))
+    bench(f"group x{args.lines}", make_messages(args.messages // args.lines or 1, args.lines, args.seed))
+
+
+if __name__ == "__main__":
+    main()
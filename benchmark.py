@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк бота на локальной подделке Google Sheets (fake_sheets.py).
+
+Регистрирует синтетических преподавателей и прогоняет через бота сообщения
+о занятиях: напрямую через append_student, через process_lesson_message
+(журнал + фоновый перенос) и через обработчик handle_message. Для каждого
+сценария печатает число обращений к API на операцию, p50/p99 задержки и
+пропускную способность.
+
+Запуск:
+    python benchmark.py --teachers 10 --messages 300 --latency-ms 50
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+from types import SimpleNamespace
+
+# Настройки должны быть выставлены до импорта модулей бота
+os.environ.setdefault("JOURNAL_PATH", os.path.join(tempfile.mkdtemp(), "journal.db"))
+
+from config import AUTHORIZED_CHAT_ID, DATE_FORMAT
+from fake_sheets import FakeClient, make_school_spreadsheet
+from rate_limiter import RateLimiter
+import google_sheets
+import sheet_layout
+from teacher_registry import teacher_registry
+
+LAST_NAMES = ["Иванов", "Петров", "Сидоров", "Смирнов", "Кузнецов", "Попов", "Васильев", "Соколов"]
+FIRST_NAMES = ["Иван", "Пётр", "Анна", "Мария", "Олег", "Елена", "Дмитрий", "Ольга"]
+SUBJECTS = ["математика", "физика", "химия", "русский", "английский"]
+
+
+def percentile(values, q):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(q / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def report(name, latencies, api_calls, elapsed, errors=0):
+    """Печатает строку результатов сценария"""
+    ops = len(latencies)
+    print(
+        f"{name:<22} ops={ops:<5} api/op={api_calls / ops if ops else 0:6.2f} "
+        f"p50={percentile(latencies, 50) * 1000:8.1f}ms p99={percentile(latencies, 99) * 1000:8.1f}ms "
+        f"mean={statistics.mean(latencies) * 1000 if ops else 0:8.1f}ms "
+        f"throughput={ops / elapsed if elapsed else 0:8.1f}/s errors={errors}"
+    )
+
+
+def setup_backend(latency, error_rate, seed):
+    """Подключает бота к свежей подделке таблицы"""
+    limiter = RateLimiter(reads_per_minute=10 ** 6, writes_per_minute=10 ** 6, burst=10 ** 6, base_delay=0.05)
+    client = FakeClient(latency=latency, error_rate=error_rate, seed=seed, limiter=limiter)
+    spreadsheet = make_school_spreadsheet(client, start=date.today() - timedelta(days=60))
+    google_sheets.session.use_client(client, spreadsheet_id=spreadsheet.id)
+    sheet_layout.clear_layouts()
+    teacher_registry.invalidate()
+    return client
+
+
+def make_teachers(count):
+    return [
+        {
+            "ФИО": f"Учитель{i} {random.choice(FIRST_NAMES)} Тестович",
+            "Номер телефона": f"+7999{i:07d}",
+            "Телеграмм id": 100000 + i,
+            "Username": f"teacher{i}",
+            "Предмет": random.choice(SUBJECTS),
+            "Классы": "средние",
+        }
+        for i in range(count)
+    ]
+
+
+def make_lessons(teachers, count, students_per_teacher, days):
+    """Синтетические занятия: (ФИО преподавателя, ученик, класс, предмет, дата, примечание)"""
+    today = date.today()
+    lessons = []
+    for _ in range(count):
+        teacher = random.choice(teachers)
+        student = random.randrange(students_per_teacher)
+        name = f"{LAST_NAMES[student % len(LAST_NAMES)]}{student} {FIRST_NAMES[student % len(FIRST_NAMES)]}"
+        lesson_date = (today - timedelta(days=random.randrange(days))).strftime(DATE_FORMAT)
+        note = "опоздал" if random.random() < 0.2 else ""
+        lessons.append((teacher["ФИО"], name, str(5 + student % 6), teacher["Предмет"], lesson_date, note))
+    return lessons
+
+
+def run_parallel(func, items, workers):
+    """Выполняет func(item) в пуле потоков, возвращает (задержки, число ошибок, время)"""
+    def timed(item):
+        started = time.perf_counter()
+        try:
+            ok = func(item)
+        except Exception:
+            ok = False
+        return time.perf_counter() - started, ok
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        results = list(pool.map(timed, items))
+    elapsed = time.perf_counter() - started
+    return [latency for latency, _ in results], sum(1 for _, ok in results if ok is False), elapsed
+
+
+def bench_register(client, teachers, workers):
+    from registration import register_teacher
+    client.reset_counters()
+    latencies, errors, elapsed = run_parallel(lambda t: register_teacher(dict(t)), teachers, workers)
+    report("register_teacher", latencies, client.total_calls(), elapsed, errors)
+
+
+def bench_append(client, lessons, workers):
+    client.reset_counters()
+    latencies, errors, elapsed = run_parallel(lambda lesson: google_sheets.append_student(*lesson), lessons, workers)
+    report("append_student", latencies, client.total_calls(), elapsed, errors)
+
+
+def bench_messages(client, lessons, workers):
+    import lessons as lessons_module
+    from journal import replayer
+
+    client.reset_counters()
+    messages = [(teacher, f"{student} {cls} {subject}" + (f" / {note}" if note else ""))
+                for teacher, student, cls, subject, _, note in lessons]
+    replayer.start()
+    latencies, errors, elapsed = run_parallel(
+        lambda m: "✅" in lessons_module.process_lesson_message(*m), messages, workers
+    )
+    report("process_lesson_message", latencies, client.total_calls(), elapsed, errors)
+
+    # Сколько занимает перенос журнала в таблицу
+    started = time.perf_counter()
+    while replayer.journal.pending(limit=1):
+        time.sleep(0.01)
+    drain = time.perf_counter() - started
+    print(f"{'journal drain':<22} ops={len(messages):<5} api/op={client.total_calls() / len(messages):6.2f} "
+          f"elapsed={(elapsed + drain) * 1000:8.1f}ms throughput={len(messages) / (elapsed + drain):8.1f}/s")
+
+
+def bench_handlers(client, teachers, lessons):
+    import bot
+
+    class DummyMessage:
+        def __init__(self, text, message_id):
+            self.text = text
+            self.message_id = message_id
+            self.sent_texts = []
+
+        async def reply_text(self, text, reply_markup=None):
+            self.sent_texts.append(text)
+
+    ids = {t["ФИО"]: t["Телеграмм id"] for t in teachers}
+    updates = []
+    for i, (teacher, student, cls, subject, _, note) in enumerate(lessons):
+        text = f"{student} {cls} {subject}" + (f" / {note}" if note else "")
+        updates.append(SimpleNamespace(
+            effective_user=SimpleNamespace(id=ids[teacher], username=""),
+            effective_chat=SimpleNamespace(id=AUTHORIZED_CHAT_ID),
+            message=DummyMessage(text, 10 ** 6 + i),
+        ))
+
+    async def handle(update):
+        started = time.perf_counter()
+        await bot.handle_message(update, SimpleNamespace(user_data={}))
+        return time.perf_counter() - started
+
+    async def main():
+        return await asyncio.gather(*[handle(update) for update in updates])
+
+    client.reset_counters()
+    started = time.perf_counter()
+    latencies = asyncio.run(main())
+    elapsed = time.perf_counter() - started
+    errors = sum(1 for u in updates if not any("✅" in text for text in u.message.sent_texts))
+    report("bot.handle_message", latencies, client.total_calls(), elapsed, errors)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк бота на подделке Google Sheets")
+    parser.add_argument("--teachers", type=int, default=10)
+    parser.add_argument("--messages", type=int, default=200)
+    parser.add_argument("--students", type=int, default=30, help="учеников на преподавателя")
+    parser.add_argument("--days", type=int, default=30, help="за сколько последних дней генерировать занятия")
+    parser.add_argument("--latency-ms", type=float, default=50.0, help="задержка одного обращения к API")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="доля ответов 429")
+    parser.add_argument("--workers", type=int, default=8, help="одновременных отправителей")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    client = setup_backend(args.latency_ms / 1000, args.error_rate, args.seed)
+    teachers = make_teachers(args.teachers)
+
+    print(f"Бенчмарк: {args.teachers} преподавателей, {args.messages} занятий, "
+          f"задержка API {args.latency_ms} мс, ошибки {args.error_rate:.0%}\n")
+    bench_register(client, teachers, args.workers)
+    bench_append(client, make_lessons(teachers, args.messages, args.students, args.days), args.workers)
+    bench_messages(client, make_lessons(teachers, args.messages, args.students, 1), args.workers)
+    bench_handlers(client, teachers, make_lessons(teachers, args.messages, args.students, 1))
+
+    from journal import replayer
+    from sheets_gateway import gateway
+    from write_queue import write_queue
+    replayer.stop()
+    gateway.shutdown()
+    write_queue.close()
+
+
+if __name__ == "__main__":
+    main()
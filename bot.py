@@ -1,3 +1,9 @@
+import time
+
+# Время запуска процесса до импортов — для отчёта о старте
+BOOT_STARTED = time.perf_counter()
+
+import asyncio
 from telegram import Update, ReplyKeyboardMarkup, ReplyKeyboardRemove
 from telegram.ext import (
     ApplicationBuilder, 
@@ -7,9 +13,24 @@ from telegram.ext import (
     ConversationHandler,
     CommandHandler
 )
-from config import BOT_TOKEN, AUTHORIZED_CHAT_ID
-from registration import is_registered, register_teacher, get_teacher_name_by_id
+from config import (
+    BOT_TOKEN, AUTHORIZED_CHAT_ID, ADMIN_TELEGRAM_IDS, METRICS_PORT, METRICS_HOST,
+    WEBHOOK_URL, WEBHOOK_HOST, WEBHOOK_PORT, WEBHOOK_SECRET, CONCURRENT_UPDATES
+)
+from google_sheets import prewarm
+from registration import (
+    is_registered, enqueue_registration, get_teacher_name_by_id, restore_pending_registrations
+)
 from lessons import process_lesson_message
+from sheets_gateway import gateway
+from write_queue import write_queue
+from journal import journal, replayer
+from archive import archive_job, format_report
+from change_watcher import change_watcher
+from metrics import metrics, current_teacher, start_metrics_server
+from dispatcher import KeyedUpdateProcessor, teacher_keys
+
+IMPORTS_DONE = time.perf_counter()
 
 # Состояния для регистрации
 FIO, PHONE, SUBJECT, CLASSES = range(4)
@@ -89,7 +110,8 @@ async def get_classes(update: Update, context: ContextTypes.DEFAULT_TYPE):
     }
     
     try:
-        register_teacher(registration_data)
+        # Строка в таблице и вкладка создаются в фоне, ответ приходит сразу
+        await gateway.run(enqueue_registration, registration_data, chat_id=update.effective_chat.id)
     except Exception as e:
         await update.message.reply_text(
             f"Ошибка при регистрации: {str(e)}\nПопробуйте еще раз или обратитесь к администратору.",
@@ -127,9 +149,10 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     # Проверяем, что сообщение из авторизованного чата
     if chat_id != AUTHORIZED_CHAT_ID:
         return
+    started = time.perf_counter()
 
     # Проверяем регистрацию
-    if not is_registered(user.id):
+    if not await gateway.run(is_registered, user.id):
         # Начинаем регистрацию сразу
         await update.message.reply_text(
             "👋 Добро пожаловать!\n\n"
@@ -139,13 +162,21 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return FIO
 
     # Если зарегистрирован, обрабатываем сообщение как занятие
-    teacher_name = get_teacher_name_by_id(user.id)
+    teacher_name = await gateway.run(get_teacher_name_by_id, user.id)
     if teacher_name:
+        token = current_teacher.set(teacher_name)
         try:
-            response = process_lesson_message(teacher_name, update.message.text)
-            await update.message.reply_text(response)
+            response = await gateway.run(
+                process_lesson_message, teacher_name, update.message.text,
+                chat_id=chat_id, message_key=f"{chat_id}:{update.message.message_id}"
+            )
+            with metrics.stage("telegram_reply"):
+                await update.message.reply_text(response)
         except Exception as e:
             await update.message.reply_text(f"Ошибка при обработке сообщения: {str(e)}")
+        finally:
+            metrics.observe("bot_stage_seconds", time.perf_counter() - started, stage="message", teacher=teacher_name)
+            current_teacher.reset(token)
     else:
         await update.message.reply_text("Ошибка: не удалось найти данные преподавателя.")
 
@@ -159,8 +190,8 @@ async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("Бот работает только в авторизованном чате.")
         return
 
-    if is_registered(user.id):
-        teacher_name = get_teacher_name_by_id(user.id)
+    if await gateway.run(is_registered, user.id):
+        teacher_name = await gateway.run(get_teacher_name_by_id, user.id)
         await update.message.reply_text(
             f"Привет, {teacher_name}!\n\n"
             "Отправляйте сообщения с ФИО учеников для записи занятий.\n"
@@ -171,9 +202,131 @@ async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await start_registration(update, context)
 
 
+async def stats_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Обработчик команды /stats: счётчики запросов к API и задержки этапов"""
+    if update.effective_chat.id != AUTHORIZED_CHAT_ID:
+        return
+    if ADMIN_TELEGRAM_IDS and update.effective_user.id not in ADMIN_TELEGRAM_IDS:
+        await update.message.reply_text("Команда доступна только администраторам.")
+        return
+    await update.message.reply_text(await gateway.run(metrics.summary))
+
+
+async def archive_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Обработчик команды /archive: отчёт об архивации прошедших четвертей, /archive run — выполнить"""
+    if update.effective_chat.id != AUTHORIZED_CHAT_ID:
+        return
+    if ADMIN_TELEGRAM_IDS and update.effective_user.id not in ADMIN_TELEGRAM_IDS:
+        await update.message.reply_text("Команда доступна только администраторам.")
+        return
+    dry_run = not (context.args and context.args[0] == "run")
+    if not dry_run and update.effective_user.id not in ADMIN_TELEGRAM_IDS:
+        # Перенос удаляет колонки со всех листов: только для явно заданных администраторов
+        await update.message.reply_text(
+            "Выполнить архивацию могут только администраторы из ADMIN_TELEGRAM_IDS."
+        )
+        return
+    report = await gateway.run(archive_job.run_once, dry_run=dry_run)
+    await update.message.reply_text(format_report(report, dry_run))
+
+
+def start_archive_job(app, loop):
+    """Запускает ночную архивацию; отчёт уходит администраторам"""
+    def send_report(text):
+        # Вызывается из потока архивации — отправку передаём в цикл событий бота
+        for admin_id in ADMIN_TELEGRAM_IDS:
+            asyncio.run_coroutine_threadsafe(app.bot.send_message(admin_id, text), loop)
+
+    archive_job.on_report = send_report
+    archive_job.start()
+
+
+async def start_replayer(app):
+    """Запускает перенос занятий из журнала в таблицу"""
+    loop = asyncio.get_running_loop()
+
+    def notify_failed(record):
+        # Вызывается из потока переноса — отправку передаём в цикл событий бота
+        if record["chat_id"] is None:
+            return
+        text = (
+            f"❌ Не удалось записать занятие в таблицу: {record['student']} {record['class']} "
+            f"{record['subject']} за {record['date']}. Отправьте сообщение еще раз или обратитесь к администратору."
+        )
+        asyncio.run_coroutine_threadsafe(app.bot.send_message(record["chat_id"], text), loop)
+
+    def notify_registration_failed(record):
+        if record["chat_id"] is None:
+            return
+        text = (
+            f"❌ Не удалось завершить регистрацию {record['teacher']}: таблица недоступна. "
+            "Отправьте любое сообщение, чтобы зарегистрироваться заново, или обратитесь к администратору."
+        )
+        asyncio.run_coroutine_threadsafe(app.bot.send_message(record["chat_id"], text), loop)
+
+    # Журнал открывается здесь, а не при импорте модуля
+    journal.open()
+    replayer.on_failed = notify_failed
+    replayer.on_registration_failed = notify_registration_failed
+    restore_pending_registrations()
+    replayer.start()
+
+
+async def prewarm_sheets():
+    """Авторизуется и загружает таблицу в фоне, пока бот уже принимает сообщения"""
+    started = time.perf_counter()
+    timings = await gateway.run(prewarm)
+    steps = ", ".join(f"{name} {seconds * 1000:.0f} мс" for name, seconds in timings.items())
+    print(f"Прогрев таблицы: {steps}; всего {(time.perf_counter() - started) * 1000:.0f} мс")
+
+
+async def on_startup(app):
+    """Запускает фоновые задачи и печатает, сколько занял старт"""
+    await start_replayer(app)
+    start_archive_job(app, asyncio.get_running_loop())
+    change_watcher.start()
+    app.create_task(prewarm_sheets())
+    ready = time.perf_counter()
+    print(
+        f"Старт: импорт {(IMPORTS_DONE - BOOT_STARTED) * 1000:.0f} мс, "
+        f"инициализация {(ready - IMPORTS_DONE) * 1000:.0f} мс, "
+        f"всего {(ready - BOOT_STARTED) * 1000:.0f} мс"
+    )
+
+
+async def shutdown_gateway(app):
+    """Дожидается записей в таблицу, которые ещё выполняются"""
+    replayer.stop()
+    archive_job.stop()
+    change_watcher.stop()
+    gateway.shutdown()
+    write_queue.close()
+
+
 def main():
     """Основная функция запуска бота"""
-    app = ApplicationBuilder().token(BOT_TOKEN).build()
+    if not BOT_TOKEN or not AUTHORIZED_CHAT_ID:
+        print("Не заданы BOT_TOKEN и AUTHORIZED_CHAT_ID — проверьте .env (python check_env.py)")
+        return
+    if WEBHOOK_URL and not WEBHOOK_SECRET:
+        print("Режим webhook без WEBHOOK_SECRET небезопасен: задайте секрет в .env")
+        return
+
+    builder = (
+        ApplicationBuilder()
+        .token(BOT_TOKEN)
+        .post_init(on_startup)
+        .post_shutdown(shutdown_gateway)
+    )
+    # Разные преподаватели обрабатываются параллельно; обновления одного пользователя
+    # и одного листа — строго по порядку
+    processor = KeyedUpdateProcessor(CONCURRENT_UPDATES, key_func=teacher_keys)
+    metrics.register_collector("bot_updates", processor.stats)
+    builder = builder.concurrent_updates(processor)
+    if WEBHOOK_URL:
+        # Обновления приходят в ASGI-приложение, опрос Telegram не нужен
+        builder = builder.updater(None)
+    app = builder.build()
     
     # Создаем ConversationHandler для регистрации
     conv_handler = ConversationHandler(
@@ -191,7 +344,21 @@ def main():
     )
     
     app.add_handler(conv_handler)
-    
+    app.add_handler(CommandHandler("stats", stats_command))
+    app.add_handler(CommandHandler("archive", archive_command))
+
+    # Метрики — на своём внутреннем порту, в том числе в режиме webhook: его порт публичный
+    if METRICS_PORT:
+        start_metrics_server(METRICS_PORT, METRICS_HOST)
+
+    if WEBHOOK_URL:
+        import uvicorn
+        from webhook import create_app
+
+        print(f"Бот запущен в режиме webhook на {WEBHOOK_HOST}:{WEBHOOK_PORT}...")
+        uvicorn.run(create_app(app), host=WEBHOOK_HOST, port=WEBHOOK_PORT)
+        return
+
     print("Бот запущен...")
     app.run_polling()
 
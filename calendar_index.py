@@ -0,0 +1,129 @@
+import re
+import threading
+from datetime import date, timedelta
+
+# ДД.ММ.ГГГГ, Д.М.ГГ, ДД/ММ/ГГГГ, ДД-ММ и т.п.
+_DMY = re.compile(r"^\s*(\d{1,2})[./-](\d{1,2})(?:[./-](\d{2}|\d{4}))?\s*$")
+# ГГГГ-ММ-ДД
+_ISO = re.compile(r"^\s*(\d{4})-(\d{1,2})-(\d{1,2})\s*$")
+# Порядковый номер дня Google Sheets (без форматирования ячейки)
+_SERIAL = re.compile(r"^\s*(\d{5})\s*$")
+_SERIAL_EPOCH = date(1899, 12, 30)
+
+
+def parse_day(value, default_year=None):
+    """
+    Переводит дату из ячейки в порядковый номер дня (date.toordinal) или None.
+
+    Понимает форматы, которые встречаются в строке дат: 01.09.2025, 1.9.25,
+    01/09/2025, 2025-09-01, 01.09 (год берётся из default_year) и число-серийник.
+    """
+    if not value:
+        return None
+    try:
+        match = _DMY.match(value)
+        if match:
+            day, month, year = match.groups()
+            if year is None:
+                if default_year is None:
+                    return None
+                year = default_year
+            else:
+                year = int(year)
+                if year < 100:
+                    year += 2000
+            return date(int(year), int(month), int(day)).toordinal()
+        match = _ISO.match(value)
+        if match:
+            year, month, day = map(int, match.groups())
+            return date(year, month, day).toordinal()
+        match = _SERIAL.match(value)
+        if match:
+            return (_SERIAL_EPOCH + timedelta(days=int(match.group(1)))).toordinal()
+    except ValueError:
+        return None
+    return None
+
+
+class CalendarIndex:
+    """
+    Индекс строки дат: порядковый номер дня → колонка.
+
+    Колонки лежат в массиве по смещению от первой даты, так что поиск — одно
+    обращение по индексу без разбора дат в ячейках. Даты без года (01.09)
+    получают год соседних дат с переходом через Новый год.
+    """
+
+    def __init__(self, date_row):
+        self.raw_columns = {}
+        days = []
+        year = None
+        last_month = None
+        for col_idx, cell_value in enumerate(date_row, start=1):
+            if not cell_value:
+                continue
+            self.raw_columns.setdefault(cell_value, col_idx)
+            ordinal = parse_day(cell_value, default_year=year)
+            if ordinal is None:
+                continue
+            parsed = date.fromordinal(ordinal)
+            match = _DMY.match(cell_value)
+            if match and match.group(3) is None and last_month is not None and parsed.month < last_month:
+                # Дата без года после декабря — это уже следующий год
+                parsed = parsed.replace(year=parsed.year + 1)
+                ordinal = parsed.toordinal()
+            year, last_month = parsed.year, parsed.month
+            days.append((ordinal, col_idx))
+
+        self.first_day = min((d for d, _ in days), default=0)
+        last_day = max((d for d, _ in days), default=-1)
+        self.columns = [0] * (last_day - self.first_day + 1)
+        for ordinal, col_idx in days:
+            if not self.columns[ordinal - self.first_day]:
+                self.columns[ordinal - self.first_day] = col_idx
+        self._default_year = year
+
+    def __len__(self):
+        return sum(1 for col in self.columns if col)
+
+    def days(self):
+        """Пары (порядковый день, колонка) по возрастанию даты"""
+        return [(self.first_day + index, col) for index, col in enumerate(self.columns) if col]
+
+    def column_for_day(self, ordinal):
+        index = ordinal - self.first_day
+        if 0 <= index < len(self.columns):
+            return self.columns[index] or None
+        return None
+
+    def column(self, target_date):
+        """Колонка (1-based) для даты строкой или объектом date, либо None"""
+        if isinstance(target_date, date):
+            return self.column_for_day(target_date.toordinal())
+        col = self.raw_columns.get(target_date)
+        if col:
+            return col
+        ordinal = parse_day(target_date, default_year=self._default_year)
+        return self.column_for_day(ordinal) if ordinal is not None else None
+
+
+_calendars = {}
+_calendars_lock = threading.Lock()
+
+
+def calendar_for(date_row):
+    """
+    Общий CalendarIndex для строки дат.
+
+    Листы, скопированные с одного шаблона, имеют одинаковую строку дат и
+    получают один и тот же объект: строка разбирается один раз на процесс.
+    """
+    key = list(date_row)
+    while key and not key[-1]:
+        key.pop()
+    key = tuple(key)
+    with _calendars_lock:
+        calendar = _calendars.get(key)
+        if calendar is None:
+            calendar = _calendars[key] = CalendarIndex(key)
+        return calendar
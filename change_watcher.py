@@ -0,0 +1,135 @@
+import threading
+from config import CHANGE_WATCH_INTERVAL, ADMIN_SHEET_NAME
+from google_sheets import PRELOAD_CHUNK, all_sessions, session
+from metrics import metrics
+from sheet_layout import DATE_ROW, FIRST_STUDENT_ROW, loaded_layouts
+from teacher_registry import FIRST_DATA_ROW, LAST_DATA_COLUMN, teacher_registry
+
+
+class ChangeWatcher:
+    """
+    Наблюдатель за ручными правками таблиц.
+
+    Раз в interval секунд запрашивает у Drive время последнего изменения
+    каждой таблицы (modifiedTime) — один маленький запрос на таблицу. Если
+    таблица не менялась, больше ничего не делается, и разметки листов с
+    индексом преподавателей могут жить сколько угодно. Если менялась (в том
+    числе записями самого бота — Drive их не различает), читается список
+    листов и одним values.batchGet строки дат и колонки A только тех листов,
+    разметка которых загружена, плюс "Преподаватели". Сбрасываются лишь разметки,
+    разошедшиеся с листом (см. SheetLayout.matches), а индекс преподавателей
+    перестраивается, только если строки на листе другие. Время изменения
+    запоминается только после успешной проверки — при ошибке таблица
+    проверяется снова на следующем опросе.
+    """
+
+    def __init__(self, interval=CHANGE_WATCH_INTERVAL):
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+        self._seen = {}
+        self.polls = 0
+        self.changes = 0
+        self.invalidated_layouts = 0
+        self.registry_reloads = 0
+
+    def start(self):
+        if self.interval <= 0 or self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name="sheets-watcher", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self):
+        while True:
+            self.poll_once()
+            if self._stop.wait(self.interval):
+                return
+
+    def poll_once(self):
+        """
+        Проверяет все таблицы один раз; возвращает число сброшенных разметок.
+
+        Первый опрос таблицы только запоминает её время изменения.
+        """
+        invalidated = 0
+        self.polls += 1
+        for target in all_sessions():
+            key = target.spreadsheet_id
+            try:
+                modified = target.spreadsheet().get_lastUpdateTime()
+                previous = self._seen.get(key)
+                if previous is None:
+                    self._seen[key] = modified
+                    continue
+                if previous == modified:
+                    continue
+                self.changes += 1
+                invalidated += self._check(target)
+                self._seen[key] = modified
+            except Exception as e:
+                print(f"Ошибка проверки изменений таблицы {key}: {e}")
+        return invalidated
+
+    def _check(self, target):
+        from gspread.utils import absolute_range_name
+
+        spreadsheet = target.spreadsheet()
+        sheets = spreadsheet.worksheets()
+        target.sync(sheets)
+        by_id = {ws.id: ws for ws in sheets}
+
+        invalidated = 0
+        layouts = []
+        for layout in loaded_layouts(spreadsheet.id):
+            current = by_id.get(layout.sheet.id)
+            if current is None or current.title != layout.sheet.title:
+                # Лист удалили или переименовали — перечитаем при следующей записи
+                with layout.lock:
+                    if current is not None:
+                        layout.sheet = current
+                    layout.invalidate()
+                invalidated += 1
+            else:
+                layouts.append(layout)
+
+        ranges = []
+        if target is session:
+            ranges.append(absolute_range_name(ADMIN_SHEET_NAME, f"A{FIRST_DATA_ROW}:{LAST_DATA_COLUMN}"))
+        for layout in layouts:
+            ranges.append(absolute_range_name(layout.sheet.title, f"{DATE_ROW}:{DATE_ROW}"))
+            ranges.append(absolute_range_name(layout.sheet.title, f"A{FIRST_STUDENT_ROW}:A"))
+
+        value_ranges = []
+        for start in range(0, len(ranges), 2 * PRELOAD_CHUNK):
+            chunk = ranges[start:start + 2 * PRELOAD_CHUNK]
+            value_ranges.extend(spreadsheet.values_batch_get(chunk).get("valueRanges", []))
+
+        if target is session:
+            if teacher_registry.refresh_if_changed(value_ranges.pop(0).get("values", [])):
+                self.registry_reloads += 1
+        for index, layout in enumerate(layouts):
+            dates = value_ranges[2 * index].get("values", [[]])
+            names = value_ranges[2 * index + 1].get("values", [])
+            if not layout.matches(dates[0] if dates else [], names):
+                layout.invalidate()
+                invalidated += 1
+
+        self.invalidated_layouts += invalidated
+        return invalidated
+
+    def stats(self):
+        return {
+            "polls": self.polls,
+            "changes": self.changes,
+            "invalidated_layouts": self.invalidated_layouts,
+            "registry_reloads": self.registry_reloads,
+        }
+
+
+change_watcher = ChangeWatcher()
+metrics.register_collector("sheets_change_watcher", change_watcher.stats)
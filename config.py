@@ -4,12 +4,71 @@ from dotenv import load_dotenv
 load_dotenv()
 
 BOT_TOKEN = os.getenv("BOT_TOKEN")
-AUTHORIZED_CHAT_ID = int(os.getenv("AUTHORIZED_CHAT_ID"))
+# 0 — не задан: бот не запустится (см. bot.main), но модули можно импортировать без .env
+AUTHORIZED_CHAT_ID = int(os.getenv("AUTHORIZED_CHAT_ID") or "0")
 
 GOOGLE_CREDENTIALS_JSON = os.getenv("GOOGLE_CREDENTIALS_JSON")  # путь к JSON с сервис-аккаунтом
 SPREADSHEET_ID = os.getenv("SPREADSHEET_ID")
+# Таблицы-шарды для листов преподавателей через запятую (в каждой нужен лист "Шаблон").
+# Лист "Преподаватели" всегда в SPREADSHEET_ID; по умолчанию все листы тоже в ней.
+SPREADSHEET_IDS = [x.strip() for x in os.getenv("SPREADSHEET_IDS", "").split(",") if x.strip()] or [SPREADSHEET_ID]
+# Как выбирать шард новому преподавателю: hash (по Telegram ID), subject (по предмету), classes (по классам)
+SHARD_STRATEGY = os.getenv("SHARD_STRATEGY", "hash")
 TEMPLATE_SHEET_NAME = "Шаблон"
 ADMIN_SHEET_NAME = "Преподаватели"
+# Листы с прошедшими четвертями: "Архив 01.09.2025–31.12.2025 Иванов Иван Иванович"
+ARCHIVE_SHEET_PREFIX = "Архив "
+
+# Сколько секунд держать в памяти индекс листа "Преподаватели" до перечитывания
+TEACHER_REGISTRY_TTL = int(os.getenv("TEACHER_REGISTRY_TTL", "300"))
+
+# Сколько запросов к Google Sheets выполняется одновременно (потоки пула)
+SHEETS_MAX_WORKERS = int(os.getenv("SHEETS_MAX_WORKERS", "4"))
+
+# Отложенная запись: пачка отправляется раз в N мс или при накоплении M операций
+WRITE_FLUSH_INTERVAL_MS = int(os.getenv("WRITE_FLUSH_INTERVAL_MS", "300"))
+WRITE_BATCH_MAX_OPS = int(os.getenv("WRITE_BATCH_MAX_OPS", "50"))
+
+# Квоты Google Sheets API (на пользователя в минуту) и повторы при 429/5xx
+SHEETS_READS_PER_MINUTE = int(os.getenv("SHEETS_READS_PER_MINUTE", "60"))
+SHEETS_WRITES_PER_MINUTE = int(os.getenv("SHEETS_WRITES_PER_MINUTE", "60"))
+SHEETS_BURST = int(os.getenv("SHEETS_BURST", "10"))
+SHEETS_MAX_RETRIES = int(os.getenv("SHEETS_MAX_RETRIES", "6"))
+
+# Локальный журнал занятий: записи сначала попадают сюда, потом переносятся в таблицу
+JOURNAL_PATH = os.getenv("JOURNAL_PATH", "lessons_journal.db")
+JOURNAL_MAX_ATTEMPTS = int(os.getenv("JOURNAL_MAX_ATTEMPTS", "50"))
+
+# Метрики: порт и адрес HTTP-сервера с /metrics (0 — не поднимать) и кому доступна команда /stats.
+# В метриках есть ФИО преподавателей, поэтому по умолчанию сервер слушает только localhost
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+ADMIN_TELEGRAM_IDS = {int(x) for x in os.getenv("ADMIN_TELEGRAM_IDS", "").split(",") if x.strip()}
+
+# Режим webhook: если задан WEBHOOK_URL, бот принимает обновления через ASGI-сервер вместо опроса.
+# WEBHOOK_SECRET в этом режиме обязателен
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "")
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/telegram")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "")
+WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8080"))
+
+# Сколько обновлений разных пользователей обрабатывается одновременно
+CONCURRENT_UPDATES = int(os.getenv("CONCURRENT_UPDATES", "16"))
+
+# Как часто (секунды) проверять, не правили ли таблицу вручную; 0 — не проверять
+CHANGE_WATCH_INTERVAL = int(os.getenv("CHANGE_WATCH_INTERVAL", "60"))
+
+# Архивация прошедших четвертей: off — выключена, dry-run — только отчёт, run — переносить
+ARCHIVE_MODE = os.getenv("ARCHIVE_MODE", "dry-run")
+# Начала четвертей/полугодий (ДД.ММ через запятую): архивируется всё до последнего начавшегося
+ARCHIVE_TERM_STARTS = os.getenv("ARCHIVE_TERM_STARTS", "01.09,01.11,01.01,01.04")
+# Сколько дней после начала четверти ещё ждать поздних отметок за прошлую
+ARCHIVE_KEEP_DAYS = int(os.getenv("ARCHIVE_KEEP_DAYS", "14"))
+# В каком часу (по местному времени) запускается задача архивации
+ARCHIVE_HOUR = int(os.getenv("ARCHIVE_HOUR", "3"))
+# Отдельная таблица для архивных листов; пусто — архив рядом с листом преподавателя
+ARCHIVE_SPREADSHEET_ID = os.getenv("ARCHIVE_SPREADSHEET_ID", "")
 
 # Настройки для работы с таблицами
 MAX_ROWS = 1000
@@ -0,0 +1,123 @@
+from collections import deque
+
+from telegram.ext import BaseUpdateProcessor
+
+from teacher_registry import normalize_fio, teacher_registry
+
+
+def user_keys(update):
+    """Ключи очереди: Telegram ID отправителя (пусто — обновление без пользователя)"""
+    user = getattr(update, "effective_user", None)
+    return [("user", user.id)] if user is not None else []
+
+
+def teacher_keys(update):
+    """
+    Ключи очереди: отправитель и, если он уже зарегистрирован, лист преподавателя.
+
+    Лист берётся только из уже загруженного индекса преподавателей, без
+    запросов к таблице — ключи вычисляются в цикле событий бота.
+    """
+    keys = user_keys(update)
+    if keys:
+        info = teacher_registry.peek_by_id(keys[0][1])
+        if info:
+            keys.append(("sheet", normalize_fio(info["ФИО"])))
+    return keys
+
+
+class _Job:
+    __slots__ = ("keys", "coroutine", "waiting", "successors")
+
+    def __init__(self, keys, coroutine):
+        self.keys = keys
+        self.coroutine = coroutine
+        self.waiting = 0
+        self.successors = []
+
+
+class KeyedUpdateProcessor(BaseUpdateProcessor):
+    """
+    Параллельная обработка обновлений с порядком внутри ключа.
+
+    key_func возвращает ключи обновления (пользователь, лист преподавателя).
+    Обновления с общим ключом выполняются строго в порядке поступления:
+    обновление ждёт, пока не завершатся все предыдущие по каждому его ключу.
+    Ожидающее обновление не занимает места в пуле — его выполнит тот
+    обработчик, который завершил последнего предшественника. Поэтому один
+    пользователь с длинной очередью не блокирует остальных, а обновления без
+    общих ключей идут параллельно, не больше max_concurrent_updates.
+    """
+
+    def __init__(self, max_concurrent_updates, key_func=user_keys):
+        super().__init__(max_concurrent_updates)
+        self.key_func = key_func
+        self._tails = {}
+        self.processed = 0
+        self.queued = 0
+
+    async def do_process_update(self, update, coroutine):
+        try:
+            keys = list(dict.fromkeys(self.key_func(update)))
+        except Exception as e:
+            print(f"Ошибка определения очереди обновления: {e}")
+            keys = user_keys(update)
+
+        job = _Job(keys, coroutine)
+        for key in keys:
+            tail = self._tails.get(key)
+            if tail is not None and job not in tail.successors:
+                tail.successors.append(job)
+                job.waiting += 1
+            self._tails[key] = job
+
+        if job.waiting:
+            # Предыдущие обновления по этому ключу ещё выполняются — встаём за ними
+            self.queued += 1
+            return
+
+        ready = deque([job])
+        try:
+            while ready:
+                job = ready.popleft()
+                await self._run(job.coroutine)
+                for key in job.keys:
+                    if self._tails.get(key) is job:
+                        del self._tails[key]
+                for successor in job.successors:
+                    successor.waiting -= 1
+                    if not successor.waiting:
+                        ready.append(successor)
+        finally:
+            # Остановка посреди очереди: закрываем то, что уже не выполнится
+            for left in ready:
+                self._abandon(left)
+
+    def _abandon(self, job):
+        job.coroutine.close()
+        for key in job.keys:
+            if self._tails.get(key) is job:
+                del self._tails[key]
+        for successor in job.successors:
+            self._abandon(successor)
+
+    async def _run(self, coroutine):
+        try:
+            await coroutine
+        except Exception as e:
+            print(f"Ошибка обработки обновления: {e}")
+        finally:
+            self.processed += 1
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    def stats(self):
+        return {
+            "active_keys": len(self._tails),
+            "processed": self.processed,
+            "queued": self.queued,
+        }
@@ -0,0 +1,430 @@
+"""
+Локальная подделка Google Sheets для тестов и бенчмарков.
+
+Повторяет ту часть интерфейса gspread (Client / Spreadsheet / Worksheet),
+которой пользуется бот, и хранит данные в памяти. Каждый вызов считается как
+обращение к API, может ждать заданную задержку и с заданной вероятностью
+отвечать ошибкой квоты 429 — так можно измерять производительность без
+реальной таблицы и учётных данных.
+"""
+
+import copy
+import random
+import threading
+import time
+from collections import Counter
+from datetime import date, timedelta
+from gspread.exceptions import APIError, WorksheetNotFound
+from gspread.utils import a1_range_to_grid_range, rowcol_to_a1
+from config import ADMIN_SHEET_NAME, DATE_FORMAT, TEMPLATE_SHEET_NAME
+from metrics import metrics, current_teacher
+
+WEEKDAYS = ["пн", "вт", "ср", "чт", "пт", "сб", "вс"]
+ADMIN_HEADERS = ["ФИО", "Номер телефона", "Телеграмм id", "Username", "Предмет", "Классы", "Дата регистрации"]
+
+
+class FakeResponse:
+    """Минимальный ответ requests, из которого gspread строит APIError"""
+
+    def __init__(self, code, message):
+        self.status_code = code
+        self.text = message
+        self.headers = {}
+        self._code = code
+        self._message = message
+
+    def json(self):
+        return {"error": {"code": self._code, "message": self._message, "status": "RESOURCE_EXHAUSTED"}}
+
+
+def _cell_value(cell):
+    value = cell.get("userEnteredValue")
+    if not value:
+        return ""
+    for kind in ("stringValue", "numberValue", "boolValue", "formulaValue"):
+        if kind in value:
+            return str(value[kind])
+    return ""
+
+
+class FakeClient:
+    """
+    Подделка gspread.Client.
+
+    latency — задержка каждого вызова в секундах, error_rate — доля вызовов,
+    которые отвечают 429. Если передан limiter (rate_limiter.RateLimiter),
+    вызовы идут через него, как настоящие HTTP-запросы бота.
+    """
+
+    def __init__(self, latency=0.0, error_rate=0.0, seed=None, limiter=None):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.limiter = limiter
+        self.calls = Counter()
+        self.errors = 0
+        self._random = random.Random(seed)
+        self._lock = threading.RLock()
+        self._spreadsheets = {}
+
+    def call(self, kind, name, func):
+        """Выполняет один «запрос к API»: счётчик, задержка, возможная ошибка квоты"""
+        def attempt():
+            metrics.inc("sheets_api_requests_total", endpoint=f"fake/{name}", method=kind.upper(),
+                        teacher=current_teacher.get())
+            with self._lock:
+                self.calls[name] += 1
+                fail = self.error_rate and self._random.random() < self.error_rate
+                if fail:
+                    self.errors += 1
+            if self.latency:
+                time.sleep(self.latency)
+            if fail:
+                raise APIError(FakeResponse(429, "Quota exceeded (fake)"))
+            with self._lock:
+                return func()
+
+        if self.limiter is not None:
+            return self.limiter.call(kind, attempt)
+        return attempt()
+
+    def total_calls(self):
+        with self._lock:
+            return sum(self.calls.values())
+
+    def reset_counters(self):
+        with self._lock:
+            self.calls.clear()
+            self.errors = 0
+
+    def create(self, key):
+        """Создаёт пустую таблицу с указанным ключом"""
+        with self._lock:
+            spreadsheet = FakeSpreadsheet(self, key)
+            self._spreadsheets[key] = spreadsheet
+            return spreadsheet
+
+    def open_by_key(self, key):
+        return self.call("read", "open_by_key", lambda: self._spreadsheets[key])
+
+
+class FakeSpreadsheet:
+    """Подделка gspread.Spreadsheet"""
+
+    def __init__(self, client, key):
+        self.client = client
+        self.id = key
+        self._sheets = []
+        self._next_sheet_id = 1
+        self.last_update = time.time()
+
+    def add_sheet(self, title, rows=None, cols=26, sheet_id=None, index=None):
+        """Добавляет лист без обращения к «API» (для подготовки данных)"""
+        if sheet_id is None:
+            sheet_id = self._next_sheet_id
+        self._next_sheet_id = max(self._next_sheet_id, sheet_id + 1)
+        sheet = FakeWorksheet(self, sheet_id, title, rows or [], cols)
+        if index is None or index >= len(self._sheets):
+            self._sheets.append(sheet)
+        else:
+            self._sheets.insert(index, sheet)
+        return sheet
+
+    def _find(self, title=None, sheet_id=None):
+        for sheet in self._sheets:
+            if (title is not None and sheet.title == title) or (sheet_id is not None and sheet.id == sheet_id):
+                return sheet
+        raise WorksheetNotFound(title if title is not None else sheet_id)
+
+    def _touch(self):
+        self.last_update = time.time()
+
+    def worksheet(self, title):
+        return self.client.call("read", "worksheet", lambda: self._find(title=title))
+
+    def worksheets(self, exclude_hidden=False):
+        return self.client.call("read", "worksheets", lambda: list(self._sheets))
+
+    def duplicate_sheet(self, source_sheet_id, insert_sheet_index=None, new_sheet_id=None, new_sheet_name=None):
+        def run():
+            return self._duplicate(source_sheet_id, insert_sheet_index, new_sheet_id, new_sheet_name)
+        return self.client.call("write", "duplicate_sheet", run)
+
+    def _duplicate(self, source_sheet_id, insert_sheet_index, new_sheet_id, new_sheet_name):
+        source = self._find(sheet_id=source_sheet_id)
+        sheet = self.add_sheet(new_sheet_name or f"Копия {source.title}", copy.deepcopy(source.rows),
+                               source.col_count, sheet_id=new_sheet_id, index=insert_sheet_index)
+        sheet.colors = dict(source.colors)
+        self._touch()
+        return sheet
+
+    def del_worksheet(self, worksheet):
+        def run():
+            self._sheets.remove(self._find(sheet_id=worksheet.id))
+            self._touch()
+        return self.client.call("write", "del_worksheet", run)
+
+    def values_batch_get(self, ranges, params=None):
+        def run():
+            value_ranges = []
+            for name in ranges:
+                title, _, a1 = name.rpartition("!")
+                sheet = self._find(title=title.strip("'").replace("''", "'"))
+                value_range = {"range": name, "majorDimension": "ROWS"}
+                values = sheet._read(a1)
+                if values:
+                    value_range["values"] = values
+                value_ranges.append(value_range)
+            return {"spreadsheetId": self.id, "valueRanges": value_ranges}
+        return self.client.call("read", "values_batch_get", run)
+
+    def values_batch_update(self, body):
+        def run():
+            for item in body.get("data", []):
+                title, _, a1 = item["range"].rpartition("!")
+                self._find(title=title.strip("'").replace("''", "'"))._write(a1, item["values"])
+            self._touch()
+            return {"spreadsheetId": self.id, "totalUpdatedCells": sum(
+                len(row) for item in body.get("data", []) for row in item["values"]
+            )}
+        return self.client.call("write", "values_batch_update", run)
+
+    def batch_update(self, body):
+        def run():
+            replies = [self._apply(request) for request in body.get("requests", [])]
+            self._touch()
+            return {"spreadsheetId": self.id, "replies": replies}
+        return self.client.call("write", "batch_update", run)
+
+    def _apply(self, request):
+        (kind, params), = request.items()
+        if kind == "updateCells":
+            sheet = self._find(sheet_id=params["start"]["sheetId"])
+            row0 = params["start"].get("rowIndex", 0)
+            col0 = params["start"].get("columnIndex", 0)
+            for r, row in enumerate(params.get("rows", [])):
+                for c, cell in enumerate(row.get("values", [])):
+                    sheet._apply_cell(row0 + r, col0 + c, cell, params["fields"])
+            return {}
+        if kind == "appendCells":
+            sheet = self._find(sheet_id=params["sheetId"])
+            filled = [i for i, row in enumerate(sheet.rows) if any(value != "" for value in row)]
+            row0 = filled[-1] + 1 if filled else 0
+            for r, row in enumerate(params.get("rows", [])):
+                for c, cell in enumerate(row.get("values", [])):
+                    sheet._apply_cell(row0 + r, c, cell, params["fields"])
+            return {}
+        if kind == "repeatCell":
+            grid = params["range"]
+            sheet = self._find(sheet_id=grid["sheetId"])
+            for r in range(grid["startRowIndex"], grid["endRowIndex"]):
+                for c in range(grid["startColumnIndex"], grid["endColumnIndex"]):
+                    sheet._apply_cell(r, c, params["cell"], params["fields"])
+            return {}
+        if kind == "duplicateSheet":
+            sheet = self._duplicate(params["sourceSheetId"], params.get("insertSheetIndex"),
+                                    params.get("newSheetId"), params.get("newSheetName"))
+            return {"duplicateSheet": {"properties": {"sheetId": sheet.id, "title": sheet.title}}}
+        if kind == "updateSheetProperties":
+            properties = params["properties"]
+            sheet = self._find(sheet_id=properties["sheetId"])
+            if "title" in params["fields"].split(","):
+                sheet.title = properties["title"]
+            return {}
+        if kind == "deleteDimension":
+            grid = params["range"]
+            self._find(sheet_id=grid["sheetId"])._delete_dimension(
+                grid["dimension"], grid["startIndex"], grid["endIndex"]
+            )
+            return {}
+        raise NotImplementedError(f"Запрос {kind} не поддерживается подделкой")
+
+    def get_lastUpdateTime(self):
+        return self.client.call("read", "get_lastUpdateTime", lambda: self.last_update)
+
+
+class FakeWorksheet:
+    """Подделка gspread.Worksheet: значения хранятся списком строк"""
+
+    def __init__(self, spreadsheet, sheet_id, title, rows, cols):
+        self.spreadsheet = spreadsheet
+        self.spreadsheet_id = spreadsheet.id
+        self.id = sheet_id
+        self.title = title
+        self.rows = [list(row) for row in rows]
+        self.col_count = max([cols] + [len(row) for row in self.rows])
+        self.colors = {}
+
+    @property
+    def client(self):
+        return self.spreadsheet.client
+
+    @property
+    def row_count(self):
+        return max(len(self.rows), 1000)
+
+    # --- внутренние операции без учёта как обращение к API ---
+
+    def _ensure(self, row_idx, col_idx):
+        while len(self.rows) <= row_idx:
+            self.rows.append([])
+        row = self.rows[row_idx]
+        while len(row) <= col_idx:
+            row.append("")
+        self.col_count = max(self.col_count, col_idx + 1)
+        return row
+
+    def _set(self, row_idx, col_idx, value):
+        self._ensure(row_idx, col_idx)[col_idx] = "" if value is None else str(value)
+
+    def _apply_cell(self, row_idx, col_idx, cell, fields):
+        fields = fields.split(",")
+        if "userEnteredValue" in fields:
+            self._set(row_idx, col_idx, _cell_value(cell))
+        if "userEnteredFormat.backgroundColor" in fields or "userEnteredFormat" in fields:
+            color = cell.get("userEnteredFormat", {}).get("backgroundColor")
+            if color is None:
+                self.colors.pop((row_idx + 1, col_idx + 1), None)
+            else:
+                self.colors[(row_idx + 1, col_idx + 1)] = color
+
+    def _grid(self, a1):
+        grid = a1_range_to_grid_range(a1)
+        return (grid.get("startRowIndex", 0), grid.get("endRowIndex", len(self.rows)),
+                grid.get("startColumnIndex", 0), grid.get("endColumnIndex", self.col_count))
+
+    def _read(self, a1):
+        row0, row1, col0, col1 = self._grid(a1)
+        values = []
+        for row in self.rows[row0:row1]:
+            values.append([value for value in row[col0:col1]])
+        # Google не возвращает пустые ячейки в конце строк и пустые строки в конце диапазона
+        for row in values:
+            while row and row[-1] == "":
+                row.pop()
+        while values and not values[-1]:
+            values.pop()
+        return values
+
+    def _write(self, a1, values):
+        row0, _, col0, _ = self._grid(a1)
+        for r, row in enumerate(values):
+            for c, value in enumerate(row):
+                self._set(row0 + r, col0 + c, value)
+
+    def _delete_dimension(self, dimension, start, end):
+        if dimension == "ROWS":
+            del self.rows[start:end]
+            self.colors = {(r - (end - start) if r > end else r, c): color
+                           for (r, c), color in self.colors.items() if not start < r <= end}
+        else:
+            for row in self.rows:
+                del row[start:end]
+            self.col_count -= min(end, self.col_count) - start
+            self.colors = {(r, c - (end - start) if c > end else c): color
+                           for (r, c), color in self.colors.items() if not start < c <= end}
+
+    # --- «API» ---
+
+    def get_all_values(self):
+        def run():
+            width = max([len(row) for row in self.rows] + [0])
+            values = [row + [""] * (width - len(row)) for row in self.rows]
+            while values and not any(values[-1]):
+                values.pop()
+            return values
+        return self.client.call("read", "get_all_values", run)
+
+    def batch_get(self, ranges, **kwargs):
+        return self.client.call("read", "batch_get", lambda: [self._read(a1) for a1 in ranges])
+
+    def get(self, range_name=None, **kwargs):
+        return self.client.call("read", "get", lambda: self._read(range_name or "A:ZZZ"))
+
+    def row_values(self, row):
+        return self.client.call("read", "row_values", lambda: (self._read(f"{row}:{row}") or [[]])[0])
+
+    def col_values(self, col):
+        a1 = rowcol_to_a1(1, col).rstrip("1")
+        return self.client.call("read", "col_values", lambda: [row[0] if row else "" for row in self._read(f"{a1}:{a1}")])
+
+    def acell(self, label):
+        value = self.client.call("read", "acell", lambda: (self._read(label) or [[""]])[0])
+        return FakeCell(value[0] if value else "")
+
+    def cell(self, row, col):
+        return self.acell(rowcol_to_a1(row, col))
+
+    def update(self, range_name, values=None, **kwargs):
+        def run():
+            self._write(range_name, values)
+            self.spreadsheet._touch()
+        return self.client.call("write", "update", run)
+
+    def update_cell(self, row, col, value):
+        def run():
+            self._set(row - 1, col - 1, value)
+            self.spreadsheet._touch()
+        return self.client.call("write", "update_cell", run)
+
+    def format(self, ranges, fmt):
+        def run():
+            row0, row1, col0, col1 = self._grid(ranges)
+            for r in range(row0, row1):
+                for c in range(col0, col1):
+                    self._apply_cell(r, c, {"userEnteredFormat": fmt}, "userEnteredFormat")
+            self.spreadsheet._touch()
+        return self.client.call("write", "format", run)
+
+    def insert_row(self, values, index=1):
+        def run():
+            self.rows.insert(index - 1, list(values))
+            self.spreadsheet._touch()
+        return self.client.call("write", "insert_row", run)
+
+    def append_row(self, values, **kwargs):
+        def run():
+            self.rows.append(list(values))
+            self.spreadsheet._touch()
+        return self.client.call("write", "append_row", run)
+
+    def copy_to(self, destination_spreadsheet_id):
+        def run():
+            destination = self.client._spreadsheets[destination_spreadsheet_id]
+            sheet = destination.add_sheet(f"Копия {self.title}", copy.deepcopy(self.rows), self.col_count)
+            sheet.colors = dict(self.colors)
+            destination._touch()
+            return {"sheetId": sheet.id, "title": sheet.title, "index": len(destination._sheets) - 1}
+        return self.client.call("write", "copy_to", run)
+
+    def delete_rows(self, start_index, end_index=None):
+        def run():
+            self._delete_dimension("ROWS", start_index - 1, end_index or start_index)
+            self.spreadsheet._touch()
+        return self.client.call("write", "delete_rows", run)
+
+
+class FakeCell:
+    def __init__(self, value):
+        self.value = value
+
+
+def make_school_spreadsheet(client, key="fake-spreadsheet", start=date(2025, 9, 1), days=300):
+    """
+    Создаёт таблицу как у школы: лист "Преподаватели" с заголовками в 3-й
+    строке и лист "Шаблон" с датами в 7-й строке начиная с колонки C.
+    """
+    spreadsheet = client.create(key)
+    spreadsheet.add_sheet(ADMIN_SHEET_NAME, [["Преподаватели"], [], ADMIN_HEADERS], cols=len(ADMIN_HEADERS))
+
+    dates = [start + timedelta(days=i) for i in range(days)]
+    template = [
+        ["Преподаватель:", ""],
+        ["ФИО:", ""],
+        ["Номер телефона:", ""],
+        [],
+        ["Ученик/класс", "Контакты"],
+        ["", ""] + [WEEKDAYS[d.weekday()] for d in dates],
+        ["", ""] + [d.strftime(DATE_FORMAT) for d in dates],
+    ]
+    spreadsheet.add_sheet(TEMPLATE_SHEET_NAME, template, cols=len(dates) + 2)
+    return spreadsheet
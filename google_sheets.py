@@ -1,117 +1,380 @@
-import gspread
-from google.oauth2.service_account import Credentials
-import pandas as pd
-from datetime import datetime
-from config import GOOGLE_CREDENTIALS_JSON, SPREADSHEET_ID, TEMPLATE_SHEET_NAME
+import random
+import threading
+import time
+from config import (
+    GOOGLE_CREDENTIALS_JSON, SPREADSHEET_ID, SPREADSHEET_IDS, TEMPLATE_SHEET_NAME, ADMIN_SHEET_NAME,
+    ARCHIVE_SHEET_PREFIX
+)
+from metrics import metrics, current_teacher
+from sheet_layout import DATE_ROW, FIRST_STUDENT_ROW, get_layout, student_key
+from write_queue import append_cells_request, update_cells_request, write_queue
+
+SCOPES = ["https://spreadsheets.google.com/feeds", "https://www.googleapis.com/auth/drive"]
+
+
+class SheetsSession:
+    """
+    Один авторизованный клиент и один объект таблицы на весь процесс.
+
+    Клиент создаётся при первом обращении; gspread и google-auth импортируются
+    тогда же, чтобы не замедлять запуск бота. Токен сервис-аккаунта обновляет
+    сам google-auth (AuthorizedSession внутри gspread) перед истечением срока,
+    поэтому повторная авторизация не нужна. Объекты листов тоже кэшируются:
+    каждый повторный worksheet()/open_by_key() — это сэкономленный запрос
+    метаданных, они считаются в saved_calls.
+
+    Таблицы-шарды (см. sharding) получают свои сессии через shard(): клиент
+    у них общий с основной, а кэши листов — свои.
+    """
+
+    def __init__(self, spreadsheet_id=SPREADSHEET_ID, credentials_path=GOOGLE_CREDENTIALS_JSON, parent=None):
+        self.spreadsheet_id = spreadsheet_id
+        self.credentials_path = credentials_path
+        self.parent = parent
+        self.saved_calls = 0
+        self._lock = threading.RLock()
+        self._client = None
+        self._spreadsheet = None
+        self._worksheets = {}
+        self._sheet_count = None
+        self._shards = {}
+
+    def client(self):
+        """Возвращает авторизованный клиент, создавая его один раз"""
+        if self.parent is not None:
+            return self.parent.client()
+        with self._lock:
+            if self._client is None:
+                with metrics.stage("auth"):
+                    import gspread
+                    from google.oauth2.service_account import Credentials
+                    from rate_limiter import RateLimitedHTTPClient
+
+                    creds = Credentials.from_service_account_file(self.credentials_path, scopes=SCOPES)
+                    self._client = gspread.authorize(creds, http_client=RateLimitedHTTPClient)
+            return self._client
+
+    def spreadsheet(self):
+        """Возвращает объект таблицы, открывая её один раз"""
+        # Запрос идёт без блокировки, чтобы не держать остальные потоки на время ответа API
+        with self._lock:
+            if self._spreadsheet is not None:
+                self.saved_calls += 1
+                return self._spreadsheet
+        spreadsheet = self.client().open_by_key(self.spreadsheet_id)
+        with self._lock:
+            if self._spreadsheet is None:
+                self._spreadsheet = spreadsheet
+            return self._spreadsheet
+
+    def worksheet(self, title):
+        """Возвращает лист по названию; WorksheetNotFound пробрасывается и не кэшируется"""
+        with self._lock:
+            sheet = self._worksheets.get(title)
+            if sheet is not None:
+                self.saved_calls += 1
+                return sheet
+        sheet = self.spreadsheet().worksheet(title)
+        with self._lock:
+            return self._worksheets.setdefault(title, sheet)
+
+    def shard(self, spreadsheet_id):
+        """Сессия таблицы-шарда; пустой id или id этой таблицы — сама сессия"""
+        if not spreadsheet_id or spreadsheet_id == self.spreadsheet_id:
+            return self
+        with self._lock:
+            shard = self._shards.get(spreadsheet_id)
+            if shard is None:
+                shard = self._shards[spreadsheet_id] = SheetsSession(spreadsheet_id, parent=self)
+            return shard
+
+    def use_client(self, client, spreadsheet_id=None):
+        """Подставляет готовый клиент (например, подделку из fake_sheets для тестов)"""
+        with self._lock:
+            self.reset()
+            self._client = client
+            if spreadsheet_id is not None:
+                self.spreadsheet_id = spreadsheet_id
+
+    def remember(self, sheet):
+        """Кладёт в кэш только что созданный лист"""
+        with self._lock:
+            self._worksheets[sheet.title] = sheet
+
+    def remember_all(self, sheets):
+        """Кладёт в кэш полный список листов таблицы и запоминает их число"""
+        with self._lock:
+            for sheet in sheets:
+                self._worksheets[sheet.title] = sheet
+            self._sheet_count = len(sheets)
+
+    def sync(self, sheets):
+        """Заменяет кэш листов свежим списком: удалённые и переименованные листы забываются"""
+        with self._lock:
+            self._worksheets.clear()
+            self.remember_all(sheets)
+
+    def sheet_count(self):
+        """Число листов в таблице; список листов запрашивается только если оно неизвестно"""
+        with self._lock:
+            if self._sheet_count is not None:
+                return self._sheet_count
+        sheets = self.spreadsheet().worksheets()
+        with self._lock:
+            if self._sheet_count is None:
+                self.remember_all(sheets)
+            return self._sheet_count
+
+    def sheet_added(self, added=True):
+        """Учитывает созданный лист; added=False — число листов неизвестно, пересчитать"""
+        with self._lock:
+            if not added:
+                self._sheet_count = None
+            elif self._sheet_count is not None:
+                self._sheet_count += 1
+
+    def forget(self, title):
+        """Убирает лист из кэша (например, после удаления или переименования), в том числе в шардах"""
+        with self._lock:
+            self._worksheets.pop(title, None)
+            shards = list(self._shards.values())
+        for shard in shards:
+            shard.forget(title)
+
+    def reset(self):
+        """Сбрасывает клиент, таблицу и листы — следующий вызов авторизуется заново"""
+        with self._lock:
+            self._client = None
+            self._spreadsheet = None
+            self._worksheets.clear()
+            self._sheet_count = None
+            self._shards.clear()
+
+    def stats(self):
+        """Счётчики для диагностики"""
+        with self._lock:
+            return {
+                "connected": self._client is not None,
+                "cached_worksheets": len(self._worksheets) + sum(
+                    len(shard._worksheets) for shard in self._shards.values()
+                ),
+                "saved_calls": self.saved_calls + sum(shard.saved_calls for shard in self._shards.values()),
+                "shards": len(self._shards),
+            }
+
+
+session = SheetsSession()
+metrics.register_collector("sheets_session", session.stats)
+
 
 def get_client():
     """Получает клиент для работы с Google Sheets"""
-    scope = ["https://spreadsheets.google.com/feeds", "https://www.googleapis.com/auth/drive"]
-    creds = Credentials.from_service_account_file(GOOGLE_CREDENTIALS_JSON, scopes=scope)
-    return gspread.authorize(creds)
+    return session.client()
+
+# Красный цвет для ячеек с примечаниями, зеленый — для отметок без примечаний
+NOTE_COLOR = {"red": 1.0, "green": 0.0, "blue": 0.0}
+MARK_COLOR = {"red": 0.0, "green": 1.0, "blue": 0.0}
+
 
 def format_cell_with_color(sheet, row, col, value, has_note=False):
-    """Форматирует ячейку с цветом и значением"""
+    """Форматирует ячейку с цветом и значением. Возвращает True, если запись прошла"""
     try:
-        # Устанавливаем значение в ячейку
-        sheet.update_cell(row, col, value)
-        
-        # Определяем цвет в зависимости от наличия примечания
-        if has_note:
-            # Красный цвет для ячеек с примечаниями
-            color = {"red": 1.0, "green": 0.0, "blue": 0.0}
-        else:
-            # Зеленый цвет для ячеек без примечаний
-            color = {"red": 0.0, "green": 1.0, "blue": 0.0}
-        
-        # Применяем форматирование (используем gspread формат)
-        cell_range = f"{gspread.utils.rowcol_to_a1(row, col)}"
-        sheet.format(cell_range, {
-            "backgroundColor": color
-        })
+        # Значение и цвет уходят в общую пачку записи; ждём, пока пачка не будет записана
+        color = NOTE_COLOR if has_note else MARK_COLOR
+        write_queue.submit_cell(sheet, row, col, value, color).result()
+        return True
         
     except Exception as e:
         print(f"Ошибка при форматировании ячейки: {e}")
+        return False
 
 def get_spreadsheet():
     """Получает объект таблицы"""
-    client = get_client()
-    return client.open_by_key(SPREADSHEET_ID)
+    return session.spreadsheet()
 
 
 def get_admin_sheet():
     """Получает лист с данными преподавателей"""
-    spreadsheet = get_spreadsheet()
-    return spreadsheet.worksheet("Преподаватели")
+    return session.worksheet(ADMIN_SHEET_NAME)
+
+
+def all_sessions():
+    """Сессии основной таблицы и всех таблиц-шардов из SPREADSHEET_IDS"""
+    sessions = [session]
+    for spreadsheet_id in SPREADSHEET_IDS:
+        shard = session.shard(spreadsheet_id)
+        if shard not in sessions:
+            sessions.append(shard)
+    return sessions
+
+
+def teacher_session(teacher_name, teacher_info=None):
+    """Сессия таблицы, где лежит лист преподавателя (колонка "Таблица" в "Преподаватели")"""
+    if teacher_info is None:
+        teacher_info = get_teacher_info(teacher_name)
+    return session.shard(teacher_info.get("Таблица") if teacher_info else None)
 
 
 def get_teacher_sheet(teacher_name):
     """Получает лист преподавателя по имени"""
+    from gspread.exceptions import WorksheetNotFound
+
     try:
-        spreadsheet = get_spreadsheet()
-        return spreadsheet.worksheet(teacher_name)
-    except gspread.exceptions.WorksheetNotFound:
+        return teacher_session(teacher_name).worksheet(teacher_name)
+    except WorksheetNotFound:
         return None
 
 
+_sheet_locks = {}
+_sheet_locks_guard = threading.Lock()
+
+
+def sheet_lock(title):
+    """Блокировка листа по названию: создание листа и запись на него не пересекаются"""
+    key = " ".join(str(title).split()).lower()
+    with _sheet_locks_guard:
+        lock = _sheet_locks.get(key)
+        if lock is None:
+            lock = _sheet_locks[key] = threading.RLock()
+        return lock
+
+
 def create_teacher_sheet(teacher_name):
     """Создаёт новый лист преподавателя ТОЧНО как шаблон"""
-    try:
-        spreadsheet = get_spreadsheet()
-        template = spreadsheet.worksheet(TEMPLATE_SHEET_NAME)
+    with sheet_lock(teacher_name):
+        # Лист мог уже создать параллельный поток (регистрация и перенос журнала)
+        existing = get_teacher_sheet(teacher_name)
+        if existing:
+            return existing
+        return _create_teacher_sheet(teacher_name)
+
 
+def _create_teacher_sheet(teacher_name):
+    try:
         # Получаем данные преподавателя
         teacher_info = get_teacher_info(teacher_name)
         if not teacher_info:
             print(f"Преподаватель {teacher_name} не найден в таблице")
             return None
 
-        # Индекс для вставки в самый конец (справа)
-        rightmost_index = len(spreadsheet.worksheets())
-
-        # Создаём новый лист копированием шаблона — вставляем справа
-        new_sheet = spreadsheet.duplicate_sheet(
-            source_sheet_id=template.id,
-            new_sheet_name=teacher_name,
-            insert_sheet_index=rightmost_index
-        )
-
-        # Обновляем данные преподавателя (в шаблоне B2=ФИО, B3=Телефон)
-        new_sheet.update('B2', [[teacher_info['ФИО']]])
-        new_sheet.update('B3', [[teacher_info['Телефон']]])
-
-        return new_sheet
+        provision_teacher_sheet(teacher_info)
+        return teacher_session(teacher_name, teacher_info).worksheet(teacher_name)
 
     except Exception as e:
         print(f"Ошибка создания листа для {teacher_name}: {str(e)}")
         return None
 
 
+def provision_teacher_sheet(teacher_info, admin_values=None):
+    """Создаёт лист преподавателя по шаблону (и его строку в "Преподаватели") одним batchUpdate; возвращает sheetId"""
+    target = teacher_session(teacher_info["ФИО"], teacher_info)
+    spreadsheet = target.spreadsheet()
+    template = target.worksheet(TEMPLATE_SHEET_NAME)
+    sheet_id = random.randint(1, 2 ** 31 - 1)
+
+    requests = []
+    if admin_values and target is session:
+        requests.append(append_cells_request(get_admin_sheet(), [admin_values]))
+    requests.append({
+        "duplicateSheet": {
+            "sourceSheetId": template.id,
+            "insertSheetIndex": target.sheet_count(),
+            "newSheetId": sheet_id,
+            "newSheetName": teacher_info["ФИО"],
+        }
+    })
+    requests.append(update_cells_request(
+        None, 2, 2, [[teacher_info["ФИО"]], [teacher_info["Телефон"]]], sheet_id=sheet_id
+    ))
+
+    try:
+        with metrics.stage("provision"):
+            spreadsheet.batch_update({"requests": requests})
+    except Exception:
+        # Число листов могло устареть (листы удаляли вручную) — пересчитаем в следующий раз
+        target.sheet_added(False)
+        raise
+    target.sheet_added()
+
+    # Лист в таблице-шарде: строка в "Преподаватели" пишется после него, чтобы не указывать на пустоту
+    if admin_values and target is not session:
+        admin_sheet = get_admin_sheet()
+        admin_sheet.spreadsheet.batch_update({"requests": [append_cells_request(admin_sheet, [admin_values])]})
+    return sheet_id
+
+
+# Сколько листов читать одним пакетным запросом при прогреве (ограничение длины URL)
+PRELOAD_CHUNK = 100
+
+
+def preload_layouts():
+    """Загружает разметку всех листов преподавателей во всех таблицах; возвращает число листов"""
+    return sum(_preload_session_layouts(shard) for shard in all_sessions())
+
+
+def teacher_sheets(sheets):
+    """Листы преподавателей из списка листов таблицы: без шаблона, "Преподаватели" и архива"""
+    return [
+        ws for ws in sheets
+        if ws.title not in (TEMPLATE_SHEET_NAME, ADMIN_SHEET_NAME) and not ws.title.startswith(ARCHIVE_SHEET_PREFIX)
+    ]
+
+
+def _preload_session_layouts(target):
+    spreadsheet = target.spreadsheet()
+    all_sheets = spreadsheet.worksheets()
+    target.remember_all(all_sheets)
+    sheets = teacher_sheets(all_sheets)
+    load_layouts(spreadsheet, sheets)
+    return len(sheets)
+
+
+def load_layouts(spreadsheet, sheets):
+    """Перечитывает разметку листов одной таблицы: values.batchGet на PRELOAD_CHUNK листов"""
+    from gspread.utils import absolute_range_name
+
+    for start in range(0, len(sheets), PRELOAD_CHUNK):
+        chunk = sheets[start:start + PRELOAD_CHUNK]
+        ranges = []
+        for sheet in chunk:
+            ranges.append(absolute_range_name(sheet.title, f"{DATE_ROW}:{DATE_ROW}"))
+            ranges.append(absolute_range_name(sheet.title, f"A{FIRST_STUDENT_ROW}:A"))
+        value_ranges = spreadsheet.values_batch_get(ranges).get("valueRanges", [])
+        for index, sheet in enumerate(chunk):
+            dates = value_ranges[2 * index].get("values", [[]])
+            names = value_ranges[2 * index + 1].get("values", [])
+            get_layout(sheet).load_ranges(dates[0] if dates else [], names)
+
+
+def prewarm():
+    """Прогрев в фоне после запуска; возвращает время этапов в секундах, при ошибке останавливается"""
+    # Импорт здесь: teacher_registry сам загружает лист через get_admin_sheet
+    from teacher_registry import teacher_registry
+
+    timings = {}
+    steps = (
+        ("auth", session.client),
+        ("spreadsheet", session.spreadsheet),
+        ("registry", teacher_registry.refresh),
+        ("layouts", preload_layouts),
+    )
+    for name, step in steps:
+        started = time.perf_counter()
+        try:
+            step()
+        except Exception as e:
+            print(f"Ошибка прогрева ({name}): {e}")
+            break
+        timings[name] = time.perf_counter() - started
+    return timings
+
+
 def get_date_column(sheet, target_date):
     """Находит колонку для указанной даты. Даты находятся в 7-й строке (индекс 6)."""
     try:
-        all_values = sheet.get_all_values()
-        if len(all_values) < 7:
-            print("Недостаточно строк для поиска дат (ожидается минимум 7)")
-            return None
-        date_row = all_values[6]  # 7-я строка
-        for col_idx, cell_value in enumerate(date_row):
-            if cell_value == target_date:
-                return col_idx + 1
-        # Доп. попытка распарсить даты формата DD.MM.YYYY
-        try:
-            target_dt = datetime.strptime(target_date, "%d.%m.%Y")
-        except Exception:
-            target_dt = None
-        if target_dt:
-            for col_idx, cell_value in enumerate(date_row):
-                try:
-                    if cell_value and "." in cell_value:
-                        cell_dt = datetime.strptime(cell_value, "%d.%m.%Y")
-                        if cell_dt == target_dt:
-                            return col_idx + 1
-                except Exception:
-                    continue
+        col = get_layout(sheet).date_column(target_date)
+        if col:
+            return col
         print(f"Дата {target_date} не найдена в строке дат")
         return None
     except Exception as e:
@@ -122,118 +385,167 @@ def get_date_column(sheet, target_date):
 def find_student_row(sheet, student_name, student_class="", subject=""):
     """Находит строку с учеником или возвращает None. Ученики начинаются с 8-й строки (индекс 7)."""
     try:
-        all_values = sheet.get_all_values()
-        
-        # Формируем полное имя для поиска: "Фамилия Имя Класс Предмет"
-        name_parts = [student_name]
-        if student_class:
-            name_parts.append(student_class)
-        if subject:
-            name_parts.append(subject)
-        full_name = " ".join(name_parts)
-        
-        for i, row in enumerate(all_values):
-            if i < 7:  # до 8-й строки включительно
-                continue
-            if len(row) > 0 and row[0] == full_name:
-                return i + 1
-        return None
+        # Полное имя для поиска: "Фамилия Имя Класс Предмет"
+        return get_layout(sheet).student_row(student_key(student_name, student_class, subject))
     except Exception as e:
         print(f"Ошибка при поиске ученика: {e}")
         return None
 
 
-def append_student(teacher_name, student_name, student_class, subject, date, note=""):
-    """Добавляет или обновляет запись о занятии ученика"""
+def _write_lessons(sheet, layout, lessons):
+    """
+    Ставит отметки по закэшированной разметке; новые ученики получают свободные строки.
+
+    lessons — список (полное имя, дата, примечание). Все ячейки уходят в очередь
+    записи одной пачкой; для нового ученика пишутся только ячейка A с именем и
+    ячейка даты. Возвращает список True/False по каждому занятию.
+    """
+    results = [False] * len(lessons)
+    items = []
+    owners = []
+    with layout.lock:
+        resolved = []
+        new_keys = []
+        for index, (full_name, date, note) in enumerate(lessons):
+            with metrics.stage("date_lookup"):
+                date_col = get_date_column(sheet, date)
+            if not date_col:
+                continue
+            with metrics.stage("row_lookup"):
+                student_row = layout.student_row(full_name)
+            if not student_row and full_name not in new_keys:
+                new_keys.append(full_name)
+            resolved.append((index, full_name, date_col, note, student_row))
+
+        new_rows = {}
+        if new_keys:
+            # Новые ученики: строки выдаёт разметка, перед записью проверяем, что их никто не занял
+            with metrics.stage("row_claim"):
+                new_rows = layout.claim_rows(new_keys)
+            for full_name, student_row in new_rows.items():
+                owner = next(item[0] for item in resolved if item[1] == full_name)
+                items.append((sheet, student_row, 1, [[full_name]], None))  # ФИО, класс и предмет в A
+                owners.append(owner)
+
+        for index, full_name, date_col, note, student_row in resolved:
+            student_row = student_row or new_rows.get(full_name)
+            if not student_row:
+                continue
+            # Ставим значение в колонку даты с цветом (примечание или "да")
+            cell_value = note if note else "да"
+            color = NOTE_COLOR if note else MARK_COLOR
+            items.append((sheet, student_row, date_col, [[cell_value]], color))
+            owners.append(index)
+            results[index] = True
+
+        futures = write_queue.submit_many(items)
+
+    # Ждём записи пачки уже без блокировки листа, чтобы в пачку попали и другие отметки.
+    # Любая ошибка (в том числе таймаут записи) — неудача: строки новых учеников остались
+    # выданными в разметке, и append_students её перечитает
+    with metrics.stage("write"):
+        for index, future in zip(owners, futures):
+            try:
+                future.result()
+            except Exception as e:
+                print(f"Ошибка записи на лист {sheet.title}: {e}")
+                results[index] = False
+    return results
+
+
+def append_students(teacher_name, lessons):
+    """
+    Добавляет или обновляет сразу несколько занятий одного преподавателя.
+
+    lessons — список (ученик, класс, предмет, дата, примечание). Все отметки
+    и новые строки записываются одним пакетным запросом. Возвращает список
+    True/False по каждому занятию.
+    """
+    token = current_teacher.set(teacher_name)
+    results = [False] * len(lessons)
+    layout = None
     try:
-        sheet = get_teacher_sheet(teacher_name)
+        sheet = get_teacher_sheet(teacher_name) or create_teacher_sheet(teacher_name)
         if not sheet:
-            sheet = create_teacher_sheet(teacher_name)
-            if not sheet:
-                return False
-        
-        # Находим колонку для даты
-        date_col = get_date_column(sheet, date)
-        if not date_col:
-            return False
-        
-        # Ищем существующую запись ученика
-        student_row = find_student_row(sheet, student_name, student_class, subject)
-        
-        if student_row:
-            # Обновляем существующую запись - ставим значение в нужную колонку с цветом
-            cell_value = note if note else "да"
-            format_cell_with_color(sheet, student_row, date_col, cell_value, bool(note))
-        else:
-            # Добавляем новую запись
-            # Находим первую пустую строку начиная с 8-й строки (ученики)
-            all_values = sheet.get_all_values()
-            new_row_num = 8
-            for i, row in enumerate(all_values):
-                if i < 7:
-                    continue
-                if len(row) == 0 or not row[0]:
-                    new_row_num = i + 1
-                    break
-                new_row_num = i + 2
-            
-            # Создаем новую строку
-            new_row = [""] * sheet.col_count
-            # Формируем полное имя: "Фамилия Имя Класс Предмет"
-            name_parts = [student_name]
-            if student_class:
-                name_parts.append(student_class)
-            if subject:
-                name_parts.append(subject)
-            new_row[0] = " ".join(name_parts)  # ФИО, класс и предмет в A
-            
-            # Добавляем строку
-            sheet.update(f"A{new_row_num}", [new_row])
-            
-            # Форматируем ячейку с датой (примечание или "да")
-            cell_value = note if note else "да"
-            format_cell_with_color(sheet, new_row_num, date_col, cell_value, bool(note))
-        
-        return True
+            return results
+
+        layout = get_layout(sheet)
+        pending = list(range(len(lessons)))
+
+        # Если запись не удалась или даты нет в разметке, лист могли изменить вручную:
+        # перечитываем разметку и пробуем ещё раз
+        for attempt in range(2):
+            batch = []
+            for index in pending:
+                student_name, student_class, subject, date, note = lessons[index]
+                batch.append((student_key(student_name, student_class, subject), date, note))
+            for index, ok in zip(pending, _write_lessons(sheet, layout, batch)):
+                results[index] = ok
+            pending = [index for index in pending if not results[index]]
+            if not pending:
+                break
+            layout.invalidate()
+        return results
         
     except Exception as e:
-        print(f"Ошибка при добавлении ученика: {e}")
-        return False
+        print(f"Ошибка при добавлении учеников: {e}")
+        # Лист могли удалить или переименовать вручную — в следующий раз запросим заново;
+        # строки, выданные новым ученикам, освобождаются вместе с разметкой
+        session.forget(teacher_name)
+        if layout is not None:
+            layout.invalidate()
+        return results
+    finally:
+        current_teacher.reset(token)
+
+
+def match_students(teacher_name, keys):
+    """Ищет учеников по разметке в памяти; None — лист ещё не создан или разметка не загружена"""
+    from teacher_registry import teacher_registry
+
+    try:
+        if teacher_registry.is_pending(teacher_name):
+            return [None] * len(keys)
+        sheet = get_teacher_sheet(teacher_name)
+        if not sheet:
+            return [None] * len(keys)
+        layout = get_layout(sheet)
+        with metrics.stage("student_match"):
+            return [layout.match_student(key) for key in keys]
+    except Exception as e:
+        print(f"Ошибка поиска учеников {teacher_name}: {e}")
+        return [None] * len(keys)
+
+
+def has_date_column(teacher_name, date):
+    """Есть ли на листе колонка для даты; если лист ещё не создан или разметка не загружена — True"""
+    from teacher_registry import teacher_registry
+
+    try:
+        if teacher_registry.is_pending(teacher_name):
+            return True
+        sheet = get_teacher_sheet(teacher_name)
+        if not sheet:
+            return True
+        return get_layout(sheet).date_column(date) is not None
+    except Exception as e:
+        print(f"Ошибка проверки даты {date} у {teacher_name}: {e}")
+        return True
+
+
+def append_student(teacher_name, student_name, student_class, subject, date, note=""):
+    """Добавляет или обновляет запись о занятии ученика"""
+    return append_students(teacher_name, [(student_name, student_class, subject, date, note)])[0]
 
 
 def get_teacher_info(teacher_name):
     """Получает информацию о преподавателе из админской таблицы"""
+    from teacher_registry import teacher_registry
+
     try:
-        admin_sheet = get_admin_sheet()
-        
-        # Получаем все значения таблицы
-        all_values = admin_sheet.get_all_values()
-        
-        # Проверяем, что таблица не пустая
-        if len(all_values) < 4:
-            print(f"Таблица преподавателей пуста или неполная (строк: {len(all_values)})")
-            return None
-        
-        # Ожидаемые заголовки в 3-й строке (индекс 2)
-        headers = ["ФИО", "Номер телефона", "Телеграмм id", "Username", "Предмет", "Классы", "Дата регистрации"]
-        
-        # Начинаем чтение данных с 4-й строки (индекс 3)
-        for i in range(3, len(all_values)):
-            row = all_values[i]
-            if len(row) == 0 or not row[0].strip():  # Пропускаем пустые строки
-                continue
-                
-            fio = row[0].strip() if len(row) > 0 else ""
-            if fio and fio.lower() == teacher_name.strip().lower():
-                return {
-                    "ФИО": fio,
-                    "Телефон": row[1] if len(row) > 1 else "",
-                    "Telegram ID": row[2] if len(row) > 2 else "",
-                    "Username": row[3] if len(row) > 3 else "",
-                    "Предмет": row[4] if len(row) > 4 else "",
-                    "Классы": row[5] if len(row) > 5 else "",
-                    "Дата регистрации": row[6] if len(row) > 6 else "",
-                }
+        info = teacher_registry.get_by_fio(teacher_name)
+        if info:
+            return dict(info)
 
         print(f"Преподаватель {teacher_name} не найден в таблице")
         return None
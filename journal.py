@@ -0,0 +1,427 @@
+import json
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from config import JOURNAL_PATH, JOURNAL_MAX_ATTEMPTS, SHEETS_MAX_WORKERS
+from google_sheets import append_students
+from metrics import metrics
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS lessons (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    key TEXT NOT NULL UNIQUE,
+    teacher TEXT NOT NULL,
+    student TEXT NOT NULL,
+    class TEXT NOT NULL,
+    subject TEXT NOT NULL,
+    date TEXT NOT NULL,
+    note TEXT NOT NULL,
+    chat_id INTEGER,
+    created_at REAL NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    last_error TEXT,
+    status TEXT NOT NULL DEFAULT 'pending',
+    done_at REAL,
+    next_attempt_at REAL NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS lessons_pending ON lessons (status, id);
+CREATE TABLE IF NOT EXISTS registrations (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    teacher TEXT NOT NULL,
+    data TEXT NOT NULL,
+    chat_id INTEGER,
+    created_at REAL NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    last_error TEXT,
+    status TEXT NOT NULL DEFAULT 'pending',
+    done_at REAL,
+    next_attempt_at REAL NOT NULL DEFAULT 0
+);
+"""
+
+FIELDS = ("key", "teacher", "student", "class", "subject", "date", "note", "chat_id", "created_at")
+
+
+class Journal:
+    """
+    Локальный журнал занятий (SQLite, только дозапись).
+
+    Каждое занятие сначала надёжно сохраняется здесь, и только потом
+    переносится в Google Sheets фоновым JournalReplayer. Записи из нескольких
+    потоков, пришедшие одновременно, коммитятся одной транзакцией (один fsync
+    на пачку). Ключ записи уникален, поэтому повторно доставленное сообщение
+    не создаст второй отметки.
+
+    Здесь же очередь фоновых регистраций: строка преподавателя и его лист
+    создаются в таблице после ответа в Telegram. Незавершённые регистрации
+    держатся и в памяти — по ним перенос занятий решает, чьи записи ждать.
+
+    Файл базы открывается при первом обращении (или в open()), а не при
+    импорте модуля.
+    """
+
+    def __init__(self, path=JOURNAL_PATH):
+        self.path = path
+        self._conn = None
+        self._db_lock = threading.Lock()
+        self._cond = threading.Condition()
+        self._pending = []
+        self._last_seq = 0
+        self._durable_seq = 0
+        self._leader = False
+        self.commits = 0
+        self._registrations = {}
+
+    def open(self):
+        """Открывает базу, если она ещё не открыта"""
+        with self._db_lock:
+            self._connect()
+
+    def _connect(self):
+        # Вызывается под _db_lock
+        if self._conn is None:
+            conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=FULL")
+            conn.executescript(SCHEMA)
+            for row in conn.execute("SELECT * FROM registrations WHERE status = 'pending' ORDER BY id"):
+                self._registrations[row["id"]] = self._registration(row)
+            self._conn = conn
+        return self._conn
+
+    def append(self, teacher, student, student_class, subject, date, note="", chat_id=None, key=None):
+        """Сохраняет занятие и возвращает его ключ, когда запись уже на диске"""
+        return self.append_many([(teacher, student, student_class, subject, date, note)], chat_id=chat_id,
+                                keys=[key])[0]
+
+    def append_many(self, lessons, chat_id=None, keys=None):
+        """
+        Сохраняет несколько занятий (преподаватель, ученик, класс, предмет, дата, примечание)
+        одной транзакцией. Возвращает ключи записей, когда они уже на диске.
+        """
+        now = time.time()
+        keys = [key or uuid.uuid4().hex for key in (keys or [None] * len(lessons))]
+        rows = [(key,) + tuple(lesson) + (chat_id, now) for key, lesson in zip(keys, lessons)]
+        with self._cond:
+            self._last_seq += 1
+            seq = self._last_seq
+            self._pending.extend(rows)
+            while self._durable_seq < seq and self._leader:
+                self._cond.wait()
+            if self._durable_seq >= seq:
+                return keys
+            # Этот поток коммитит всё, что успело накопиться, остальные ждут
+            self._leader = True
+            batch, self._pending = self._pending, []
+            upto = self._last_seq
+
+        committed = False
+        try:
+            with self._db_lock:
+                conn = self._connect()
+                conn.execute("BEGIN")
+                try:
+                    conn.executemany(
+                        f"INSERT OR IGNORE INTO lessons ({', '.join(FIELDS)}) VALUES ({', '.join('?' * len(FIELDS))})",
+                        batch,
+                    )
+                    conn.execute("COMMIT")
+                except Exception:
+                    conn.execute("ROLLBACK")
+                    raise
+            committed = True
+        finally:
+            with self._cond:
+                self._leader = False
+                if committed:
+                    self._durable_seq = upto
+                    self.commits += 1
+                else:
+                    # Вернём в очередь чужие занятия: ожидающие потоки попробуют закоммитить их сами.
+                    # Свои не возвращаем — вызывающий получит ошибку и не должен найти их в журнале
+                    own = {id(row) for row in rows}
+                    self._pending = [row for row in batch if id(row) not in own] + self._pending
+                self._cond.notify_all()
+        return keys
+
+    def pending(self, limit=200, skip_teachers=()):
+        """
+        Незаписанные в таблицу занятия, которым пора в таблицу, в порядке поступления.
+
+        Не возвращает занятия skip_teachers, занятия, чей повтор отложен
+        (next_attempt_at), и занятия, у которых то же занятие за тот же день
+        ждёт повтора раньше них, — иначе позднее примечание затёрла бы
+        повторная запись раннего.
+        """
+        skip_teachers = list(skip_teachers)
+        query = (
+            "SELECT * FROM lessons AS l WHERE l.status = 'pending' AND l.next_attempt_at <= ? "
+            "AND NOT EXISTS (SELECT 1 FROM lessons AS e WHERE e.status = 'pending' AND e.id < l.id "
+            "AND e.next_attempt_at > ? AND e.teacher = l.teacher AND e.student = l.student "
+            "AND e.class = l.class AND e.subject = l.subject AND e.date = l.date)"
+        )
+        if skip_teachers:
+            query += f" AND l.teacher NOT IN ({', '.join('?' * len(skip_teachers))})"
+        now = time.time()
+        with self._db_lock:
+            rows = self._connect().execute(
+                query + " ORDER BY l.id LIMIT ?", (now, now, *skip_teachers, limit)
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def next_attempt_in(self, skip_teachers=()):
+        """Через сколько секунд появится работа для переноса (0 — уже есть), None — ждать нечего"""
+        skip_teachers = list(skip_teachers)
+        query = "SELECT MIN(next_attempt_at) AS at FROM lessons WHERE status = 'pending'"
+        if skip_teachers:
+            query += f" AND teacher NOT IN ({', '.join('?' * len(skip_teachers))})"
+        with self._db_lock:
+            times = [record["next_attempt_at"] for record in self._registrations.values()]
+            at = self._connect().execute(query, skip_teachers).fetchone()["at"]
+        if at is not None:
+            times.append(at)
+        if not times:
+            return None
+        return max(0.0, min(times) - time.time())
+
+    def mark_done(self, *record_ids):
+        """Отмечает записи перенесёнными в таблицу (одной транзакцией)"""
+        now = time.time()
+        with self._db_lock:
+            conn = self._connect()
+            conn.execute("BEGIN")
+            conn.executemany(
+                "UPDATE lessons SET status = 'done', done_at = ? WHERE id = ?", [(now, i) for i in record_ids]
+            )
+            conn.execute("COMMIT")
+
+    def mark_attempt_failed(self, record_id, error, max_attempts=JOURNAL_MAX_ATTEMPTS, table="lessons", retry_in=0.0):
+        """
+        Учитывает неудачную попытку и откладывает следующую на retry_in секунд.
+
+        После max_attempts запись помечается 'failed'; возвращает True, если так и вышло.
+        """
+        with self._db_lock:
+            conn = self._connect()
+            conn.execute(
+                f"UPDATE {table} SET attempts = attempts + 1, last_error = ?, next_attempt_at = ?, "
+                "status = CASE WHEN attempts + 1 >= ? THEN 'failed' ELSE status END WHERE id = ?",
+                (error, time.time() + retry_in, max_attempts, record_id),
+            )
+            row = conn.execute(f"SELECT status, next_attempt_at FROM {table} WHERE id = ?", (record_id,)).fetchone()
+            if table == "registrations" and row is not None:
+                if row["status"] == "failed":
+                    self._registrations.pop(record_id, None)
+                elif record_id in self._registrations:
+                    self._registrations[record_id]["attempts"] += 1
+                    self._registrations[record_id]["next_attempt_at"] = row["next_attempt_at"]
+        return row is not None and row["status"] == "failed"
+
+    @staticmethod
+    def _registration(row):
+        record = dict(row)
+        record["data"] = json.loads(record["data"])
+        return record
+
+    def add_registration(self, teacher, data, chat_id=None):
+        """Ставит регистрацию в очередь; возвращает её id, когда запись уже на диске"""
+        with self._db_lock:
+            conn = self._connect()
+            cursor = conn.execute(
+                "INSERT INTO registrations (teacher, data, chat_id, created_at) VALUES (?, ?, ?, ?)",
+                (teacher, json.dumps(data, ensure_ascii=False), chat_id, time.time()),
+            )
+            row = conn.execute("SELECT * FROM registrations WHERE id = ?", (cursor.lastrowid,)).fetchone()
+            self._registrations[row["id"]] = self._registration(row)
+        return row["id"]
+
+    def pending_registrations(self, due=False):
+        """Незавершённые регистрации в порядке поступления (из памяти); due — только те, чей повтор не отложен"""
+        now = time.time()
+        with self._db_lock:
+            self._connect()
+            return [
+                dict(record) for record in self._registrations.values()
+                if not due or record["next_attempt_at"] <= now
+            ]
+
+    def provisioning_teachers(self):
+        """ФИО преподавателей, чьи листы ещё создаются"""
+        with self._db_lock:
+            self._connect()
+            return {record["teacher"] for record in self._registrations.values()}
+
+    def mark_registration_done(self, registration_id):
+        with self._db_lock:
+            self._connect().execute(
+                "UPDATE registrations SET status = 'done', done_at = ? WHERE id = ?", (time.time(), registration_id)
+            )
+            self._registrations.pop(registration_id, None)
+
+    def mark_registration_failed(self, registration_id, error, max_attempts=JOURNAL_MAX_ATTEMPTS, retry_in=0.0):
+        """Учитывает неудачную попытку регистрации; True — попытки кончились"""
+        return self.mark_attempt_failed(registration_id, error, max_attempts, table="registrations", retry_in=retry_in)
+
+    def stats(self):
+        """Количество записей по статусам"""
+        with self._db_lock:
+            # Метрики не открывают журнал: пока он закрыт, в нём ничего нет
+            rows = self._conn.execute(
+                "SELECT status, COUNT(*) AS n FROM lessons GROUP BY status"
+            ).fetchall() if self._conn is not None else []
+            registrations = len(self._registrations)
+        counts = {row["status"]: row["n"] for row in rows}
+        counts["commits"] = self.commits
+        counts["registrations_pending"] = registrations
+        return counts
+
+    def close(self):
+        with self._db_lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+class JournalReplayer:
+    """
+    Фоновый перенос занятий из журнала в Google Sheets.
+
+    Занятия одного преподавателя переносятся строго по порядку одним пакетным
+    запросом (append_students), разные преподаватели — параллельно. Если запись
+    не прошла, она остаётся в журнале, и её следующая попытка откладывается
+    с растущей паузой (next_attempt_at) — остальные записи переносятся, не
+    дожидаясь её. Запись, которая не прошла max_attempts раз, помечается
+    'failed' и передаётся в on_failed. wake() прерывает любое ожидание.
+
+    Перед занятиями выполняются фоновые регистрации из журнала (строка в
+    "Преподаватели" и лист по шаблону). Занятия преподавателя, чья
+    регистрация ещё не завершена, ждут в журнале, пока лист не появится.
+    Регистрация, не прошедшая max_attempts раз, передаётся в
+    on_registration_failed.
+    """
+
+    def __init__(self, journal, writer=append_students, max_workers=SHEETS_MAX_WORKERS,
+                 idle_interval=5.0, max_backoff=60.0, max_attempts=JOURNAL_MAX_ATTEMPTS,
+                 on_failed=None, on_registration_failed=None):
+        self.journal = journal
+        self.writer = writer
+        self.idle_interval = idle_interval
+        self.max_backoff = max_backoff
+        self.max_attempts = max_attempts
+        self.on_failed = on_failed
+        self.on_registration_failed = on_registration_failed
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="journal")
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self.replayed = 0
+        self.failed_attempts = 0
+        self.provisioned = 0
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="journal-replayer", daemon=True)
+            self._thread.start()
+
+    def wake(self):
+        """Сообщает, что в журнале появилась новая запись"""
+        self._wake.set()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+        self._executor.shutdown(wait=True)
+
+    def _retry_delay(self, attempts):
+        """Пауза перед следующей попыткой записи, не прошедшей attempts + 1 раз"""
+        return min(self.max_backoff, 2.0 ** attempts)
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wake.clear()
+            self.replay_once()
+            delay = self.journal.next_attempt_in(skip_teachers=self.journal.provisioning_teachers())
+            if delay is None or delay > self.idle_interval:
+                delay = self.idle_interval
+            if delay > 0:
+                # Новая запись в журнале (wake) или остановка прерывают ожидание
+                self._wake.wait(delay)
+
+    def replay_once(self):
+        """
+        Завершает отложенные регистрации и переносит одну пачку записей.
+
+        Возвращает True, если было что делать и всё прошло.
+        """
+        registrations = self.journal.pending_registrations(due=True)
+        provisioned = all([self._provision(record) for record in registrations])
+        records = self.journal.pending(skip_teachers=self.journal.provisioning_teachers())
+        if not records:
+            return bool(registrations) and provisioned
+        by_teacher = {}
+        for record in records:
+            by_teacher.setdefault(record["teacher"], []).append(record)
+        results = list(self._executor.map(self._replay_teacher, by_teacher.values()))
+        return provisioned and all(results)
+
+    def _provision(self, record):
+        # Импорт здесь: registration сам ставит регистрации в этот журнал
+        from registration import complete_registration, abandon_registration
+
+        try:
+            complete_registration(record["data"], retry=record["attempts"] > 0)
+        except Exception as e:
+            self.failed_attempts += 1
+            retry_in = self._retry_delay(record["attempts"])
+            if self.journal.mark_registration_failed(record["id"], str(e), self.max_attempts, retry_in=retry_in):
+                print(f"Регистрацию {record['teacher']} не удалось завершить: {e}")
+                abandon_registration(record["data"])
+                if self.on_registration_failed:
+                    self.on_registration_failed(record)
+            return False
+        self.journal.mark_registration_done(record["id"])
+        self.provisioned += 1
+        return True
+
+    def _replay_teacher(self, records):
+        lessons = [(r["student"], r["class"], r["subject"], r["date"], r["note"]) for r in records]
+        try:
+            results = self.writer(records[0]["teacher"], lessons)
+            error = "запись в таблицу не удалась"
+        except Exception as e:
+            results, error = [False] * len(records), str(e)
+
+        done = [record["id"] for record, ok in zip(records, results) if ok]
+        if done:
+            self.journal.mark_done(*done)
+            self.replayed += len(done)
+
+        all_ok = True
+        for record, ok in zip(records, results):
+            if ok:
+                continue
+            all_ok = False
+            self.failed_attempts += 1
+            retry_in = self._retry_delay(record["attempts"])
+            if self.journal.mark_attempt_failed(record["id"], error, self.max_attempts, retry_in=retry_in):
+                print(f"Занятие {record['key']} не удалось перенести в таблицу: {error}")
+                if self.on_failed:
+                    self.on_failed(record)
+        return all_ok
+
+    def stats(self):
+        stats = self.journal.stats()
+        stats["replayed"] = self.replayed
+        stats["failed_attempts"] = self.failed_attempts
+        stats["provisioned"] = self.provisioned
+        return stats
+
+
+journal = Journal()
+replayer = JournalReplayer(journal)
+metrics.register_collector("lesson_journal", replayer.stats)
@@ -0,0 +1,152 @@
+import re
+from sheet_layout import split_student_key, student_key
+from student_index import normalize_name
+from subjects import SUBJECT_ALIASES
+
+FORMAT_HELP = (
+    "❌ Неверный формат. Нужно: Фамилия Имя Класс Предмет / примечания\n\n"
+    "Примеры:\n• Петров Петр 5 математика\n• Иванова Анна 7 физика / хорошо подготовилась"
+)
+
+# Строка занятия: Фамилия Имя Класс Предмет [/ примечание]
+_LESSON_LINE = re.compile(
+    r"^\s*(?P<last>[^\s/]+)\s+(?P<first>[^\s/]+)\s+(?P<cls>[^\s/]+)\s+(?P<subject>[^\s/][^/]*?)\s*"
+    r"(?:/\s*(?P<note>.*?))?\s*$"
+)
+
+def validate_student_name(name):
+    """Проверяет корректность имени ученика"""
+    if not name or len(name.strip()) < 3:
+        return False, "Имя ученика должно содержать минимум 3 символа"
+
+    parts = name.split()
+    if len(parts) < 2:
+        return False, "Укажите Фамилию и Имя ученика"
+
+    return True, ""
+
+
+def validate_class(class_num):
+    """Проверяет корректность номера класса"""
+    if not class_num:
+        return True, ""  # Класс необязателен
+
+    if not class_num.isdigit():
+        return False, "Класс должен быть указан цифрой"
+
+    class_int = int(class_num)
+    if class_int < 1 or class_int > 11:
+        return False, "Класс должен быть от 1 до 11"
+
+    return True, ""
+
+
+def normalize_subject(subject):
+    """
+    Приводит предмет к названию из subjects.SUBJECTS («Русский язык», «рус» → «русский»).
+
+    Неизвестный предмет остаётся как написан, но одним словом — как бот
+    всегда записывал его в колонку A. Строки, записанные раньше сокращением
+    («англ»), находятся по индексу учеников: там предмет тоже приводится
+    к subjects.SUBJECTS (см. student_index.match_key).
+    """
+    known = SUBJECT_ALIASES.get(normalize_name(subject))
+    if known:
+        return known
+    first_word = subject.split(maxsplit=1)[0]
+    return SUBJECT_ALIASES.get(normalize_name(first_word), first_word)
+
+
+class LessonRecord:
+    """Одно разобранное занятие: ученик, класс, предмет, примечание и дата"""
+
+    __slots__ = ("student", "student_class", "subject", "note", "date")
+
+    def __init__(self, student, student_class, subject, note="", date=""):
+        self.student = student
+        self.student_class = student_class
+        self.subject = subject
+        self.note = note
+        self.date = date
+
+    @property
+    def key(self):
+        """Имя в колонке A: "Фамилия Имя Класс Предмет" """
+        return student_key(self.student, self.student_class, self.subject)
+
+    def renamed(self, name):
+        """Та же запись для ученика с именем name из колонки A"""
+        student, student_class, subject = split_student_key(name)
+        return LessonRecord(student, student_class, subject, self.note, self.date)
+
+    def journal_row(self, teacher_name):
+        """Строка для journal.append_many: (преподаватель, ученик, класс, предмет, дата, примечание)"""
+        return teacher_name, self.student, self.student_class, self.subject, self.date, self.note
+
+    def __eq__(self, other):
+        if not isinstance(other, LessonRecord):
+            return NotImplemented
+        return all(getattr(self, name) == getattr(other, name) for name in self.__slots__)
+
+    def __repr__(self):
+        fields = ", ".join(f"{name}={getattr(self, name)!r}" for name in self.__slots__)
+        return f"LessonRecord({fields})"
+
+
+def parse_line(line, date=""):
+    """
+    Разбирает одну строку "Фамилия Имя Класс Предмет / примечания".
+
+    Возвращает (LessonRecord, "") или (None, текст ошибки для ответа).
+    """
+    match = _LESSON_LINE.match(line)
+    if match is None:
+        return None, FORMAT_HELP
+    student = f"{match.group('last')} {match.group('first')}"
+    ok, error = validate_student_name(student)
+    if not ok:
+        return None, f"❌ {error}"
+    ok, error = validate_class(match.group("cls"))
+    if not ok:
+        return None, f"❌ {error} (например: 5, 7, 11)"
+    # "05" и "5" — один класс, на лист пишется без нуля
+    student_class = str(int(match.group("cls")))
+    return LessonRecord(
+        student, student_class, normalize_subject(match.group("subject")), match.group("note") or "", date
+    ), ""
+
+
+def _is_lesson_line(line):
+    """Похожа ли строка на занятие: четыре части и номер класса числом (пусть и неверным)"""
+    match = _LESSON_LINE.match(line)
+    return match is not None and match.group("cls").isdigit()
+
+
+def parse_message(text, date=""):
+    """
+    Разбирает сообщение: одно занятие или несколько, по одному на строку.
+
+    Пустые строки пропускаются. Если в сообщении одно занятие с примечанием,
+    остальные строки — продолжение примечания (как раньше, когда всё после "/"
+    было примечанием). В сообщении с несколькими занятиями каждая строка
+    разбирается отдельно. Возвращает (занятия, ошибки): занятия — список
+    (номер строки, LessonRecord), ошибки — (номер строки, строка, текст
+    ошибки). Номера считаются по непустым строкам, с единицы.
+    """
+    lines = [line for line in text.splitlines() if line.strip()]
+    parsed = [parse_line(line, date) for line in lines]
+
+    first = parsed[0][0] if parsed else None
+    if first is not None and first.note and all(
+        record is None and not _is_lesson_line(line) for line, (record, _) in zip(lines[1:], parsed[1:])
+    ):
+        first.note = "\n".join([first.note] + [line.strip() for line in lines[1:]])
+        return [(1, first)], []
+
+    records, errors = [], []
+    for number, (line, (record, error)) in enumerate(zip(lines, parsed), start=1):
+        if record is None:
+            errors.append((number, line.strip(), error))
+        else:
+            records.append((number, record))
+    return records, errors
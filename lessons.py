@@ -1,85 +1,197 @@
-from google_sheets import append_student
+import threading
+import time
+from journal import journal, replayer
+from metrics import metrics
+from google_sheets import has_date_column, match_students
+from lesson_parser import FORMAT_HELP, parse_message
 from datetime import datetime
 
+# Сколько секунд ждать ответа на вопрос о похожем ученике
+CONFIRMATION_TTL = 600
+YES_ANSWERS = ("да", "д", "yes", "+")
+NO_ANSWERS = ("нет", "н", "no", "-")
 
-def process_lesson_message(teacher_name, message_text):
+# Вопросы о похожих учениках, ждущие ответа: преподаватель → занятия и варианты
+_confirmations = {}
+_confirmations_lock = threading.Lock()
+
+
+def process_lesson_message(teacher_name, message_text, chat_id=None, message_key=None):
     """
     Обрабатывает сообщение о занятии от преподавателя
+
+    Занятие сохраняется в локальный журнал и подтверждается сразу; в таблицу
+    его переносит фоновый JournalReplayer. message_key (например, "чат:сообщение")
+    защищает от двойной записи, если Telegram доставит сообщение повторно.
+
+    В одном сообщении можно прислать несколько учеников, по одному на строку
+    (групповое занятие): все они записываются одним пакетом, ответ — общий.
+    Примечание может продолжаться на следующих строках (см. parse_message).
+
+    Ученики сверяются с листом преподавателя: отличие в регистре, ё/е,
+    пробелах или записи предмета исправляется на имя с листа молча. Если
+    на листе есть только похожие ученики (даже с одной другой буквой —
+    «Ким Ян» и «Ким Яна» разные дети), бот спрашивает, к кому записать
+    занятие, и ждёт ответа «да» / «нет» (или номер) следующим сообщением.
     
-    Формат сообщения: "Фамилия Имя [класс] / примечания"
+    Формат строки: "Фамилия Имя Класс Предмет / примечания"
     Примеры:
-    - "Петров Петр 5"
-    - "Иванова Анна 7 / хорошо подготовилась"
-    - "Сидоров Иван / пропустил занятие"
+    - "Петров Петр 5 математика"
+    - "Иванова Анна 7 физика / хорошо подготовилась"
     """
     try:
-        # Разделяем сообщение на основную часть и примечания
-        if "/" in message_text:
-            student_info, note = map(str.strip, message_text.split("/", 1))
-        else:
-            student_info, note = message_text.strip(), ""
-
-        # Разбираем информацию об ученике
-        parts = student_info.split()
-        if len(parts) < 4:
-            return "❌ Неверный формат. Нужно: Фамилия Имя Класс Предмет / примечания\n\nПримеры:\n• Петров Петр 5 математика\n• Иванова Анна 7 физика / хорошо подготовилась"
-
-        # Извлекаем ФИО, класс и предмет
-        student_name = " ".join(parts[:2])  # Фамилия Имя
-        student_class = parts[2]  # Класс
-        subject = parts[3]  # Предмет
-        
-        # Валидация класса
-        if not student_class.isdigit():
-            return "❌ Класс должен быть указан цифрой (например: 5, 7, 11)"
+        answer = _answer_confirmation(teacher_name, message_text, chat_id)
+        if answer:
+            return answer
+        dropped = _drop_confirmation(teacher_name)
 
         # Получаем текущую дату в формате DD.MM.YYYY
         date = datetime.now().strftime("%d.%m.%Y")
-
-        # Добавляем запись в таблицу
-        success = append_student(teacher_name, student_name, student_class, subject, date, note)
-        
-        if success:
-            # Формируем ответное сообщение
-            response = f"✅ Запись добавлена:\n"
-            response += f"👤 Ученик: {student_name}\n"
-            response += f"📚 Класс: {student_class}\n"
-            response += f"📖 Предмет: {subject}\n"
-            response += f"📅 Дата: {date}\n"
-            if note:
-                response += f"📝 Примечание: {note}"
-            
-            return response
-        else:
-            return "❌ Ошибка при добавлении записи. Попробуйте еще раз."
+        with metrics.stage("parse"):
+            records, errors = parse_message(message_text, date)
+        if records and not has_date_column(teacher_name, date):
+            return dropped + (
+                f"❌ На вашем листе нет колонки для даты {date}, занятие не записано. "
+                "Обратитесь к администратору."
+            )
+        if len(records) + len(errors) <= 1:
+            return dropped + _process_single(teacher_name, records, errors, chat_id, message_key)
+        return dropped + _process_bulk(teacher_name, records, errors, date, chat_id, message_key)
             
     except Exception as e:
         print(f"Ошибка при обработке сообщения: {e}")
         return "❌ Произошла ошибка при обработке сообщения. Попробуйте еще раз."
 
 
-def validate_student_name(name):
-    """Проверяет корректность имени ученика"""
-    if not name or len(name.strip()) < 3:
-        return False, "Имя ученика должно содержать минимум 3 символа"
-    
-    parts = name.split()
-    if len(parts) < 2:
-        return False, "Укажите Фамилию и Имя ученика"
-    
-    return True, ""
+def _save(teacher_name, records, chat_id, keys):
+    """Сохраняет занятия (LessonRecord) в журнал; в таблицу они попадут в фоне"""
+    with metrics.stage("journal_append"):
+        journal.append_many([record.journal_row(teacher_name) for record in records], chat_id=chat_id, keys=keys)
+    replayer.wake()
 
 
-def validate_class(class_num):
-    """Проверяет корректность номера класса"""
-    if not class_num:
-        return True, ""  # Класс необязателен
-    
-    if not class_num.isdigit():
-        return False, "Класс должен быть указан цифрой"
-    
-    class_int = int(class_num)
-    if class_int < 1 or class_int > 11:
-        return False, "Класс должен быть от 1 до 11"
-    
-    return True, ""
+def _resolve(teacher_name, items):
+    """
+    Сверяет учеников с листом преподавателя.
+
+    items — список (запись, ключ журнала). Возвращает (готовые, вопросы):
+    в готовых записях имя, совпавшее с листом с точностью до регистра, ё/е
+    и пробелов, уже заменено именем с листа, вопросы — (запись, ключ,
+    похожие имена) для учеников, которых надо уточнить.
+    """
+    names = [record.key for record, _ in items]
+    ready, questions = [], []
+    for (record, key), name, match in zip(items, names, match_students(teacher_name, names)):
+        if match is None or match.status == "none" or match.name == name:
+            ready.append((record, key))
+        elif match.status == "exact":
+            ready.append((record.renamed(match.name), key))
+        else:
+            questions.append((record, key, match.candidates[:3]))
+    return ready, questions
+
+
+def _ask(teacher_name, questions, chat_id):
+    """Запоминает занятия с похожими учениками и формирует вопрос преподавателю"""
+    with _confirmations_lock:
+        _confirmations[teacher_name] = {"questions": questions, "chat_id": chat_id, "asked_at": time.monotonic()}
+    if len(questions) == 1:
+        record, _, candidates = questions[0]
+        response = f"❓ Ученика «{record.key}» нет в таблице. Похожие:\n"
+        response += "\n".join(f"{number}. {name}" for number, name in enumerate(candidates, start=1))
+        response += "\n\nОтветьте «да» (или номером), чтобы записать занятие похожему ученику, "
+        response += "или «нет», чтобы добавить нового."
+        return response
+    response = "❓ Этих учеников нет в таблице, но есть похожие:\n"
+    response += "\n".join(f"• {record.key} → {candidates[0]}" for record, _, candidates in questions)
+    response += "\n\nОтветьте «да», чтобы записать занятия похожим ученикам, или «нет», чтобы добавить новых."
+    return response
+
+
+def _answer_confirmation(teacher_name, message_text, chat_id):
+    """Если сообщение — ответ на вопрос о похожих учениках, записывает занятия и возвращает ответ"""
+    answer = message_text.strip().casefold()
+    with _confirmations_lock:
+        pending = _confirmations.get(teacher_name)
+        if pending is None or time.monotonic() - pending["asked_at"] > CONFIRMATION_TTL:
+            return None
+        questions = pending["questions"]
+        if answer in YES_ANSWERS:
+            choice = 0
+        elif answer in NO_ANSWERS:
+            choice = -1
+        elif answer.isdigit() and len(questions) == 1 and 1 <= int(answer) <= len(questions[0][2]):
+            choice = int(answer) - 1
+        else:
+            return None
+        del _confirmations[teacher_name]
+
+    records = [record.renamed(candidates[choice]) if choice >= 0 else record for record, _, candidates in questions]
+    _save(teacher_name, records, chat_id or pending["chat_id"], [key for _, key, _ in questions])
+    if len(records) == 1:
+        return _single_reply(records[0])
+    return _bulk_reply(records, [])
+
+
+def _drop_confirmation(teacher_name):
+    """Снимает вопрос, на который преподаватель ответил новым занятием; возвращает предупреждение"""
+    with _confirmations_lock:
+        pending = _confirmations.pop(teacher_name, None)
+    if pending is None:
+        return ""
+    names = ", ".join(record.key for record, _, _ in pending["questions"])
+    return f"⚠️ Без ответа не записано: {names}. Отправьте эти занятия ещё раз.\n\n"
+
+
+def _single_reply(record):
+    response = f"✅ Запись добавлена:\n"
+    response += f"👤 Ученик: {record.student}\n"
+    if record.student_class:
+        response += f"📚 Класс: {record.student_class}\n"
+    if record.subject:
+        response += f"📖 Предмет: {record.subject}\n"
+    response += f"📅 Дата: {record.date}\n"
+    if record.note:
+        response += f"📝 Примечание: {record.note}"
+    return response
+
+
+def _bulk_reply(records, errors):
+    response = ""
+    if records:
+        response += f"✅ Записано занятий: {len(records)} (📅 {records[0].date})\n"
+        for record in records:
+            response += f"• {', '.join(part for part in (record.student, record.student_class, record.subject) if part)}"
+            response += f" — 📝 {record.note}\n" if record.note else "\n"
+    if errors:
+        response += "\n❌ Не записаны строки:\n" + "\n".join(errors)
+        response += "\n\nФормат: Фамилия Имя Класс Предмет / примечания"
+    return response.strip()
+
+
+def _process_single(teacher_name, records, errors, chat_id, message_key):
+    if errors:
+        return errors[0][2]
+    if not records:
+        return FORMAT_HELP
+    ready, questions = _resolve(teacher_name, [(records[0][1], message_key)])
+    if questions:
+        return _ask(teacher_name, questions, chat_id)
+    record, _ = ready[0]
+    _save(teacher_name, [record], chat_id, [message_key])
+    return _single_reply(record)
+
+
+def _process_bulk(teacher_name, records, errors, date, chat_id, message_key):
+    # Для строки с ошибкой достаточно первой строки подсказки, без примеров
+    error_lines = [f"{number}. {line} — {error.splitlines()[0].lstrip('❌ ')}" for number, line, error in errors]
+    items = [(record, f"{message_key}:{number}" if message_key else None) for number, record in records]
+
+    ready, questions = _resolve(teacher_name, items)
+    if ready:
+        _save(teacher_name, [record for record, _ in ready], chat_id, [key for _, key in ready])
+
+    response = _bulk_reply([record for record, _ in ready], error_lines)
+    if questions:
+        response = (response + "\n\n" if response else "") + _ask(teacher_name, questions, chat_id)
+    return response
@@ -0,0 +1,205 @@
+import bisect
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Границы корзин гистограмм задержек, секунды
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# Преподаватель, для которого сейчас обрабатывается сообщение (метка для метрик)
+current_teacher = contextvars.ContextVar("current_teacher", default="")
+
+
+class Histogram:
+    """Гистограмма задержек с фиксированными корзинами, как в Prometheus"""
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(BUCKETS, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q):
+        """Оценка квантиля сверху: граница корзины, в которую он попал"""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for bound, n in zip(BUCKETS + (float("inf"),), self.counts):
+            seen += n
+            if seen >= rank:
+                return bound
+        return float("inf")
+
+
+def _labels_key(labels):
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _format_labels(key, extra=()):
+    items = list(key) + list(extra)
+    if not items:
+        return ""
+    escaped = ",".join('{}="{}"'.format(k, v.replace("\\", "\\\\").replace('"', '\\"')) for k, v in items)
+    return "{" + escaped + "}"
+
+
+class Metrics:
+    """
+    Счётчики и гистограммы задержек с метками.
+
+    Все вызовы Google Sheets и этапы обработки сообщения (авторизация, поиск
+    преподавателя, даты и строки, запись, ответ в Telegram) пишутся сюда.
+    Данные отдаются в текстовом формате Prometheus (render_prometheus) и
+    кратким отчётом для команды /stats (summary).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._histograms = {}
+        self._collectors = {}
+
+    def inc(self, name, value=1, **labels):
+        key = (name, _labels_key(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, seconds, **labels):
+        key = (name, _labels_key(labels))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram()
+            histogram.observe(seconds)
+
+    @contextmanager
+    def timer(self, name, **labels):
+        """Замеряет время блока и пишет его в гистограмму name"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started, **labels)
+
+    def stage(self, stage):
+        """Замеряет этап обработки сообщения для текущего преподавателя"""
+        return self.timer("bot_stage_seconds", stage=stage, teacher=current_teacher.get())
+
+    def register_collector(self, prefix, stats):
+        """Подключает stats() компонента: числовые значения отдаются как gauge prefix_ключ"""
+        with self._lock:
+            self._collectors[prefix] = stats
+
+    def _collect(self):
+        with self._lock:
+            collectors = list(self._collectors.items())
+        gauges = []
+        for prefix, stats in collectors:
+            try:
+                values = stats()
+            except Exception as e:
+                print(f"Ошибка сбора метрик {prefix}: {e}")
+                continue
+            for key, value in values.items():
+                if isinstance(value, (int, float)):
+                    gauges.append((f"{prefix}_{key}", float(value)))
+        return gauges
+
+    def render_prometheus(self):
+        """Все метрики в текстовом формате Prometheus"""
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted(self._histograms.items(), key=lambda item: item[0])
+        lines = []
+        seen = set()
+        for (name, key), value in counters:
+            if name not in seen:
+                lines.append(f"# TYPE {name} counter")
+                seen.add(name)
+            lines.append(f"{name}{_format_labels(key)} {value}")
+        for (name, key), histogram in histograms:
+            if name not in seen:
+                lines.append(f"# TYPE {name} histogram")
+                seen.add(name)
+            cumulative = 0
+            for bound, n in zip(BUCKETS, histogram.counts):
+                cumulative += n
+                lines.append(f"{name}_bucket{_format_labels(key, [('le', str(bound))])} {cumulative}")
+            lines.append(f"{name}_bucket{_format_labels(key, [('le', '+Inf')])} {histogram.count}")
+            lines.append(f"{name}_sum{_format_labels(key)} {histogram.sum}")
+            lines.append(f"{name}_count{_format_labels(key)} {histogram.count}")
+        for name, value in self._collect():
+            lines.append(f"# TYPE {name} gauge")
+            lines.append(f"{name} {value}")
+        return "\n".join(lines) + "\n"
+
+    def summary(self):
+        """Короткий текстовый отчёт: этапы без разбивки по преподавателям и вызовы API"""
+        with self._lock:
+            stages = {}
+            for (name, key), histogram in self._histograms.items():
+                if name != "bot_stage_seconds":
+                    continue
+                stage = dict(key).get("stage", "")
+                merged = stages.setdefault(stage, Histogram())
+                merged.counts = [a + b for a, b in zip(merged.counts, histogram.counts)]
+                merged.count += histogram.count
+                merged.sum += histogram.sum
+            api_calls = {}
+            for (name, key), value in self._counters.items():
+                if name == "sheets_api_requests_total":
+                    endpoint = dict(key).get("endpoint", "")
+                    api_calls[endpoint] = api_calls.get(endpoint, 0) + value
+
+        lines = ["📊 Этапы (количество, p50 / p99 сверху по корзинам):"]
+        for stage, histogram in sorted(stages.items()):
+            lines.append(
+                f"• {stage}: {histogram.count}, "
+                f"≤{histogram.quantile(0.5) * 1000:.0f} / ≤{histogram.quantile(0.99) * 1000:.0f} мс"
+            )
+        messages = stages.get("message")
+        total_calls = sum(api_calls.values())
+        lines.append(f"\n🌐 Запросы к Google API: {total_calls:.0f}")
+        if messages and messages.count:
+            lines.append(f"   на сообщение: {total_calls / messages.count:.2f}")
+        for endpoint, value in sorted(api_calls.items(), key=lambda item: -item[1]):
+            lines.append(f"• {endpoint}: {value:.0f}")
+        gauges = self._collect()
+        if gauges:
+            lines.append("\n⚙️ Компоненты:")
+            lines.extend(f"• {name}: {value:g}" for name, value in gauges)
+        return "\n".join(lines)
+
+
+metrics = Metrics()
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = metrics.render_prometheus().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_metrics_server(port, host="127.0.0.1"):
+    """Поднимает в фоне HTTP-сервер с /metrics для Prometheus"""
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    print(f"Метрики доступны на http://{host}:{port}/metrics")
+    return server
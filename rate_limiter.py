@@ -0,0 +1,204 @@
+import random
+import re
+import threading
+import time
+from http import HTTPStatus
+from urllib.parse import urlsplit
+import requests
+from gspread.exceptions import APIError
+from gspread.http_client import HTTPClient
+from config import SPREADSHEET_ID, SHEETS_READS_PER_MINUTE, SHEETS_WRITES_PER_MINUTE, SHEETS_BURST, SHEETS_MAX_RETRIES
+from metrics import metrics, current_teacher
+
+# Коды ответа, при которых запрос имеет смысл повторить
+RETRYABLE_CODES = {HTTPStatus.REQUEST_TIMEOUT, HTTPStatus.TOO_MANY_REQUESTS}
+
+
+class TokenBucket:
+    """Корзина токенов: per_minute запросов в минуту, не больше burst подряд"""
+
+    def __init__(self, per_minute, burst):
+        self.rate = per_minute / 60
+        self.capacity = max(1, burst)
+        self._tokens = float(self.capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Забирает токен, при необходимости ждёт. Возвращает время ожидания в секундах"""
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return waited
+                delay = (1 - self._tokens) / self.rate
+            time.sleep(delay)
+            waited += delay
+
+
+def is_retryable(error, kind="read"):
+    """
+    Можно ли повторить запрос после такой ошибки.
+
+    Запись (kind="write") повторяется, только если сервер её точно не
+    применил: 429, 5xx, превышение квоты или соединение не установлено.
+    После таймаута или обрыва ответа запись могла пройти, а повтор
+    appendCells или duplicateSheet добавил бы вторую строку или лист.
+    """
+    if isinstance(error, requests.exceptions.ConnectTimeout):
+        return True
+    if isinstance(error, (requests.exceptions.ConnectionError, requests.exceptions.Timeout)):
+        return kind == "read"
+    if not isinstance(error, APIError):
+        return False
+    if error.code >= HTTPStatus.INTERNAL_SERVER_ERROR:
+        return True
+    if error.code in RETRYABLE_CODES:
+        return kind == "read" or error.code == HTTPStatus.TOO_MANY_REQUESTS
+    # Drive API сообщает о превышении квоты кодом 403
+    errors = error.error.get("errors") or []
+    return error.code == HTTPStatus.FORBIDDEN and bool(errors) and errors[0].get("domain") == "usageLimits"
+
+
+class RateLimiter:
+    """
+    Общий ограничитель запросов к Google Sheets.
+
+    Чтения и записи берут токены из отдельных корзин, размер которых задан
+    квотами API, поэтому всплеск сообщений превращается в очередь, а не в
+    ошибки 429. Если Google всё же ответил 429 или 5xx, запрос повторяется с
+    экспоненциальной задержкой и случайным разбросом (или через Retry-After).
+    Записи после таймаута не повторяются — см. is_retryable.
+    """
+
+    def __init__(self, reads_per_minute=SHEETS_READS_PER_MINUTE, writes_per_minute=SHEETS_WRITES_PER_MINUTE,
+                 burst=SHEETS_BURST, max_retries=SHEETS_MAX_RETRIES, base_delay=1.0, max_delay=64.0):
+        self.buckets = {
+            "read": TokenBucket(reads_per_minute, burst),
+            "write": TokenBucket(writes_per_minute, burst),
+        }
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.retries = 0
+        self.throttled = 0
+        self.throttled_seconds = 0.0
+        self.failures = 0
+
+    def _backoff(self, attempt, error):
+        retry_after = None
+        response = getattr(error, "response", None)
+        if response is not None and getattr(response, "headers", None):
+            try:
+                retry_after = float(response.headers.get("Retry-After"))
+            except (TypeError, ValueError):
+                retry_after = None
+        if retry_after is not None:
+            return min(self.max_delay, retry_after)
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    def call(self, kind, func, *args, **kwargs):
+        """Выполняет func с учётом квоты kind ("read" или "write") и повторами"""
+        bucket = self.buckets[kind]
+        attempt = 0
+        while True:
+            waited = bucket.acquire()
+            with self._lock:
+                self.calls += 1
+                if waited:
+                    self.throttled += 1
+                    self.throttled_seconds += waited
+            try:
+                return func(*args, **kwargs)
+            except Exception as e:
+                if not is_retryable(e, kind) or attempt >= self.max_retries:
+                    with self._lock:
+                        self.failures += 1
+                    raise
+                delay = self._backoff(attempt, e)
+                print(f"Google Sheets: {e}; повтор через {delay:.1f} с")
+                with self._lock:
+                    self.retries += 1
+                time.sleep(delay)
+                attempt += 1
+
+    def stats(self):
+        """Счётчики для диагностики"""
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "retries": self.retries,
+                "throttled": self.throttled,
+                "throttled_seconds": round(self.throttled_seconds, 2),
+                "failures": self.failures,
+            }
+
+
+rate_limiter = RateLimiter()
+metrics.register_collector("sheets_rate_limiter", rate_limiter.stats)
+
+# Отдельные бюджеты для таблиц-шардов (см. sharding): запись в один шард не ждёт квоты другого
+_shard_limiters = {}
+_shard_limiters_lock = threading.Lock()
+
+
+def limiter_for(spreadsheet_id):
+    """RateLimiter таблицы: основная таблица и запросы к Drive используют общий rate_limiter"""
+    if not spreadsheet_id or spreadsheet_id == SPREADSHEET_ID:
+        return rate_limiter
+    with _shard_limiters_lock:
+        limiter = _shard_limiters.get(spreadsheet_id)
+        if limiter is None:
+            limiter = _shard_limiters[spreadsheet_id] = RateLimiter()
+        return limiter
+
+
+def shard_limiter_stats():
+    """Суммарные счётчики бюджетов шардов"""
+    with _shard_limiters_lock:
+        limiters = list(_shard_limiters.values())
+    total = {"shards": len(limiters)}
+    for limiter in limiters:
+        for key, value in limiter.stats().items():
+            total[key] = total.get(key, 0) + value
+    return total
+
+
+metrics.register_collector("sheets_shard_rate_limiter", shard_limiter_stats)
+
+
+def endpoint_label(url):
+    """Короткое имя метода API без идентификаторов и диапазонов: spreadsheets/values:batchGet"""
+    path = urlsplit(url).path
+    match = re.search(r"/spreadsheets/[^/:]+(.*)$", path)
+    if match:
+        return "spreadsheets" + re.sub(r"/values/[^:]+", "/values/{range}", match.group(1))
+    match = re.search(r"/files/[^/:]+(.*)$", path)
+    if match:
+        return "files" + match.group(1)
+    return path
+
+
+class RateLimitedHTTPClient(HTTPClient):
+    """HTTP-клиент gspread, который пропускает каждый запрос через бюджет его таблицы"""
+
+    def request(self, method, endpoint, *args, **kwargs):
+        kind = "read" if method.lower() == "get" else "write"
+        label = endpoint_label(endpoint)
+        match = re.search(r"/spreadsheets/([^/:?]+)", urlsplit(endpoint).path)
+        limiter = limiter_for(match.group(1) if match else None)
+
+        def send():
+            # Каждая попытка, включая повторы, — отдельный запрос к API
+            metrics.inc("sheets_api_requests_total", endpoint=label, method=method.upper(),
+                        teacher=current_teacher.get())
+            with metrics.timer("sheets_api_request_seconds", endpoint=label):
+                return super(RateLimitedHTTPClient, self).request(method, endpoint, *args, **kwargs)
+
+        return limiter.call(kind, send)
@@ -1,30 +1,68 @@
-from google_sheets import get_admin_sheet, create_teacher_sheet
+from google_sheets import get_admin_sheet, create_teacher_sheet, provision_teacher_sheet, sheet_lock
+from metrics import metrics
+from teacher_registry import teacher_registry
+from write_queue import append_cells_request
+from journal import journal, replayer
+from sharding import choose_spreadsheet
 from datetime import datetime
 
 def is_registered(telegram_id):
     """Проверяет, зарегистрирован ли преподаватель"""
-    sheet = get_admin_sheet()
-    all_values = sheet.get_all_values()
-    
-    # Начинаем чтение данных с 4-й строки (индекс 3)
-    for i in range(3, len(all_values)):
-        row = all_values[i]
-        if len(row) > 2 and str(row[2]).strip() == str(telegram_id).strip():
-            return True
-    return False
+    with metrics.stage("registry_lookup"):
+        return teacher_registry.get_by_id(telegram_id) is not None
 
 def get_teacher_name_by_id(telegram_id):
     """Получает ФИО преподавателя по Telegram ID"""
-    sheet = get_admin_sheet()
-    all_values = sheet.get_all_values()
-    
-    # Начинаем чтение данных с 4-й строки (индекс 3)
-    for i in range(3, len(all_values)):
-        row = all_values[i]
-        if len(row) > 2 and str(row[2]).strip() == str(telegram_id).strip():
-            return row[0].strip() if len(row) > 0 else None
-    return None
+    with metrics.stage("registry_lookup"):
+        info = teacher_registry.get_by_id(telegram_id)
+    return info["ФИО"] if info else None
  
+def _teacher_row(data):
+    """Строка листа "Преподаватели" и запись для индекса по данным регистрации"""
+    values = [data.get("ФИО", ""), data.get("Номер телефона", ""), data.get("Телеграмм id", ""), data.get("Username", ""), data.get("Предмет", ""), data.get("Классы", ""), data.get("Дата регистрации", ""), data.get("Таблица", "")]
+    info = {
+        "ФИО": values[0],
+        "Телефон": values[1],
+        "Telegram ID": str(values[2]),
+        "Username": values[3],
+        "Предмет": values[4],
+        "Классы": values[5],
+        "Дата регистрации": values[6],
+        "Таблица": values[7],
+    }
+    return values, info
+
+
+def _prepare(data):
+    """Дата регистрации и таблица-шард, в которой будет лист преподавателя"""
+    data["Дата регистрации"] = datetime.now().strftime("%d.%m.%Y")
+    data.setdefault("Таблица", choose_spreadsheet(
+        data.get("Телеграмм id", ""), data.get("Предмет", ""), data.get("Классы", "")
+    ))
+
+
+def _provision(values, info):
+    """Записывает строку преподавателя и создаёт его вкладку"""
+    # Строка преподавателя и его вкладка по шаблону создаются одним запросом
+    try:
+        with sheet_lock(info["ФИО"]):
+            provision_teacher_sheet(info, admin_values=values)
+        return
+    except Exception as e:
+        # Например, вкладка с таким ФИО уже есть — записываем строку отдельно
+        print(f"Не удалось создать вкладку вместе с регистрацией {info['ФИО']}: {e}")
+    # Пакет мог выполниться, а ответ потеряться (повтор тогда падает на "лист уже есть"):
+    # перечитываем лист, чтобы не добавить вторую строку того же преподавателя
+    teacher_registry.refresh()
+    if not teacher_registry.has_row(info["ФИО"], info["Telegram ID"]):
+        admin_sheet = get_admin_sheet()
+        admin_sheet.spreadsheet.batch_update({"requests": [append_cells_request(admin_sheet, [values])]})
+        teacher_registry.add(info)
+    # Создаем персональную вкладку преподавателя, если её ещё нет
+    if not create_teacher_sheet(info["ФИО"]):
+        raise RuntimeError(f"не удалось создать вкладку {info['ФИО']}")
+
+
 def register_teacher(data: dict):
     """
     Регистрирует нового преподавателя
@@ -38,30 +76,56 @@ def register_teacher(data: dict):
         "Классы": "начальные, средние",
     }
     """
-    sheet = get_admin_sheet()
-    data["Дата регистрации"] = datetime.now().strftime("%d.%m.%Y")
-    
-    # Добавляем запись в таблицу преподавателей. Данные начинаются с 4-й строки.
-    values = [data.get("ФИО", ""), data.get("Номер телефона", ""), data.get("Телеграмм id", ""), data.get("Username", ""), data.get("Предмет", ""), data.get("Классы", ""), data.get("Дата регистрации", "")]
-    existing = sheet.get_all_values()
-    
-    # Находим первую пустую строку начиная с 4-й
-    insert_row_index = 4
-    for i in range(3, len(existing)):  # Начинаем с индекса 3 (4-я строка)
-        if len(existing[i]) == 0 or not existing[i][0].strip():  # Если строка пустая
-            insert_row_index = i + 1  # gspread использует 1-based индексы
-            break
-    else:
-        # Если все строки заполнены, добавляем в конец
-        insert_row_index = len(existing) + 1
-    
-    # Используем insert_row только если нужно вставить в середину, иначе append_row
-    if insert_row_index <= len(existing):
-        sheet.insert_row(values, index=insert_row_index)
-    else:
-        sheet.append_row(values)
-    
-    # Создаем персональную вкладку преподавателя
-    create_teacher_sheet(data["ФИО"])
-    
+    _prepare(data)
+    values, info = _teacher_row(data)
+    try:
+        _provision(values, info)
+    except RuntimeError as e:
+        print(f"Ошибка создания листа для {info['ФИО']}: {e}")
+
+    # Обновляем индекс сразу, чтобы следующее сообщение не ждало перечитывания листа
+    teacher_registry.add(info)
+    return True
+
+
+def enqueue_registration(data: dict, chat_id=None):
+    """
+    Быстрая регистрация: преподаватель сохраняется в журнал и сразу считается
+    зарегистрированным, а строка в "Преподаватели" и вкладка создаются в фоне
+    (см. complete_registration). Его занятия ждут в журнале, пока вкладка
+    не появится.
+    """
+    _prepare(data)
+    values, info = _teacher_row(data)
+    journal.add_registration(info["ФИО"], data, chat_id=chat_id)
+    teacher_registry.add(info, pending=True)
+    replayer.wake()
     return True
+
+
+def complete_registration(data, retry=False):
+    """
+    Фоновая часть регистрации: строка преподавателя и его вкладка.
+
+    retry=True — прошлая попытка могла записать строку, но не получить
+    ответ, поэтому сначала проверяем лист, чтобы не добавить строку дважды.
+    """
+    values, info = _teacher_row(data)
+    if retry:
+        teacher_registry.refresh()
+        if teacher_registry.has_row(info["ФИО"], info["Telegram ID"]):
+            if not create_teacher_sheet(info["ФИО"]):
+                raise RuntimeError(f"не удалось создать вкладку {info['ФИО']}")
+            return
+    _provision(values, info)
+
+
+def abandon_registration(data):
+    """Регистрация не удалась: преподаватель снова должен пройти регистрацию"""
+    teacher_registry.discard(data.get("ФИО", ""))
+
+
+def restore_pending_registrations():
+    """После перезапуска возвращает в индекс преподавателей, чьи регистрации ещё в очереди"""
+    for record in journal.pending_registrations():
+        teacher_registry.add(_teacher_row(record["data"])[1], pending=True)
@@ -0,0 +1,32 @@
+import zlib
+from config import SPREADSHEET_IDS, SHARD_STRATEGY
+
+# Группы классов в порядке, в котором они предлагаются при регистрации
+CLASS_BANDS = ("начальные", "средние", "старшие")
+
+
+def _bucket(value, count):
+    """Стабильный номер шарда: одинаковый между перезапусками и копиями бота"""
+    return zlib.crc32(str(value).strip().lower().encode()) % count
+
+
+def choose_spreadsheet(telegram_id, subject="", classes="", shards=SPREADSHEET_IDS, strategy=SHARD_STRATEGY):
+    """
+    Выбирает таблицу для листа нового преподавателя.
+
+    hash — по Telegram ID (равномерно), subject — все преподаватели одного
+    предмета в одной таблице, classes — по группе классов. Выбор сохраняется
+    в колонке "Таблица" листа "Преподаватели", поэтому смена стратегии или
+    списка шардов не переносит уже созданные листы. Пустая строка (один шард
+    или колонка не заполнена) — основная таблица SPREADSHEET_ID.
+    """
+    if len(shards) <= 1:
+        return ""
+    if strategy == "subject" and subject:
+        index = _bucket(subject, len(shards))
+    elif strategy == "classes" and classes:
+        bands = [i for i, band in enumerate(CLASS_BANDS) if band in str(classes).lower()]
+        index = (bands[0] if bands else _bucket(classes, len(shards))) % len(shards)
+    else:
+        index = _bucket(telegram_id, len(shards))
+    return shards[index]
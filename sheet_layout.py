@@ -0,0 +1,248 @@
+import threading
+from calendar_index import calendar_for
+from student_index import StudentIndex
+
+# Даты находятся в 7-й строке, ученики начинаются с 8-й
+DATE_ROW = 7
+FIRST_STUDENT_ROW = 8
+
+
+def student_key(student_name, student_class="", subject=""):
+    """Формирует полное имя для колонки A: "Фамилия Имя Класс Предмет" """
+    name_parts = [student_name]
+    if student_class:
+        name_parts.append(student_class)
+    if subject:
+        name_parts.append(subject)
+    return " ".join(name_parts)
+
+
+def split_student_key(key):
+    """
+    Обратное к student_key: (ученик, класс, предмет) для имени из колонки A.
+
+    Если имя не раскладывается так, чтобы student_key собрал его обратно
+    (лишние пробелы, нет класса), всё имя возвращается как ученик.
+    """
+    parts = key.split()
+    if len(parts) >= 3 and parts[2].isdigit():
+        split = (" ".join(parts[:2]), parts[2], " ".join(parts[3:]))
+        if student_key(*split) == key:
+            return split
+    return key, "", ""
+
+
+class SheetLayout:
+    """
+    Разметка листа преподавателя в памяти.
+
+    Хранит календарь дат из 7-й строки (общий для листов с одинаковыми датами,
+    см. calendar_index), строку для каждого ученика
+    из колонки A (с 8-й строки) и свободные строки для новых учеников. При
+    загрузке читаются только эти два диапазона (одним batch_get), поэтому
+    объём чтения не зависит от числа уже проставленных отметок. Дальше
+    разметка обновляется на каждой записи, так что обычная отметка не делает
+    ни одного чтения. При ошибке
+    записи или расхождении с листом разметку нужно сбросить через invalidate().
+    """
+
+    def __init__(self, sheet):
+        self.sheet = sheet
+        self.lock = threading.RLock()
+        self.loaded = False
+        self.calendar = calendar_for([])
+        self._date_row = ()
+        self.student_rows = {}
+        self.index = StudentIndex()
+        self._free_rows = []
+        self._end_row = FIRST_STUDENT_ROW
+
+    def load(self):
+        """Читает строку дат и колонку A и строит разметку заново"""
+        dates, names = self.sheet.batch_get([f"{DATE_ROW}:{DATE_ROW}", f"A{FIRST_STUDENT_ROW}:A"])
+        self.load_ranges(dates[0] if dates else [], names)
+
+    def load_ranges(self, date_row, names):
+        """
+        Строит разметку из уже прочитанных диапазонов: строки дат и колонки A с 8-й строки.
+
+        Так разметку всех листов можно заполнить одним пакетным чтением при
+        старте (см. google_sheets.preload_layouts).
+        """
+        names = [row[0] if row else "" for row in names]
+        with self.lock:
+            self._fill(date_row, names, FIRST_STUDENT_ROW + len(names))
+
+    def _fill(self, date_row, names, end_row):
+        # Google не возвращает пустые строки в конце диапазона: после последнего ученика всё свободно
+        if not date_row:
+            print(f"Недостаточно строк для поиска дат (ожидается минимум {DATE_ROW})")
+
+        self.calendar = calendar_for(date_row)
+        self._date_row = _trimmed(date_row)
+
+        self.student_rows = {}
+        self.index.clear()
+        self._free_rows = []
+        for row_num, name in enumerate(names, start=FIRST_STUDENT_ROW):
+            if not name:
+                self._free_rows.append(row_num)
+            else:
+                self.student_rows.setdefault(name, row_num)
+                self.index.add(name, row_num)
+        self._end_row = end_row
+        self.loaded = True
+
+    def ensure_loaded(self):
+        with self.lock:
+            if not self.loaded:
+                self.load()
+
+    def invalidate(self):
+        """Помечает разметку устаревшей — следующий запрос перечитает лист"""
+        with self.lock:
+            self.loaded = False
+
+    def matches(self, date_row, names):
+        """
+        Совпадает ли разметка с прочитанными диапазонами (строка дат, колонка A с 8-й строки).
+
+        Расхождение — другая строка дат или имя на листе не в той строке, где
+        его ждёт разметка (строки вставили, удалили, ученика переименовали).
+        Строки, выданные новым ученикам, но ещё пустые на листе, расхождением
+        не считаются: их запись может быть в очереди. Не загруженная разметка
+        совпадает всегда — сбрасывать нечего.
+        """
+        with self.lock:
+            if not self.loaded:
+                return True
+            if _trimmed(date_row) != self._date_row:
+                return False
+            seen = set()
+            for row_num, row in enumerate(names, start=FIRST_STUDENT_ROW):
+                name = row[0] if row else ""
+                if not name or name in seen:
+                    continue  # у повторного имени разметка помнит первую строку
+                seen.add(name)
+                if self.student_rows.get(name) != row_num:
+                    return False
+            return True
+
+    def date_column(self, target_date):
+        """Колонка для даты (1-based) или None"""
+        with self.lock:
+            self.ensure_loaded()
+            return self.calendar.column(target_date)
+
+    def student_row(self, key):
+        """Строка ученика (1-based) или None; регистр, ё/е и лишние пробелы не важны"""
+        with self.lock:
+            self.ensure_loaded()
+            row_num = self.student_rows.get(key)
+            if row_num is None:
+                match = self.index.match(key)
+                if match.status == "exact":
+                    row_num = match.row
+            return row_num
+
+    def match_student(self, key):
+        """Ближайший ученик листа для ключа (student_index.StudentMatch)"""
+        with self.lock:
+            self.ensure_loaded()
+            return self.index.match(key)
+
+    def reserve_row(self, key):
+        """Выдаёт первую свободную строку под нового ученика и запоминает её"""
+        with self.lock:
+            self.ensure_loaded()
+            if self._free_rows:
+                row_num = self._free_rows.pop(0)
+            else:
+                row_num = self._end_row
+                self._end_row += 1
+            self.student_rows[key] = row_num
+            self.index.remove(key)
+            self.index.add(key, row_num)
+            return row_num
+
+    def claim_rows(self, keys, attempts=3):
+        """
+        Выдаёт строки новым ученикам и проверяет, что их не занял другой процесс.
+
+        Строки берутся из разметки, затем одним запросом читаются их ячейки A.
+        Если там уже чужое имя (лист дописали другой копией бота или вручную),
+        строка запоминается за тем учеником и выдаётся следующая. Возвращает
+        словарь ключ → строка; ключи, не получившие строку за attempts
+        попыток, в него не попадают.
+        """
+        with self.lock:
+            claimed = {}
+            pending = {key: self.reserve_row(key) for key in keys}
+            for _ in range(attempts):
+                if not pending:
+                    break
+                checks = list(pending.items())
+                values = self.sheet.batch_get([f"A{row_num}" for _, row_num in checks])
+                pending = {}
+                for (key, row_num), value in zip(checks, values):
+                    occupant = value[0][0] if value and value[0] else ""
+                    if occupant and occupant != key:
+                        self.student_rows.setdefault(occupant, row_num)
+                        self.index.add(occupant, row_num)
+                        pending[key] = self.reserve_row(key)
+                    else:
+                        claimed[key] = row_num
+            for key in pending:
+                # Строку так и не удалось занять — следующая запись перечитает лист
+                self.student_rows.pop(key, None)
+                self.index.remove(key)
+                self.loaded = False
+            return claimed
+
+
+def _trimmed(date_row):
+    row = list(date_row)
+    while row and not row[-1]:
+        row.pop()
+    return tuple(row)
+
+
+_layouts = {}
+_layouts_lock = threading.Lock()
+
+
+def _layout_key(sheet):
+    # sheetId уникален только внутри таблицы, а листы могут лежать в разных таблицах-шардах
+    return getattr(sheet, "spreadsheet_id", None), sheet.id
+
+
+def get_layout(sheet):
+    """Возвращает общую разметку для листа (одну на процесс)"""
+    key = _layout_key(sheet)
+    with _layouts_lock:
+        layout = _layouts.get(key)
+        if layout is None:
+            layout = SheetLayout(sheet)
+            _layouts[key] = layout
+        return layout
+
+
+def invalidate_layout(sheet):
+    """Сбрасывает разметку листа, если она уже была загружена"""
+    with _layouts_lock:
+        layout = _layouts.get(_layout_key(sheet))
+    if layout is not None:
+        layout.invalidate()
+
+
+def loaded_layouts(spreadsheet_id):
+    """Загруженные разметки листов одной таблицы"""
+    with _layouts_lock:
+        layouts = [layout for (key, _), layout in _layouts.items() if key == spreadsheet_id]
+    return [layout for layout in layouts if layout.loaded]
+
+
+def clear_layouts():
+    """Забывает все разметки (например, при смене клиента)"""
+    with _layouts_lock:
+        _layouts.clear()
@@ -0,0 +1,59 @@
+import asyncio
+import contextvars
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from config import SHEETS_MAX_WORKERS
+from metrics import metrics
+
+
+class SheetsGateway:
+    """
+    Выполняет синхронные вызовы gspread в ограниченном пуле потоков.
+
+    Обработчики бота делают `await gateway.run(func, ...)`, поэтому медленный
+    ответ Google не блокирует цикл событий python-telegram-bot: опрос и ответы
+    продолжают работать, пока записи в таблицу идут в фоне. Одновременно
+    выполняется не больше max_workers вызовов, остальные ждут в очереди.
+    """
+
+    def __init__(self, max_workers=SHEETS_MAX_WORKERS):
+        self.max_workers = max_workers
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="sheets")
+        self._lock = threading.Lock()
+        self._pending = 0
+
+    async def run(self, func, *args, **kwargs):
+        """Выполняет func(*args, **kwargs) в пуле и возвращает результат"""
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            self._pending += 1
+        try:
+            # Контекст (например, текущий преподаватель для метрик) переносим в поток пула
+            context = contextvars.copy_context()
+            call = functools.partial(context.run, func, *args, **kwargs)
+            return await loop.run_in_executor(self._executor, call)
+        finally:
+            with self._lock:
+                self._pending -= 1
+
+    def queue_depth(self):
+        """Сколько вызовов ждут свободного потока"""
+        with self._lock:
+            return max(0, self._pending - self.max_workers)
+
+    def stats(self):
+        """Счётчики для диагностики"""
+        with self._lock:
+            return {
+                "max_workers": self.max_workers,
+                "in_flight": min(self._pending, self.max_workers),
+                "queue_depth": max(0, self._pending - self.max_workers),
+            }
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait)
+
+
+gateway = SheetsGateway()
+metrics.register_collector("sheets_gateway", gateway.stats)
@@ -0,0 +1,185 @@
+import re
+from collections import Counter
+from subjects import SUBJECT_ALIASES
+
+# Сколько лучших по триграммам кандидатов проверять расстоянием редактирования
+MAX_CANDIDATES = 10
+# Единственный кандидат, отличающийся не больше чем на столько, — "close" (вариант для вопроса первым)
+AUTO_DISTANCE = 1
+
+
+def normalize_name(text):
+    """Ключ для сравнения: без регистра, ё как е, одиночные пробелы"""
+    return " ".join(text.casefold().replace("ё", "е").split())
+
+
+_DIGITS = re.compile(r"\d+")
+# "фамилия имя 5 англ яз": всё после номера класса — предмет
+_KEY_SUBJECT = re.compile(r"^(.*?)\s(\d+)\s(.+)$")
+
+
+def match_key(name):
+    """
+    Ключ ученика в индексе: normalize_name, класс без ведущих нулей и предмет
+    из subjects.SUBJECTS.
+
+    "Петров Петр 05 англ" и "петров петр 5 английский" дают один ключ —
+    сокращение в сообщении находит строку с полным названием и наоборот.
+    """
+    key = normalize_name(name)
+    match = _KEY_SUBJECT.match(key)
+    if match is None:
+        return key
+    name, student_class, subject = match.groups()
+    return f"{name} {int(student_class)} {SUBJECT_ALIASES.get(subject, subject)}"
+
+
+def _trigrams(text):
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def edit_distance(a, b, limit):
+    """
+    Расстояние Дамерау — Левенштейна (перестановка соседних букв — одна правка).
+
+    Считает только полосу шириной limit вокруг диагонали и не дальше limit:
+    если строки отличаются сильнее, возвращает limit + 1.
+    """
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    over = limit + 1
+    previous2 = None
+    previous = [j if j <= limit else over for j in range(len(b) + 1)]
+    for i in range(1, len(a) + 1):
+        current = [over] * (len(b) + 1)
+        if i <= limit:
+            current[0] = i
+        char_a = a[i - 1]
+        best = current[0]
+        for j in range(max(1, i - limit), min(len(b), i + limit) + 1):
+            char_b = b[j - 1]
+            # Сравнения вместо min(): это внутренний цикл поиска
+            value = previous[j] + 1
+            left = current[j - 1] + 1
+            if left < value:
+                value = left
+            diagonal = previous[j - 1] + (char_a != char_b)
+            if diagonal < value:
+                value = diagonal
+            if previous2 is not None and j > 1 and char_a == b[j - 2] and a[i - 2] == char_b:
+                if previous2[j - 2] + 1 < value:
+                    value = previous2[j - 2] + 1
+            current[j] = value
+            if value < best:
+                best = value
+        if best > limit:
+            return over
+        previous2, previous = previous, current
+    return min(previous[-1], over)
+
+
+class StudentMatch:
+    """
+    Результат поиска ученика.
+
+    status: "exact" — та же строка или отличие только в регистре, ё, пробелах
+    и записи предмета («англ» / «английский»);
+    "close" — единственный близкий ученик (опечатка в одну букву или
+    другой ученик: «Ким Ян» / «Ким Яна», «Иванов» / «Иванова»), candidates — [name];
+    "ambiguous" — похожие ученики есть, но нужен ответ преподавателя
+    (candidates — их имена по возрастанию расстояния); "none" — новый ученик.
+    """
+
+    __slots__ = ("status", "name", "row", "candidates")
+
+    def __init__(self, status, name=None, row=None, candidates=()):
+        self.status = status
+        self.name = name
+        self.row = row
+        self.candidates = list(candidates)
+
+
+class StudentIndex:
+    """
+    Индекс учеников одного листа для нечёткого поиска.
+
+    Имена из колонки A хранятся нормализованными (match_key) и
+    раскладываются по триграммам. Поиск берёт кандидатов с общими
+    триграммами и проверяет лучших из них расстоянием редактирования, так
+    что на листе в сотни учеников он занимает доли миллисекунды. Ученики
+    с другим номером класса похожими не считаются.
+    """
+
+    def __init__(self):
+        self._rows = {}
+        self._names = {}
+        self._classes = {}
+        self._trigrams = {}
+
+    def clear(self):
+        self._rows.clear()
+        self._names.clear()
+        self._classes.clear()
+        self._trigrams.clear()
+
+    def add(self, name, row):
+        """Добавляет ученика; при повторе нормализованного имени остаётся первая строка"""
+        key = match_key(name)
+        if not key or key in self._rows:
+            return
+        self._rows[key] = row
+        self._names[key] = name
+        self._classes[key] = _DIGITS.findall(key)
+        for trigram in _trigrams(key):
+            self._trigrams.setdefault(trigram, set()).add(key)
+
+    def remove(self, name):
+        key = match_key(name)
+        if self._rows.pop(key, None) is None:
+            return
+        del self._names[key]
+        del self._classes[key]
+        for trigram in _trigrams(key):
+            keys = self._trigrams.get(trigram)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._trigrams[trigram]
+
+    def match(self, name):
+        """Лучшее совпадение для имени (StudentMatch)"""
+        key = match_key(name)
+        row = self._rows.get(key)
+        if row is not None:
+            return StudentMatch("exact", self._names[key], row)
+
+        trigrams = _trigrams(key)
+        shared = Counter()
+        for trigram in trigrams:
+            shared.update(self._trigrams.get(trigram, ()))
+        limit = max(2, len(key) // 8)
+        # Одна правка меняет не больше трёх триграмм: у далёких имён общих слишком мало
+        needed = len(trigrams) - 3 * limit
+        scored = []
+        classes = _DIGITS.findall(key)
+        for candidate, count in shared.most_common(MAX_CANDIDATES):
+            if count < needed:
+                break
+            if self._classes[candidate] != classes:
+                continue  # другой класс — другой ученик, а не опечатка
+            distance = edit_distance(key, candidate, limit)
+            if distance <= limit:
+                scored.append((distance, candidate))
+        if not scored:
+            return StudentMatch("none")
+        scored.sort()
+        best_distance, best = scored[0]
+        if best_distance <= AUTO_DISTANCE and (len(scored) == 1 or scored[1][0] > limit // 2 + 1):
+            return StudentMatch("close", self._names[best], self._rows[best], [self._names[best]])
+        return StudentMatch(
+            "ambiguous", self._names[best], self._rows[best], [self._names[c] for _, c in scored]
+        )
+
+    def __len__(self):
+        return len(self._rows)
@@ -0,0 +1,24 @@
+# Предметы так, как их пишет бот в колонку A (одним словом, как раньше), и их сокращения.
+# Пишутся строчными и через "е": так их ищут после student_index.normalize_name
+SUBJECTS = {
+    "математика": ("матем", "мат", "математика и алгебра"),
+    "алгебра": (),
+    "геометрия": ("геом",),
+    "физика": ("физ",),
+    "химия": ("хим",),
+    "биология": ("био", "биол"),
+    "информатика": ("инф", "информ"),
+    "русский": ("русский язык", "рус", "русск", "рус яз", "русяз"),
+    "литература": ("лит", "литра"),
+    "чтение": ("литературное чтение",),
+    "английский": ("английский язык", "англ", "англ яз", "английский яз"),
+    "немецкий": ("немецкий язык", "нем"),
+    "французский": ("французский язык", "франц", "фр"),
+    "история": ("ист",),
+    "обществознание": ("общество", "общ"),
+    "география": ("геогр", "гео"),
+    "логопедия": ("логопед",),
+}
+
+# Сокращение или полное название → предмет из SUBJECTS
+SUBJECT_ALIASES = {alias: subject for subject, aliases in SUBJECTS.items() for alias in (subject,) + aliases}
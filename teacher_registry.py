@@ -0,0 +1,171 @@
+import threading
+import time
+from config import TEACHER_REGISTRY_TTL
+from google_sheets import get_admin_sheet
+
+# Данные преподавателей начинаются с 4-й строки (индекс 3), колонки A–H
+FIRST_DATA_ROW = 4
+LAST_DATA_COLUMN = "H"
+
+
+def normalize_fio(fio):
+    """Приводит ФИО к виду для сравнения: без лишних пробелов и регистра"""
+    return " ".join(str(fio).split()).lower()
+
+
+def _row_to_info(row):
+    """Превращает строку листа «Преподаватели» в словарь как у get_teacher_info"""
+    return {
+        "ФИО": row[0].strip() if len(row) > 0 else "",
+        "Телефон": row[1] if len(row) > 1 else "",
+        "Telegram ID": row[2] if len(row) > 2 else "",
+        "Username": row[3] if len(row) > 3 else "",
+        "Предмет": row[4] if len(row) > 4 else "",
+        "Классы": row[5] if len(row) > 5 else "",
+        "Дата регистрации": row[6] if len(row) > 6 else "",
+        "Таблица": row[7].strip() if len(row) > 7 else "",  # ID таблицы-шарда с листом преподавателя
+    }
+
+
+class TeacherRegistry:
+    """
+    Индекс листа «Преподаватели» в памяти.
+
+    Лист читается один раз и раскладывается в словари по Telegram ID и по
+    нормализованному ФИО. Индекс перечитывается, когда истёк ttl (секунды)
+    или после invalidate(); register_teacher дописывает в него новую запись
+    сразу, не дожидаясь перечитывания. Преподаватели, чья строка ещё не
+    записана в таблицу (регистрация в фоне), добавляются с pending=True и
+    сохраняются при перечитывании, пока на листе не появится строка с тем же
+    ФИО и Telegram ID (однофамилец с другим ID её не заменяет).
+    """
+
+    def __init__(self, loader=get_admin_sheet, ttl=TEACHER_REGISTRY_TTL):
+        self._loader = loader
+        self.ttl = ttl
+        self._lock = threading.RLock()
+        self._by_id = {}
+        self._by_fio = {}
+        self._pending = {}
+        self._on_sheet = set()
+        self._rows = None
+        self._loaded_at = None
+
+    def refresh(self, rows=None):
+        """
+        Перечитывает строки преподавателей (без заголовков) и перестраивает индекс.
+
+        rows — уже прочитанный диапазон A4:H (например, наблюдателем изменений),
+        тогда лист не читается.
+        """
+        if rows is None:
+            rows = self._loader().batch_get([f"A{FIRST_DATA_ROW}:{LAST_DATA_COLUMN}"])[0]
+        by_id, by_fio, on_sheet = {}, {}, set()
+        for row in rows:
+            if len(row) == 0 or not row[0].strip():  # Пропускаем пустые строки
+                continue
+            info = _row_to_info(row)
+            fio = normalize_fio(info["ФИО"])
+            by_fio[fio] = info
+            telegram_id = str(info["Telegram ID"]).strip()
+            on_sheet.add((fio, telegram_id))
+            if telegram_id:
+                by_id[telegram_id] = info
+        with self._lock:
+            for fio, info in list(self._pending.items()):
+                if (fio, str(info.get("Telegram ID", "")).strip()) in on_sheet:
+                    del self._pending[fio]  # строка уже на листе
+                    continue
+                by_fio[fio] = info
+                telegram_id = str(info.get("Telegram ID", "")).strip()
+                if telegram_id:
+                    by_id.setdefault(telegram_id, info)
+            self._by_id = by_id
+            self._by_fio = by_fio
+            self._on_sheet = on_sheet
+            self._rows = rows
+            self._loaded_at = time.monotonic()
+
+    def refresh_if_changed(self, rows):
+        """Перестраивает индекс по прочитанным строкам, если они отличаются от загруженных"""
+        with self._lock:
+            if self._loaded_at is not None and self._rows == rows:
+                self._loaded_at = time.monotonic()
+                return False
+        self.refresh(rows)
+        return True
+
+    def invalidate(self):
+        """Помечает индекс устаревшим — следующий запрос перечитает лист"""
+        with self._lock:
+            self._loaded_at = None
+
+    def _ensure_fresh(self):
+        with self._lock:
+            loaded_at = self._loaded_at
+        if loaded_at is None or time.monotonic() - loaded_at > self.ttl:
+            self.refresh()
+
+    def get_by_id(self, telegram_id):
+        """Возвращает данные преподавателя по Telegram ID или None"""
+        self._ensure_fresh()
+        with self._lock:
+            return self._by_id.get(str(telegram_id).strip())
+
+    def peek_by_id(self, telegram_id):
+        """Как get_by_id, но только по уже загруженному индексу — без запросов к таблице"""
+        with self._lock:
+            return self._by_id.get(str(telegram_id).strip())
+
+    def get_by_fio(self, fio):
+        """Возвращает данные преподавателя по ФИО (без учёта регистра) или None"""
+        self._ensure_fresh()
+        with self._lock:
+            return self._by_fio.get(normalize_fio(fio))
+
+    def add(self, info, pending=False):
+        """
+        Добавляет в индекс только что зарегистрированного преподавателя.
+
+        pending=True — строка на листе ещё не записана: запись переживёт
+        перечитывание индекса, пока строка не появится.
+        """
+        info = dict(info)
+        fio = normalize_fio(info["ФИО"])
+        with self._lock:
+            self._by_fio[fio] = info
+            telegram_id = str(info.get("Telegram ID", "")).strip()
+            if telegram_id:
+                self._by_id[telegram_id] = info
+            if pending:
+                self._pending[fio] = info
+
+    def is_pending(self, fio):
+        """True, если строки преподавателя на листе ещё нет (по последнему чтению)"""
+        with self._lock:
+            return normalize_fio(fio) in self._pending
+
+    def has_row(self, fio, telegram_id):
+        """True, если на листе есть строка с этими ФИО и Telegram ID (по последнему чтению)"""
+        with self._lock:
+            return (normalize_fio(fio), str(telegram_id).strip()) in self._on_sheet
+
+    def discard(self, fio):
+        """Убирает преподавателя, чья фоновая регистрация не удалась"""
+        fio = normalize_fio(fio)
+        with self._lock:
+            info = self._pending.pop(fio, None)
+            if info is None:
+                return
+            self._by_fio.pop(fio, None)
+            telegram_id = str(info.get("Telegram ID", "")).strip()
+            if self._by_id.get(telegram_id) is info:
+                del self._by_id[telegram_id]
+
+    def __len__(self):
+        self._ensure_fresh()
+        with self._lock:
+            return len(self._by_fio)
+
+
+teacher_registry = TeacherRegistry()
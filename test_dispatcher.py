@@ -0,0 +1,106 @@
+import asyncio
+
+import pytest
+from starlette.testclient import TestClient
+
+from dispatcher import KeyedUpdateProcessor
+from webhook import SECRET_HEADER, create_app
+
+
+class DummyUser:
+    def __init__(self, user_id):
+        self.id = user_id
+
+
+class DummyUpdate:
+    def __init__(self, user_id, number):
+        self.effective_user = DummyUser(user_id)
+        self.number = number
+
+
+class DummyApplication:
+    def __init__(self):
+        self.update_queue = asyncio.Queue()
+        self.bot = None
+
+
+def run_updates(processor, updates, delay=0.01):
+    """Обрабатывает обновления параллельно, как Application, и возвращает порядок завершения"""
+    done = []
+    running = {"now": 0, "max": 0}
+
+    async def handle(update):
+        running["now"] += 1
+        running["max"] = max(running["max"], running["now"])
+        await asyncio.sleep(delay)
+        running["now"] -= 1
+        done.append((update.effective_user.id, update.number))
+
+    async def main():
+        await asyncio.gather(*(processor.process_update(u, handle(u)) for u in updates))
+
+    asyncio.run(main())
+    return done, running["max"]
+
+
+def test_same_user_updates_run_in_order():
+    processor = KeyedUpdateProcessor(4)
+    updates = [DummyUpdate(1, n) for n in range(5)]
+
+    done, max_running = run_updates(processor, updates)
+
+    assert done == [(1, n) for n in range(5)]
+    assert max_running == 1
+    assert processor.stats()["active_keys"] == 0
+
+
+def test_different_users_run_in_parallel_despite_long_queue():
+    processor = KeyedUpdateProcessor(2)
+    # Длинная очередь первого пользователя не должна занять оба места в пуле
+    updates = [DummyUpdate(1, n) for n in range(5)] + [DummyUpdate(2, 0)]
+
+    done, max_running = run_updates(processor, updates)
+
+    assert max_running == 2
+    assert done.index((2, 0)) < done.index((1, 4))
+    assert [n for user, n in done if user == 1] == list(range(5))
+
+
+def test_webhook_checks_secret_and_queues_update():
+    application = DummyApplication()
+    client = TestClient(create_app(application, secret="s3cret", path="/telegram", webhook_url=""))
+    update = {"update_id": 7}
+
+    assert client.post("/telegram", json=update).status_code == 403
+    assert client.post("/telegram", json=update, headers={SECRET_HEADER: "wrong"}).status_code == 403
+    assert application.update_queue.empty()
+
+    assert client.post("/telegram", json=update, headers={SECRET_HEADER: "s3cret"}).status_code == 200
+    assert application.update_queue.get_nowait().update_id == 7
+
+
+def test_updates_for_same_sheet_are_ordered_across_users():
+    sheets = {1: "Иванов", 2: "Иванов", 3: "Петров"}
+
+    def keys(update):
+        user_id = update.effective_user.id
+        return [("user", user_id), ("sheet", sheets[user_id])]
+
+    processor = KeyedUpdateProcessor(4, key_func=keys)
+    updates = [DummyUpdate(1, 0), DummyUpdate(2, 1), DummyUpdate(1, 2), DummyUpdate(3, 3)]
+
+    done, max_running = run_updates(processor, updates)
+
+    # Пользователи 1 и 2 пишут в один лист — по порядку; лист Петрова — параллельно с ними
+    assert [n for user, n in done if user in (1, 2)] == [0, 1, 2]
+    assert done.index((3, 3)) < done.index((2, 1))
+    assert max_running == 2
+    assert processor.stats()["active_keys"] == 0
+
+
+def test_webhook_requires_secret_and_hides_metrics():
+    with pytest.raises(ValueError):
+        create_app(DummyApplication(), secret="", path="/telegram", webhook_url="")
+
+    client = TestClient(create_app(DummyApplication(), secret="s3cret", path="/telegram", webhook_url=""))
+    assert client.get("/metrics").status_code == 404
@@ -0,0 +1,470 @@
+import os
+import tempfile
+
+# Журнал занятий тестов — во временной папке, а не рядом с ботом
+os.environ.setdefault("JOURNAL_PATH", os.path.join(tempfile.mkdtemp(), "journal.db"))
+
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+import pytest
+import requests
+
+import google_sheets
+import registration
+import sheet_layout
+from fake_sheets import FakeClient, make_school_spreadsheet
+from google_sheets import NOTE_COLOR, MARK_COLOR, append_student, append_students
+from registration import register_teacher, is_registered, get_teacher_name_by_id
+from teacher_registry import teacher_registry
+
+TEACHER = {
+    "ФИО": "Тестовый Преподаватель QA",
+    "Номер телефона": "+79990000000",
+    "Телеграмм id": 999000111,
+    "Username": "qa_teacher",
+    "Предмет": "Математика",
+    "Классы": "средние",
+}
+
+
+@pytest.fixture
+def fake():
+    """Подключает бота к свежей подделке таблицы"""
+    client = FakeClient()
+    spreadsheet = make_school_spreadsheet(client, start=date(2025, 9, 1), days=60)
+    google_sheets.session.use_client(client, spreadsheet_id=spreadsheet.id)
+    sheet_layout.clear_layouts()
+    teacher_registry.invalidate()
+    return client, spreadsheet
+
+
+def test_register_creates_teacher_sheet(fake):
+    """Регистрация добавляет строку в "Преподаватели" и вкладку по шаблону"""
+    client, spreadsheet = fake
+    register_teacher(dict(TEACHER))
+
+    assert is_registered(TEACHER["Телеграмм id"])
+    assert get_teacher_name_by_id(TEACHER["Телеграмм id"]) == TEACHER["ФИО"]
+    sheet = spreadsheet._find(title=TEACHER["ФИО"])
+    assert sheet.rows[1][1] == TEACHER["ФИО"]
+    assert sheet.rows[2][1] == TEACHER["Номер телефона"]
+
+
+def test_append_student_writes_marks_and_colors(fake):
+    """Новый ученик получает строку, повторная отметка обновляет ту же строку"""
+    client, spreadsheet = fake
+    register_teacher(dict(TEACHER))
+
+    assert append_student(TEACHER["ФИО"], "Петров Петр", "5", "математика", "01.09.2025")
+    assert append_student(TEACHER["ФИО"], "Иванова Анна", "7", "физика", "02.09.2025", "опоздала")
+    assert append_student(TEACHER["ФИО"], "Петров Петр", "5", "математика", "02.09.2025", "болел")
+
+    sheet = spreadsheet._find(title=TEACHER["ФИО"])
+    assert sheet.rows[7][0] == "Петров Петр 5 математика"
+    assert sheet.rows[8][0] == "Иванова Анна 7 физика"
+    assert sheet.rows[7][2] == "да"
+    assert sheet.rows[7][3] == "болел"
+    assert sheet.colors[(8, 3)] == MARK_COLOR
+    assert sheet.colors[(9, 4)] == NOTE_COLOR
+
+
+def test_steady_state_mark_is_one_write(fake):
+    """Отметка уже известного ученика — ровно один запрос и ни одного чтения"""
+    client, spreadsheet = fake
+    register_teacher(dict(TEACHER))
+    append_student(TEACHER["ФИО"], "Петров Петр", "5", "математика", "01.09.2025")
+
+    client.reset_counters()
+    assert append_student(TEACHER["ФИО"], "Петров Петр", "5", "математика", "03.09.2025")
+    assert dict(client.calls) == {"batch_update": 1}
+
+
+def test_group_lesson_is_one_write(fake):
+    """Групповое занятие: новые и известные ученики записываются одним запросом"""
+    client, spreadsheet = fake
+    register_teacher(dict(TEACHER))
+    append_student(TEACHER["ФИО"], "Петров Петр", "5", "математика", "01.09.2025")
+
+    client.reset_counters()
+    results = append_students(TEACHER["ФИО"], [
+        ("Петров Петр", "5", "математика", "04.09.2025", ""),
+        ("Иванова Анна", "7", "физика", "04.09.2025", "опоздала"),
+        ("Сидоров Иван", "6", "химия", "01.01.2030", ""),
+    ])
+
+    assert results == [True, True, False]
+    assert client.calls["batch_update"] == 1
+    sheet = spreadsheet._find(title=TEACHER["ФИО"])
+    assert sheet.rows[8][0] == "Иванова Анна 7 физика"
+    assert sheet.rows[8][5] == "опоздала"
+
+
+def test_unknown_date_is_rejected(fake):
+    client, spreadsheet = fake
+    register_teacher(dict(TEACHER))
+    assert not append_student(TEACHER["ФИО"], "Петров Петр", "5", "математика", "01.01.2030")
+
+
+def test_concurrent_marks_do_not_duplicate_rows_or_sheets(fake):
+    """Параллельные отметки одного преподавателя: один лист и одна строка на ученика"""
+    client, spreadsheet = fake
+    register_teacher(dict(TEACHER))
+    # Лист удалён вручную — первые отметки создают его заново одновременно
+    spreadsheet.del_worksheet(spreadsheet._find(title=TEACHER["ФИО"]))
+    google_sheets.session.forget(TEACHER["ФИО"])
+
+    dates = [f"{day:02d}.09.2025" for day in range(1, 9)]
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        results = list(executor.map(
+            lambda d: append_student(TEACHER["ФИО"], "Петров Петр", "5", "математика", d), dates
+        ))
+
+    assert all(results)
+    sheets = [ws for ws in spreadsheet.worksheets() if ws.title == TEACHER["ФИО"]]
+    assert len(sheets) == 1
+    names = [row[0] for row in sheets[0].rows[7:] if row and row[0]]
+    assert names == ["Петров Петр 5 математика"]
+    assert sheets[0].rows[7][2:10] == ["да"] * 8
+
+
+def test_new_student_row_taken_by_another_writer_is_skipped(fake):
+    """Строку, которую занял другой процесс после загрузки разметки, бот не перезаписывает"""
+    client, spreadsheet = fake
+    register_teacher(dict(TEACHER))
+    append_student(TEACHER["ФИО"], "Петров Петр", "5", "математика", "01.09.2025")
+
+    sheet = spreadsheet._find(title=TEACHER["ФИО"])
+    sheet._set(8, 0, "Чужой Ученик 3 чтение")  # строка 9 занята другой копией бота
+    sheet._set(9, 1, "+79990000009")  # в строке 10 уже есть контакт — его нельзя затирать
+
+    client.reset_counters()
+    assert append_student(TEACHER["ФИО"], "Иванова Анна", "7", "физика", "02.09.2025")
+
+    assert sheet.rows[8][0] == "Чужой Ученик 3 чтение"
+    assert sheet.rows[9][:4] == ["Иванова Анна 7 физика", "+79990000009", "", "да"]
+    assert dict(client.calls) == {"batch_get": 2, "batch_update": 1}
+
+
+def test_new_student_row_is_released_after_write_timeout(fake, monkeypatch):
+    """Строка, выданная новому ученику, не остаётся занятой, если запись упала с таймаутом"""
+    client, spreadsheet = fake
+    register_teacher(dict(TEACHER))
+    batch_update = spreadsheet.batch_update
+    failures = [requests.exceptions.ReadTimeout("таймаут (fake)")]
+
+    def flaky_batch_update(body):
+        if failures:
+            raise failures.pop()
+        return batch_update(body)
+
+    monkeypatch.setattr(spreadsheet, "batch_update", flaky_batch_update)
+    assert append_student(TEACHER["ФИО"], "Петров Петр", "5", "математика", "01.09.2025")
+
+    sheet = spreadsheet._find(title=TEACHER["ФИО"])
+    assert sheet.rows[7][:3] == ["Петров Петр 5 математика", "", "да"]
+
+
+def test_prewarm_loads_registry_before_first_message(fake):
+    """После прогрева проверка регистрации не обращается к таблице"""
+    client, spreadsheet = fake
+    register_teacher(dict(TEACHER))
+    teacher_registry.invalidate()
+
+    timings = google_sheets.prewarm()
+    client.reset_counters()
+
+    assert list(timings) == ["auth", "spreadsheet", "registry", "layouts"]
+    assert is_registered(TEACHER["Телеграмм id"])
+    assert client.total_calls() == 0
+
+
+def test_preload_layouts_makes_first_mark_read_free(fake):
+    """После перезапуска и прогрева первая отметка — один запрос записи без чтений"""
+    client, spreadsheet = fake
+    second = dict(TEACHER, **{"ФИО": "Второй Преподаватель QA", "Телеграмм id": 999000222})
+    for teacher in (TEACHER, second):
+        register_teacher(dict(teacher))
+        append_student(teacher["ФИО"], "Петров Петр", "5", "математика", "01.09.2025")
+
+    # Перезапуск: кэши процесса пусты
+    google_sheets.session.use_client(client, spreadsheet_id=spreadsheet.id)
+    sheet_layout.clear_layouts()
+    teacher_registry.invalidate()
+
+    client.reset_counters()
+    google_sheets.prewarm()
+    assert client.calls["values_batch_get"] == 1
+    assert client.calls["worksheets"] == 1
+
+    client.reset_counters()
+    for teacher in (TEACHER, second):
+        assert append_student(teacher["ФИО"], "Петров Петр", "5", "математика", "02.09.2025")
+    assert dict(client.calls) == {"batch_update": 2}
+
+
+def test_registration_is_one_batch_update(fake):
+    """После прогрева регистрация — один запрос: строка, копия шаблона и B2:B3"""
+    client, spreadsheet = fake
+    google_sheets.prewarm()
+
+    client.reset_counters()
+    register_teacher(dict(TEACHER))
+    assert dict(client.calls) == {"batch_update": 1}
+
+    admin = spreadsheet._find(title="Преподаватели")
+    assert admin.rows[3][:3] == [TEACHER["ФИО"], TEACHER["Номер телефона"], str(TEACHER["Телеграмм id"])]
+    assert spreadsheet.worksheets()[-1].title == TEACHER["ФИО"]
+
+    teacher_registry.invalidate()
+    assert get_teacher_name_by_id(TEACHER["Телеграмм id"]) == TEACHER["ФИО"]
+
+
+def test_registration_with_lost_response_adds_one_admin_row(fake, monkeypatch):
+    """Пакет регистрации выполнен, но ответ потерян — запасной путь не дописывает вторую строку"""
+    client, spreadsheet = fake
+    provision = registration.provision_teacher_sheet
+
+    def provision_and_lose_response(*args, **kwargs):
+        provision(*args, **kwargs)
+        raise ConnectionError("ответ не получен")
+
+    monkeypatch.setattr(registration, "provision_teacher_sheet", provision_and_lose_response)
+    register_teacher(dict(TEACHER))
+
+    admin = spreadsheet._find(title="Преподаватели")
+    assert [row[0] for row in admin.rows[3:] if row and row[0]] == [TEACHER["ФИО"]]
+    assert get_teacher_name_by_id(TEACHER["Телеграмм id"]) == TEACHER["ФИО"]
+
+
+def test_background_registration_buffers_lessons(fake, tmp_path, monkeypatch):
+    """Регистрация отвечает без запросов к таблице, занятия ждут создания вкладки"""
+    from journal import Journal, JournalReplayer
+
+    client, spreadsheet = fake
+    journal = Journal(str(tmp_path / "journal.db"))
+    replayer = JournalReplayer(journal)
+    monkeypatch.setattr(registration, "journal", journal)
+    monkeypatch.setattr(registration, "replayer", replayer)
+
+    client.reset_counters()
+    registration.enqueue_registration(dict(TEACHER), chat_id=1)
+    journal.append_many([(TEACHER["ФИО"], "Петров Петр", "5", "математика", "01.09.2025", "")])
+    assert client.total_calls() == 0
+
+    # Индекс перечитан до появления строки на листе — преподаватель не теряется
+    teacher_registry.invalidate()
+    assert is_registered(TEACHER["Телеграмм id"])
+    assert journal.provisioning_teachers() == {TEACHER["ФИО"]}
+    assert journal.pending(skip_teachers=journal.provisioning_teachers()) == []
+
+    assert replayer.replay_once()
+    replayer.stop()
+
+    sheet = spreadsheet._find(title=TEACHER["ФИО"])
+    assert sheet.rows[7][:3] == ["Петров Петр 5 математика", "", "да"]
+    assert journal.pending() == [] and journal.pending_registrations() == []
+    teacher_registry.invalidate()
+    assert get_teacher_name_by_id(TEACHER["Телеграмм id"]) == TEACHER["ФИО"]
+    journal.close()
+
+
+def test_teacher_sheet_lives_in_shard(fake):
+    """Лист преподавателя создаётся в таблице-шарде, строка — в основной таблице"""
+    client, spreadsheet = fake
+    shard = make_school_spreadsheet(client, key="fake-shard", start=date(2025, 9, 1), days=60)
+
+    register_teacher(dict(TEACHER, **{"Таблица": "fake-shard"}))
+    teacher_registry.invalidate()
+    assert append_student(TEACHER["ФИО"], "Петров Петр", "5", "математика", "01.09.2025")
+
+    admin = spreadsheet._find(title="Преподаватели")
+    assert admin.rows[3][7] == "fake-shard"
+    assert TEACHER["ФИО"] not in [ws.title for ws in spreadsheet.worksheets()]
+    sheet = shard._find(title=TEACHER["ФИО"])
+    assert sheet.rows[1][1] == TEACHER["ФИО"]
+    assert sheet.rows[7][:3] == ["Петров Петр 5 математика", "", "да"]
+
+
+def test_choose_spreadsheet_strategies():
+    from sharding import choose_spreadsheet
+
+    shards = ["main", "second", "third"]
+    assert choose_spreadsheet(123, shards=["main"]) == ""
+    assert choose_spreadsheet(123, shards=shards) == choose_spreadsheet(123, shards=shards)
+    assert {choose_spreadsheet(i, shards=shards) for i in range(100)} == set(shards)
+    by_subject = {choose_spreadsheet(i, "Математика", shards=shards, strategy="subject") for i in range(20)}
+    assert len(by_subject) == 1
+    assert choose_spreadsheet(1, classes="старшие", shards=shards, strategy="classes") == "third"
+
+
+def test_archive_moves_past_term_to_archive_sheet(fake):
+    """Прошедшая четверть уходит в архивный лист, живой лист и шаблон начинаются с текущей"""
+    from archive import archive_terms, term_cutoff
+
+    client, spreadsheet = fake
+    register_teacher(dict(TEACHER))
+    append_student(TEACHER["ФИО"], "Петров Петр", "5", "математика", "02.09.2025", "болел")
+    append_student(TEACHER["ФИО"], "Петров Петр", "5", "математика", "05.10.2025")
+    cutoff = term_cutoff(date(2025, 10, 20), term_starts="01.09,01.10", keep_days=14)
+    assert cutoff == date(2025, 10, 1)
+
+    report = archive_terms(cutoff, dry_run=True)
+    assert [(entry["title"], entry["columns"], entry["marks"]) for entry in report] == [
+        (TEACHER["ФИО"], 30, 1), ("Шаблон", 30, 0),
+    ]
+    assert spreadsheet._find(title=TEACHER["ФИО"]).rows[6][2] == "01.09.2025"
+
+    archive_terms(cutoff, dry_run=False)
+    live = spreadsheet._find(title=TEACHER["ФИО"])
+    archived = spreadsheet._find(title=report[0]["archive"])
+    assert live.rows[6][2] == "01.10.2025"
+    assert live.rows[7][:2] == ["Петров Петр 5 математика", ""]
+    assert live.rows[7][6] == "да"
+    assert archived.rows[6][2:] == [f"{day:02d}.09.2025" for day in range(1, 31)]
+    assert archived.rows[7][3] == "болел"
+    assert archived.colors[(8, 4)] == NOTE_COLOR
+    assert spreadsheet._find(title="Шаблон").rows[6][2] == "01.10.2025"
+
+    # Следующая отметка попадает в сдвинутую колонку, повторный запуск ничего не делает
+    assert append_student(TEACHER["ФИО"], "Петров Петр", "5", "математика", "06.10.2025")
+    assert live.rows[7][7] == "да"
+    assert archive_terms(cutoff, dry_run=False) == []
+
+
+def test_change_watcher_invalidates_only_edited_sheets(fake, monkeypatch):
+    """Без изменений — один запрос к Drive; ручная правка сбрасывает только свой лист"""
+    from change_watcher import ChangeWatcher
+
+    client, spreadsheet = fake
+    second = dict(TEACHER, **{"ФИО": "Второй Преподаватель QA", "Телеграмм id": 999000222})
+    for teacher in (TEACHER, second):
+        register_teacher(dict(teacher))
+        append_student(teacher["ФИО"], "Петров Петр", "5", "математика", "01.09.2025")
+    first_layout = sheet_layout.get_layout(spreadsheet._find(title=TEACHER["ФИО"]))
+    second_layout = sheet_layout.get_layout(spreadsheet._find(title=second["ФИО"]))
+    watcher = ChangeWatcher(interval=0)
+    watcher.poll_once()
+
+    client.reset_counters()
+    assert watcher.poll_once() == 0
+    assert dict(client.calls) == {"get_lastUpdateTime": 1}
+
+    # Собственная запись бота меняет modifiedTime, но разметка совпадает с листом
+    append_student(TEACHER["ФИО"], "Петров Петр", "5", "математика", "02.09.2025")
+    assert watcher.poll_once() == 0
+    assert first_layout.loaded
+
+    # Администратор вставил ученика над Петровым и поправил телефон преподавателя
+    spreadsheet._find(title=TEACHER["ФИО"]).insert_row(["Новый Ученик 3"], index=8)
+    spreadsheet._find(title="Преподаватели").update("B4", [["+70000000000"]])
+
+    # Проверка упала — время изменения не запомнено, следующий опрос повторит её
+    monkeypatch.setattr(spreadsheet, "values_batch_get", lambda *args, **kwargs: 1 / 0)
+    assert watcher.poll_once() == 0
+    assert first_layout.loaded
+    monkeypatch.undo()
+
+    assert watcher.poll_once() == 1
+    assert not first_layout.loaded
+    assert second_layout.loaded
+    assert teacher_registry.get_by_fio(TEACHER["ФИО"])["Телефон"] == "+70000000000"
+
+    assert append_student(TEACHER["ФИО"], "Петров Петр", "5", "математика", "03.09.2025")
+    assert spreadsheet._find(title=TEACHER["ФИО"]).rows[8][4] == "да"
+
+
+def test_change_watcher_sees_admin_edit_followed_by_bot_write(fake):
+    """Правка администратора перед записью бота не теряется"""
+    from change_watcher import ChangeWatcher
+
+    client, spreadsheet = fake
+    register_teacher(dict(TEACHER))
+    append_student(TEACHER["ФИО"], "Петров Петр", "5", "математика", "01.09.2025")
+    layout = sheet_layout.get_layout(spreadsheet._find(title=TEACHER["ФИО"]))
+    watcher = ChangeWatcher(interval=0)
+    watcher.poll_once()
+
+    spreadsheet._find(title=TEACHER["ФИО"]).insert_row(["Новый Ученик 3"], index=8)
+    append_student(TEACHER["ФИО"], "Сидоров Иван", "6", "химия", "01.09.2025")
+
+    assert watcher.poll_once() == 1
+    assert not layout.loaded
+
+
+def test_lesson_for_misspelled_student_goes_to_existing_row(fake, tmp_path, monkeypatch):
+    """Регистр и ё исправляются сами, про похожих учеников бот спрашивает"""
+    import lessons
+    from journal import Journal, JournalReplayer
+
+    client, spreadsheet = fake
+    journal = Journal(str(tmp_path / "journal.db"))
+    replayer = JournalReplayer(journal)
+    monkeypatch.setattr(lessons, "journal", journal)
+    monkeypatch.setattr(lessons, "replayer", replayer)
+    # Сообщения приходят сегодняшним числом, а в подделке календарь осени 2025
+    monkeypatch.setattr(lessons, "has_date_column", lambda teacher, day: True)
+    register_teacher(dict(TEACHER))
+    append_students(TEACHER["ФИО"], [
+        ("Петров Пётр", "5", "математика", "01.09.2025", ""),
+        ("Петрова Анна", "5", "физика", "01.09.2025", ""),
+        ("Петрова Алла", "5", "физика", "01.09.2025", ""),
+        ("Ким Яна", "5", "химия", "01.09.2025", ""),
+    ])
+
+    reply = lessons.process_lesson_message(TEACHER["ФИО"], "петров петр 5 Математика / болел", message_key="1:1")
+    assert "Петров Пётр" in reply
+    reply = lessons.process_lesson_message(TEACHER["ФИО"], "Петрова Ана 5 физика", message_key="1:2")
+    assert reply.startswith("❓") and "Петрова Анна 5 физика" in reply
+    assert len(journal.pending()) == 1
+
+    assert "Петрова Анна" in lessons.process_lesson_message(TEACHER["ФИО"], "да", message_key="1:3")
+    records = [(r["student"], r["class"], r["subject"], r["note"]) for r in journal.pending()]
+    assert records == [("Петров Пётр", "5", "математика", "болел"), ("Петрова Анна", "5", "физика", "")]
+
+    # Одна буква — может быть другой ребёнок: тоже вопрос, а «нет» добавляет нового ученика
+    reply = lessons.process_lesson_message(TEACHER["ФИО"], "Ким Ян 5 химия", message_key="1:6")
+    assert reply.startswith("❓") and "Ким Яна 5 химия" in reply
+    assert "Ким Ян" in lessons.process_lesson_message(TEACHER["ФИО"], "нет", message_key="1:7")
+    assert journal.pending()[-1]["student"] == "Ким Ян"
+
+    # Новое занятие вместо ответа снимает вопрос, ученик не записывается молча
+    lessons.process_lesson_message(TEACHER["ФИО"], "Петрова Ала 5 физика", message_key="1:4")
+    reply = lessons.process_lesson_message(TEACHER["ФИО"], "Сидоров Иван 6 химия", message_key="1:5")
+    assert reply.startswith("⚠️") and len(journal.pending()) == 4
+    journal.close()
+
+
+def test_subject_abbreviation_finds_row_written_as_typed(fake, tmp_path, monkeypatch):
+    """Строка "…5 англ", записанная раньше как есть, находится и по "англ", и по полному названию"""
+    import lessons
+    from journal import Journal, JournalReplayer
+
+    client, spreadsheet = fake
+    journal = Journal(str(tmp_path / "journal.db"))
+    monkeypatch.setattr(lessons, "journal", journal)
+    monkeypatch.setattr(lessons, "replayer", JournalReplayer(journal))
+    monkeypatch.setattr(lessons, "has_date_column", lambda teacher, day: True)
+    register_teacher(dict(TEACHER))
+    append_students(TEACHER["ФИО"], [("Петров Петр", "5", "англ", "01.09.2025", "")])
+
+    lessons.process_lesson_message(TEACHER["ФИО"], "Петров Петр 5 англ", message_key="1:1")
+    lessons.process_lesson_message(TEACHER["ФИО"], "Петров Петр 5 английский язык", message_key="1:2")
+    assert [(r["student"], r["subject"]) for r in journal.pending()] == [("Петров Петр", "англ")] * 2
+    journal.close()
+
+
+def test_lesson_for_date_missing_on_sheet_is_rejected(fake, tmp_path, monkeypatch):
+    """Занятие на дату, которой нет на листе, не принимается в журнал"""
+    import lessons
+    from journal import Journal, JournalReplayer
+
+    journal = Journal(str(tmp_path / "journal.db"))
+    monkeypatch.setattr(lessons, "journal", journal)
+    monkeypatch.setattr(lessons, "replayer", JournalReplayer(journal))
+    register_teacher(dict(TEACHER))
+
+    # Сегодняшней даты в календаре подделки (осень 2025) нет
+    reply = lessons.process_lesson_message(TEACHER["ФИО"], "Петров Петр 5 математика", message_key="1:1")
+    assert reply.startswith("❌") and "нет колонки" in reply
+    assert journal.pending() == []
+    journal.close()
@@ -0,0 +1,162 @@
+import sqlite3
+import threading
+import time
+
+import pytest
+
+from journal import Journal, JournalReplayer
+
+LESSON = ("Тестовый Преподаватель", "Петров Петр", "5", "математика", "01.09.2025", "")
+
+
+class DummyConnection:
+    """Соединение SQLite, у которого первая вставка падает"""
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.failures = 1
+
+    def executemany(self, *args):
+        if self.failures:
+            self.failures -= 1
+            raise sqlite3.OperationalError("disk I/O error (dummy)")
+        return self.conn.executemany(*args)
+
+    def __getattr__(self, name):
+        return getattr(self.conn, name)
+
+
+class DummyWriter:
+    """Записывает занятия, кроме учеников из failing: для них отвечает неудачей"""
+
+    def __init__(self, failing=()):
+        self.failing = set(failing)
+        self.calls = []
+
+    def __call__(self, teacher, lessons):
+        self.calls.append((teacher, [lesson[0] for lesson in lessons]))
+        return [lesson[0] not in self.failing for lesson in lessons]
+
+
+def lesson(teacher="Тестовый Преподаватель", student="Петров Петр", date="01.09.2025", note=""):
+    return teacher, student, "5", "математика", date, note
+
+
+def test_journal_file_is_created_on_first_use(tmp_path):
+    path = tmp_path / "journal.db"
+    journal = Journal(str(path))
+    assert not path.exists()
+    assert journal.stats()["registrations_pending"] == 0
+    assert not path.exists()
+
+    journal.append(*LESSON)
+    assert path.exists()
+    journal.close()
+
+
+def test_concurrent_appends_share_commits(tmp_path):
+    journal = Journal(str(tmp_path / "journal.db"))
+    journal.open()
+    start = threading.Barrier(16)
+
+    def append(n):
+        start.wait()
+        journal.append(*lesson(student=f"Ученик {n}"))
+
+    threads = [threading.Thread(target=append, args=(n,)) for n in range(16)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(journal.pending()) == 16
+    # Потоки, пришедшие во время чужого коммита, попадают в следующую пачку
+    assert 1 <= journal.commits < 16
+    journal.close()
+
+
+def test_redelivered_message_is_stored_once(tmp_path):
+    journal = Journal(str(tmp_path / "journal.db"))
+    journal.append(*LESSON, key="100:7")
+    journal.append_many([LESSON, lesson(student="Иванова Анна")], keys=["100:7", "100:8"])
+
+    assert [record["key"] for record in journal.pending()] == ["100:7", "100:8"]
+    journal.close()
+
+
+def test_failed_commit_does_not_store_lessons_later(tmp_path):
+    journal = Journal(str(tmp_path / "journal.db"))
+    journal.open()
+    journal._conn = DummyConnection(journal._conn)
+
+    with pytest.raises(sqlite3.OperationalError):
+        journal.append(*LESSON, key="100:7")
+    # Вызывающий получил ошибку — занятие не должно попасть в журнал со следующей пачкой
+    journal.append(*lesson(student="Иванова Анна"), key="100:8")
+
+    assert [record["key"] for record in journal.pending()] == ["100:8"]
+    journal.close()
+
+
+def test_failing_record_is_retried_later_without_blocking_others(tmp_path):
+    journal = Journal(str(tmp_path / "journal.db"))
+    writer = DummyWriter(failing={"Петров Петр"})
+    replayer = JournalReplayer(journal, writer=writer, max_workers=1)
+    journal.append(*LESSON)
+    journal.append(*lesson(teacher="Второй Преподаватель", student="Иванова Анна"))
+
+    assert not replayer.replay_once()
+    # Повтор отложен: следующая пачка не содержит неудачную запись, новые идут сразу
+    journal.append(*lesson(student="Сидоров Иван"))
+    assert replayer.replay_once()
+    assert writer.calls[-1] == ("Тестовый Преподаватель", ["Сидоров Иван"])
+    assert 0 < journal.next_attempt_in() <= 1
+    replayer.stop()
+    journal.close()
+
+
+def test_later_lesson_for_same_cell_waits_for_retry(tmp_path):
+    journal = Journal(str(tmp_path / "journal.db"))
+    replayer = JournalReplayer(journal, writer=DummyWriter(failing={"Петров Петр"}), max_workers=1)
+    journal.append(*LESSON)
+    replayer.replay_once()
+
+    journal.append(*lesson(note="болел"))
+    assert journal.pending() == []
+    replayer.stop()
+    journal.close()
+
+
+def test_record_is_failed_after_last_attempt(tmp_path):
+    journal = Journal(str(tmp_path / "journal.db"))
+    failed = []
+    replayer = JournalReplayer(journal, writer=DummyWriter(failing={"Петров Петр"}), max_workers=1,
+                               max_backoff=0, max_attempts=3, on_failed=failed.append)
+    journal.append(*LESSON, key="100:7")
+
+    for _ in range(3):
+        replayer.replay_once()
+    stats = journal.stats()
+    assert stats.get("pending", 0) == 0 and stats["failed"] == 1
+    assert [record["key"] for record in failed] == ["100:7"]
+    replayer.stop()
+    journal.close()
+
+
+def test_wake_interrupts_backoff(tmp_path):
+    journal = Journal(str(tmp_path / "journal.db"))
+    writer = DummyWriter(failing={"Петров Петр"})
+    replayer = JournalReplayer(journal, writer=writer, max_workers=1, idle_interval=30, max_backoff=30)
+    journal.append(*LESSON)
+    journal.append(*lesson(student="Петров Петр", date="02.09.2025"))
+    replayer.start()
+    time.sleep(0.2)
+
+    journal.append(*lesson(student="Сидоров Иван"))
+    replayer.wake()
+    deadline = time.monotonic() + 2
+    while replayer.replayed == 0 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert replayer.replayed == 1
+    replayer.stop()
+    journal.close()
@@ -0,0 +1,69 @@
+import pytest
+
+from lesson_parser import FORMAT_HELP, LessonRecord, normalize_subject, parse_line, parse_message
+
+
+def test_line_with_note_becomes_record():
+    record, error = parse_line("  Иванова Анна 7 Физика /  хорошо подготовилась / молодец ", date="01.09.2025")
+
+    assert error == ""
+    assert record == LessonRecord("Иванова Анна", "7", "физика", "хорошо подготовилась / молодец", "01.09.2025")
+    assert record.key == "Иванова Анна 7 физика"
+    with pytest.raises(AttributeError):
+        record.extra = 1  # __slots__: у записи нет словаря атрибутов
+
+
+def test_class_is_written_without_leading_zero():
+    record, error = parse_line("Петров Петр 05 математика")
+
+    assert error == ""
+    assert record.key == "Петров Петр 5 математика"
+
+
+def test_subject_aliases_and_unknown_subjects():
+    assert normalize_subject("Русский язык") == "русский"
+    assert normalize_subject("англ") == "английский"
+    assert normalize_subject("матем") == "математика"
+    # Неизвестный предмет — первым словом, как его всегда записывал бот
+    assert normalize_subject("Шахматы доп") == "Шахматы"
+
+
+@pytest.mark.parametrize("line, error", [
+    ("Петров Петр 5", FORMAT_HELP),
+    ("Петров Петр пятый математика", "❌ Класс должен быть указан цифрой (например: 5, 7, 11)"),
+    ("Петров Петр 12 математика", "❌ Класс должен быть от 1 до 11 (например: 5, 7, 11)"),
+])
+def test_invalid_lines_are_rejected(line, error):
+    assert parse_line(line) == (None, error)
+
+
+def test_multi_line_message_keeps_line_numbers():
+    records, errors = parse_message("Петров Петр 5 математика\n\nСидоров Иван\nИванова Анна 7 рус яз / опоздала")
+
+    assert [(number, record.key, record.note) for number, record in records] == [
+        (1, "Петров Петр 5 математика", ""),
+        (3, "Иванова Анна 7 русский", "опоздала"),
+    ]
+    assert errors == [(2, "Сидоров Иван", FORMAT_HELP)]
+
+
+def test_note_continues_on_next_line_in_single_lesson():
+    records, errors = parse_message("Петров Петр 5 математика / хорошо\nподготовился на уроке\nсегодня")
+
+    assert [(number, record.key, record.note) for number, record in records] == [
+        (1, "Петров Петр 5 математика", "хорошо\nподготовился на уроке\nсегодня"),
+    ]
+    assert errors == []
+
+
+def test_note_does_not_swallow_lines_of_group_lesson():
+    records, errors = parse_message(
+        "Иванова Анна 7 математика / опоздала\nПетров Петр математика\nСидоров Иван 6 математика"
+    )
+
+    assert [(number, record.key, record.note) for number, record in records] == [
+        (1, "Иванова Анна 7 математика", "опоздала"),
+        (3, "Сидоров Иван 6 математика", ""),
+    ]
+    # Ошибочная строка группового занятия — ошибка, а не продолжение примечания
+    assert errors == [(2, "Петров Петр математика", FORMAT_HELP)]
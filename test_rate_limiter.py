@@ -0,0 +1,76 @@
+import time
+
+import pytest
+import requests
+from gspread.exceptions import APIError
+
+from fake_sheets import FakeClient, FakeResponse
+from rate_limiter import RateLimiter, TokenBucket, is_retryable
+
+
+def api_error(code, retry_after=None):
+    response = FakeResponse(code, "ошибка (fake)")
+    if retry_after is not None:
+        response.headers["Retry-After"] = str(retry_after)
+    return APIError(response)
+
+
+def test_token_bucket_allows_burst_then_waits():
+    bucket = TokenBucket(per_minute=600, burst=3)  # 10 токенов в секунду
+
+    assert [bucket.acquire() for _ in range(3)] == [0.0, 0.0, 0.0]
+    started = time.monotonic()
+    assert bucket.acquire() > 0
+    assert 0.05 < time.monotonic() - started < 0.5
+
+
+@pytest.mark.parametrize("error, read, write", [
+    (api_error(429), True, True),
+    (api_error(503), True, True),
+    (api_error(408), True, False),
+    (api_error(400), False, False),
+    (requests.exceptions.ConnectTimeout(), True, True),
+    (requests.exceptions.ReadTimeout(), True, False),
+    (requests.exceptions.ConnectionError(), True, False),
+    (ValueError(), False, False),
+])
+def test_writes_are_retried_only_when_not_applied(error, read, write):
+    assert is_retryable(error, "read") is read
+    assert is_retryable(error, "write") is write
+
+
+def test_retry_after_is_honoured():
+    limiter = RateLimiter(base_delay=30, max_delay=64)
+
+    assert limiter._backoff(0, api_error(429, retry_after=0.25)) == 0.25
+    assert limiter._backoff(0, api_error(429, retry_after=600)) == 64
+    assert 0 <= limiter._backoff(0, api_error(429)) <= 30
+
+
+def test_quota_errors_are_retried_and_counted():
+    limiter = RateLimiter(reads_per_minute=60000, writes_per_minute=60000, burst=100, base_delay=0.001)
+    client = FakeClient(error_rate=0.3, seed=7, limiter=limiter)
+    spreadsheet = client.create("limited")
+
+    for _ in range(50):
+        spreadsheet.worksheets()
+
+    stats = limiter.stats()
+    assert client.errors > 0
+    assert stats["retries"] == client.errors
+    assert stats["calls"] == client.total_calls() == 50 + client.errors
+    assert stats["failures"] == 0
+
+
+def test_failure_is_counted_after_last_retry():
+    limiter = RateLimiter(reads_per_minute=60000, writes_per_minute=60000, burst=100, max_retries=2,
+                          base_delay=0.001)
+    client = FakeClient(error_rate=1.0, limiter=limiter)
+    spreadsheet = client.create("limited")
+
+    with pytest.raises(APIError):
+        spreadsheet.batch_update({"requests": []})
+
+    assert client.calls["batch_update"] == 3
+    assert limiter.stats()["retries"] == 2
+    assert limiter.stats()["failures"] == 1
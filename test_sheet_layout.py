@@ -0,0 +1,101 @@
+from sheet_layout import DATE_ROW, FIRST_STUDENT_ROW, SheetLayout, student_key
+
+
+class DummyTeacherSheet:
+    def __init__(self, rows):
+        self.id = 1
+        self.rows = rows
+        self.reads = 0
+
+    def batch_get(self, ranges):
+        # Как Google: строка дат и колонка A с 8-й строки
+        self.reads += 1
+        assert ranges == [f"{DATE_ROW}:{DATE_ROW}", f"A{FIRST_STUDENT_ROW}:A"]
+        return [self.rows[DATE_ROW - 1:DATE_ROW], [row[:1] for row in self.rows[FIRST_STUDENT_ROW - 1:]]]
+
+
+def make_rows():
+    rows = [[""] * 5 for _ in range(6)]
+    rows.append(["Ученик", "", "01.09.2025", "02.09.2025", "3.9.2025"])  # 7-я строка
+    rows.append(["Петров Петр 5 математика", "", "да", "", ""])
+    rows.append(["", "", "", "", ""])
+    rows.append(["Иванова Анна 7 физика", "", "", "", ""])
+    return rows
+
+
+def test_lookups_use_single_download():
+    """Поиск даты и ученика не перечитывает лист"""
+    sheet = DummyTeacherSheet(make_rows())
+    layout = SheetLayout(sheet)
+
+    assert layout.date_column("02.09.2025") == 4
+    assert layout.date_column("03.09.2025") == 5  # дата в ячейке без ведущих нулей
+    assert layout.date_column("04.09.2025") is None
+    assert layout.student_row("Петров Петр 5 математика") == 8
+    assert layout.student_row("Иванова Анна 7 физика") == 10
+    assert sheet.reads == 1
+
+
+def test_reserve_row_fills_gaps_then_appends():
+    """Новые ученики занимают пустые строки, затем строки после последней"""
+    sheet = DummyTeacherSheet(make_rows())
+    layout = SheetLayout(sheet)
+
+    assert layout.reserve_row("Новый Ученик 3 химия") == 9
+    assert layout.reserve_row("Ещё Ученик 4 химия") == 11
+    assert layout.student_row("Новый Ученик 3 химия") == 9
+    assert sheet.reads == 1
+
+    layout.invalidate()
+    layout.student_row("Петров Петр 5 математика")
+    assert sheet.reads == 2
+
+
+def test_student_key():
+    assert student_key("Петров Петр", "5", "математика") == "Петров Петр 5 математика"
+    assert student_key("Петров Петр") == "Петров Петр"
+
+
+def test_calendar_mixed_formats_and_sharing():
+    """Календарь понимает разные форматы дат и общий для одинаковых строк дат"""
+    from datetime import date
+    from calendar_index import calendar_for
+
+    row = ["Ученик", "", "30.12.2025", "31.12", "01.01", "2026-01-02", "3/1/26", "46026"]
+    calendar = calendar_for(row)
+
+    assert calendar.column("30.12.2025") == 3
+    assert calendar.column("31.12.2025") == 4
+    assert calendar.column("01.01.2026") == 5
+    assert calendar.column("2.1.2026") == 6
+    assert calendar.column(date(2026, 1, 3)) == 7
+    assert calendar.column("04.01.2026") == 8  # серийный номер дня Google Sheets
+    assert calendar.column("05.01.2026") is None
+    assert calendar_for(row + ["", ""]) is calendar
+
+
+def test_layout_from_ranges_matches_loaded():
+    """Разметка из уже прочитанных диапазонов совпадает с загруженной с листа"""
+    rows = make_rows()
+    full = SheetLayout(DummyTeacherSheet(rows))
+    full.ensure_loaded()
+    ranged = SheetLayout(DummyTeacherSheet([]))
+    ranged.load_ranges(rows[6], [row[:1] for row in rows[7:]])
+
+    assert ranged.student_rows == full.student_rows
+    assert ranged.date_column("03.09.2025") == full.date_column("03.09.2025") == 5
+    assert ranged.reserve_row("Новый Ученик 2 чтение") == 9
+    assert ranged.reserve_row("Ещё Ученик 3 чтение") == 11
+
+
+def test_matches_ignores_reserved_rows_but_not_moved_names():
+    """Выданная, но ещё не записанная строка — не расхождение; сдвинутый ученик — расхождение"""
+    rows = make_rows()
+    layout = SheetLayout(DummyTeacherSheet(rows))
+    layout.ensure_loaded()
+    layout.reserve_row("Новый Ученик 2 чтение")
+    names = [row[:1] for row in rows[7:]]
+
+    assert layout.matches(rows[6], names)
+    assert not layout.matches(rows[6] + ["04.09.2025"], names)
+    assert not layout.matches(rows[6], [["Вставленный Ученик 4"]] + names)
@@ -0,0 +1,66 @@
+import time
+
+from student_index import StudentIndex, edit_distance, match_key, normalize_name
+
+
+def make_index():
+    index = StudentIndex()
+    for row, name in enumerate([
+        "Петров Пётр 5 математика",
+        "Петрова Анна 5 физика",
+        "Петрова Алла 5 физика",
+        "Сидоров Иван 7 химия",
+    ], start=8):
+        index.add(name, row)
+    return index
+
+
+def test_normalized_name_ignores_case_yo_and_spaces():
+    assert normalize_name("  Петров   ПЁТР 5 Математика ") == "петров петр 5 математика"
+    match = make_index().match("петров петр 5 Математика")
+    assert (match.status, match.row) == ("exact", 8)
+
+
+def test_subject_aliases_are_matched_on_both_sides():
+    assert match_key("Петров Пётр 5 англ") == match_key("петров петр 5 Английский язык") == "петров петр 5 английский"
+    assert match_key("Петров Петр 05 математика") == "петров петр 5 математика"
+    index = StudentIndex()
+    index.add("Петров Петр 5 мат", 8)
+    match = index.match("Петров Петр 5 математика")
+    assert (match.status, match.name, match.row) == ("exact", "Петров Петр 5 мат", 8)
+
+
+def test_single_typo_is_matched_and_close_names_are_ambiguous():
+    index = make_index()
+    close = index.match("Сидоров Иавн 7 химия")  # перестановка букв — одна правка
+    assert (close.status, close.name, close.row) == ("close", "Сидоров Иван 7 химия", 11)
+
+    ambiguous = index.match("Петрова Ана 5 физика")
+    assert ambiguous.status == "ambiguous"
+    assert ambiguous.candidates == ["Петрова Анна 5 физика", "Петрова Алла 5 физика"]
+
+    assert index.match("Кузнецов Олег 9 биология").status == "none"
+    assert index.match("Сидоров Иван 8 химия").status == "none"  # другой класс — новый ученик
+
+
+def test_edit_distance_stops_at_limit():
+    assert edit_distance("иван", "иавн", 2) == 1
+    assert edit_distance("петров", "сидоров", 2) == 3
+
+
+def test_match_is_fast_on_large_sheet():
+    index = StudentIndex()
+    last_names = ["Иванов", "Петров", "Сидоров", "Смирнов", "Кузнецов", "Попов", "Васильев", "Соколов", "Морозов"]
+    first_names = ["Иван", "Пётр", "Олег", "Дмитрий", "Артём", "Максим", "Кирилл", "Егор"]
+    row = 8
+    for last_name in last_names:
+        for first_name in first_names:
+            for student_class in range(1, 8):
+                index.add(f"{last_name} {first_name} {student_class} математика", row)
+                row += 1
+
+    started = time.perf_counter()
+    for _ in range(100):
+        match = index.match("Кузнецов Дмитрии 4 математика")
+    assert match.name == "Кузнецов Дмитрий 4 математика"
+    assert (time.perf_counter() - started) / 100 < 0.002
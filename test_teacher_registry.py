@@ -0,0 +1,81 @@
+from teacher_registry import TeacherRegistry, normalize_fio
+
+
+class DummyAdminSheet:
+    def __init__(self, rows):
+        self.rows = rows
+        self.reads = 0
+
+    def batch_get(self, ranges):
+        self.reads += 1
+        assert ranges == ["A4:H"]
+        return [self.rows[3:]]
+
+
+ADMIN_ROWS = [
+    ["Преподаватели"],
+    [],
+    ["ФИО", "Номер телефона", "Телеграмм id", "Username", "Предмет", "Классы", "Дата регистрации"],
+    ["Иванов Иван Иванович", "+79990000001", "111", "ivanov", "Математика", "средние", "01.09.2025"],
+    ["", "", "", "", "", "", ""],
+    ["Петрова  Анна Сергеевна", "+79990000002", "222", "", "Физика", "старшие", "02.09.2025"],
+]
+
+
+def make_registry(ttl=300):
+    sheet = DummyAdminSheet(ADMIN_ROWS)
+    return TeacherRegistry(loader=lambda: sheet, ttl=ttl), sheet
+
+
+def test_lookups_read_sheet_once():
+    """Повторные запросы не перечитывают лист"""
+    registry, sheet = make_registry()
+
+    assert registry.get_by_id(111)["ФИО"] == "Иванов Иван Иванович"
+    assert registry.get_by_id("222")["Телефон"] == "+79990000002"
+    assert registry.get_by_id(333) is None
+    assert registry.get_by_fio("петрова анна  сергеевна")["Предмет"] == "Физика"
+    assert sheet.reads == 1
+
+
+def test_add_and_invalidate():
+    """Новый преподаватель виден сразу, invalidate перечитывает лист"""
+    registry, sheet = make_registry()
+    registry.get_by_id(111)
+    registry.add({"ФИО": "Сидоров Пётр", "Telegram ID": "333"})
+
+    assert registry.get_by_id(333)["ФИО"] == "Сидоров Пётр"
+    assert sheet.reads == 1
+
+    registry.invalidate()
+    assert registry.get_by_id(333) is None
+    assert sheet.reads == 2
+
+
+def test_pending_teacher_is_not_replaced_by_namesake():
+    """Строка однофамильца с другим Telegram ID не считается строкой нового преподавателя"""
+    registry, sheet = make_registry()
+    registry.add({"ФИО": "Иванов Иван Иванович", "Telegram ID": "333"}, pending=True)
+
+    registry.refresh()
+    assert registry.is_pending("Иванов Иван Иванович")
+    assert registry.get_by_id("333")["Telegram ID"] == "333"
+    assert registry.has_row("Иванов Иван Иванович", 111)
+    assert not registry.has_row("Иванов Иван Иванович", 333)
+
+    sheet.rows = ADMIN_ROWS + [["Иванов Иван Иванович", "", "333"]]
+    registry.refresh()
+    assert not registry.is_pending("Иванов Иван Иванович")
+    assert registry.has_row("иванов  иван иванович", "333")
+
+
+def test_ttl_expiry():
+    """После истечения ttl индекс перечитывается"""
+    registry, sheet = make_registry(ttl=-1)
+    registry.get_by_id(111)
+    registry.get_by_id(111)
+    assert sheet.reads == 2
+
+
+def test_normalize_fio():
+    assert normalize_fio("  Иванов   Иван ") == "иванов иван"
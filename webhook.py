@@ -0,0 +1,75 @@
+import hmac
+from contextlib import asynccontextmanager
+
+from starlette.applications import Starlette
+from starlette.responses import PlainTextResponse, Response
+from starlette.routing import Route
+from telegram import Update
+
+from config import WEBHOOK_URL, WEBHOOK_PATH, WEBHOOK_SECRET
+from metrics import metrics
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+
+def create_app(application, secret=WEBHOOK_SECRET, path=WEBHOOK_PATH, webhook_url=WEBHOOK_URL):
+    """
+    ASGI-приложение для режима webhook.
+
+    Telegram присылает обновления POST-запросами на path. Запрос проверяется
+    по секретному заголовку, обновление кладётся в очередь application и
+    сразу подтверждается — обработка идёт в пуле обновлений бота. Без secret
+    приложение не создаётся: иначе любой, кто узнал адрес, мог бы прислать
+    поддельное обновление от имени преподавателя или администратора.
+    Метрики здесь не отдаются — порт публичный (см. start_metrics_server). При старте
+    регистрирует webhook в Telegram (если задан webhook_url) и выполняет
+    post_init/post_shutdown, которые иначе вызывает только run_polling.
+    """
+
+    if not secret:
+        raise ValueError("Для режима webhook нужен WEBHOOK_SECRET")
+
+    async def telegram_update(request):
+        if not hmac.compare_digest(request.headers.get(SECRET_HEADER, ""), secret):
+            metrics.inc("webhook_requests_total", status="forbidden")
+            return Response(status_code=403)
+        try:
+            data = await request.json()
+        except ValueError:
+            metrics.inc("webhook_requests_total", status="bad_request")
+            return Response(status_code=400)
+
+        await application.update_queue.put(Update.de_json(data, application.bot))
+        metrics.inc("webhook_requests_total", status="accepted")
+        return Response()
+
+    async def health(request):
+        return PlainTextResponse("ok")
+
+    @asynccontextmanager
+    async def lifespan(app):
+        async with application:
+            if application.post_init:
+                await application.post_init(application)
+            await application.start()
+            if webhook_url:
+                await application.bot.set_webhook(
+                    url=webhook_url.rstrip("/") + path,
+                    secret_token=secret,
+                    allowed_updates=Update.ALL_TYPES,
+                )
+                print(f"Webhook установлен: {webhook_url.rstrip('/')}{path}")
+            try:
+                yield
+            finally:
+                await application.stop()
+                if application.post_shutdown:
+                    await application.post_shutdown(application)
+
+    return Starlette(
+        routes=[
+            Route(path, telegram_update, methods=["POST"]),
+            Route("/healthz", health),
+        ],
+        lifespan=lifespan,
+    )
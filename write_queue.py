@@ -0,0 +1,219 @@
+import threading
+import time
+from concurrent.futures import Future
+from config import WRITE_FLUSH_INTERVAL_MS, WRITE_BATCH_MAX_OPS
+from metrics import metrics
+
+
+class _Op:
+    """Одна отложенная операция: значения диапазона и, при необходимости, цвет фона"""
+
+    __slots__ = ("sheet", "row", "col", "values", "color", "future")
+
+    def __init__(self, sheet, row, col, values, color):
+        self.sheet = sheet
+        self.row = row
+        self.col = col
+        self.values = values
+        self.color = color
+        self.future = Future()
+
+
+def _cell_data(value, color=None):
+    """CellData для updateCells: значение и, если нужно, цвет фона"""
+    cell = {}
+    if isinstance(value, bool):
+        cell["userEnteredValue"] = {"boolValue": value}
+    elif isinstance(value, (int, float)):
+        cell["userEnteredValue"] = {"numberValue": value}
+    elif value != "" and value is not None:
+        cell["userEnteredValue"] = {"stringValue": str(value)}
+    if color is not None:
+        cell["userEnteredFormat"] = {"backgroundColor": color}
+    return cell
+
+
+def _rows_data(values, color=None):
+    return [{"values": [_cell_data(value, color) for value in row_values]} for row_values in values]
+
+
+def update_cells_request(sheet, row, col, values, color=None, sheet_id=None):
+    """
+    Запрос updateCells, который пишет прямоугольник значений с ячейки (row, col).
+
+    Если передан color, он ставится фоном всех ячеек в том же запросе, так что
+    значение и цвет записываются за одно обращение. Пустые строки очищают ячейку.
+    sheet_id нужен для листа, которого ещё нет (создаётся в том же batchUpdate).
+    """
+    fields = "userEnteredValue"
+    if color is not None:
+        fields += ",userEnteredFormat.backgroundColor"
+    return {
+        "updateCells": {
+            "start": {
+                "sheetId": sheet.id if sheet_id is None else sheet_id,
+                "rowIndex": row - 1,
+                "columnIndex": col - 1,
+            },
+            "rows": _rows_data(values, color),
+            "fields": fields,
+        }
+    }
+
+
+def append_cells_request(sheet, values):
+    """Запрос appendCells: строки дописываются после последней заполненной строки листа"""
+    return {
+        "appendCells": {
+            "sheetId": sheet.id,
+            "rows": _rows_data(values),
+            "fields": "userEnteredValue",
+        }
+    }
+
+
+class WriteQueue:
+    """
+    Очередь отложенной записи в Google Sheets.
+
+    Значения и цвета ячеек копятся в памяти и уходят одной пачкой на таблицу:
+    один spreadsheets.batchUpdate, где каждая ячейка — запрос updateCells со
+    значением и цветом сразу. Пачка отправляется через flush_interval_ms после первой операции
+    или сразу, как только набралось max_ops операций. Каждая операция
+    возвращает Future, который завершается, когда её пачка записана, — по нему
+    бот и отвечает преподавателю.
+    """
+
+    def __init__(self, flush_interval_ms=WRITE_FLUSH_INTERVAL_MS, max_ops=WRITE_BATCH_MAX_OPS):
+        self.flush_interval = flush_interval_ms / 1000
+        self.max_ops = max_ops
+        self._cond = threading.Condition()
+        # Пачка, уже взятая фоновым потоком, и flush() не отправляются одновременно
+        self._commit_lock = threading.Lock()
+        self._pending = []
+        self._first_at = None
+        self._thread = None
+        self._closing = False
+        self.batches = 0
+        self.ops = 0
+        self.max_batch_size = 0
+        self.flush_seconds_total = 0.0
+        self.flush_seconds_max = 0.0
+
+    def submit_cell(self, sheet, row, col, value, color=None):
+        """Ставит в очередь значение ячейки и её цвет фона"""
+        return self._submit(_Op(sheet, row, col, [[value]], color))
+
+    def submit_many(self, items):
+        """
+        Ставит в очередь сразу несколько операций (sheet, row, col, values, color).
+
+        Операции добавляются атомарно и поэтому попадают в одну пачку.
+        Возвращает список Future в том же порядке.
+        """
+        ops = [_Op(sheet, row, col, values, color) for sheet, row, col, values, color in items]
+        if ops:
+            self._submit(*ops)
+        return [op.future for op in ops]
+
+    def _submit(self, *ops):
+        with self._cond:
+            if self._closing:
+                raise RuntimeError("Очередь записи остановлена")
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="sheets-writer", daemon=True)
+                self._thread.start()
+            if not self._pending:
+                self._first_at = time.monotonic()
+            self._pending.extend(ops)
+            self._cond.notify()
+        return ops[0].future
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._pending and not self._closing:
+                    self._cond.wait()
+                if not self._pending:
+                    return
+                deadline = self._first_at + self.flush_interval
+                while len(self._pending) < self.max_ops and not self._closing:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+            with self._commit_lock:
+                with self._cond:
+                    batch, self._pending = self._pending, []
+                if batch:
+                    self._commit(batch)
+
+    def _commit(self, batch):
+        started = time.monotonic()
+        by_spreadsheet = {}
+        for op in batch:
+            by_spreadsheet.setdefault(op.sheet.spreadsheet_id, []).append(op)
+
+        for ops in by_spreadsheet.values():
+            try:
+                self._write(ops)
+            except Exception as e:
+                print(f"Ошибка пакетной записи ({len(ops)} операций): {e}")
+                for op in ops:
+                    op.future.set_exception(e)
+            else:
+                for op in ops:
+                    op.future.set_result(True)
+
+        elapsed = time.monotonic() - started
+        with self._cond:
+            self.batches += 1
+            self.ops += len(batch)
+            self.max_batch_size = max(self.max_batch_size, len(batch))
+            self.flush_seconds_total += elapsed
+            self.flush_seconds_max = max(self.flush_seconds_max, elapsed)
+
+    def _write(self, ops):
+        spreadsheet = ops[0].sheet.spreadsheet
+        requests = [update_cells_request(op.sheet, op.row, op.col, op.values, op.color) for op in ops]
+        spreadsheet.batch_update({"requests": requests})
+
+    def flush(self):
+        """
+        Немедленно отправляет всё, что накопилось (в текущем потоке).
+
+        Если фоновый поток как раз пишет пачку, сначала дожидается её: после
+        возврата все операции, поставленные до вызова, уже в таблице.
+        """
+        with self._commit_lock:
+            with self._cond:
+                batch, self._pending = self._pending, []
+            if batch:
+                self._commit(batch)
+
+    def close(self):
+        """Дописывает очередь и останавливает фоновый поток"""
+        with self._cond:
+            self._closing = True
+            self._cond.notify_all()
+            thread = self._thread
+        if thread is not None:
+            thread.join()
+        self.flush()
+
+    def stats(self):
+        """Размер пачек и время записи для диагностики"""
+        with self._cond:
+            return {
+                "pending": len(self._pending),
+                "batches": self.batches,
+                "ops": self.ops,
+                "avg_batch_size": round(self.ops / self.batches, 2) if self.batches else 0,
+                "max_batch_size": self.max_batch_size,
+                "avg_flush_ms": round(self.flush_seconds_total / self.batches * 1000, 1) if self.batches else 0,
+                "max_flush_ms": round(self.flush_seconds_max * 1000, 1),
+            }
+
+
+write_queue = WriteQueue()
+metrics.register_collector("sheets_write_queue", write_queue.stats)